@@ -0,0 +1,380 @@
+"""
+ASGI twin of app.main, serving the same routes from one event loop.
+
+Only the webhook calls themselves, the greetings and the admin pages are async:
+they run on the loop with AsyncApi and async SQLAlchemy sessions. The message
+flows are not async. They are the synchronous flows of app.main, with the
+requests based Api and blocking sessions, run on the per-user lanes of the
+EventScheduler. The loop awaits them without blocking, but message throughput
+is bounded by the lanes just as in the Flask app, see
+benchmarks/webhook_load.py.
+
+This app is therefore not the way to serve more messages: it only helps with
+greetings and many slow webhook connections. Message throughput scales with
+FLOW_WORKERS and with more gunicorn workers of the Flask app, which the
+Procfile runs, until the flows are ported to AsyncApi and async sessions.
+
+    uvicorn --factory app.asgi:create_app
+"""
+
+import asyncio
+import os
+from datetime import timedelta
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import aliased
+
+from app.create_postgre_session import get_engine, get_session_factory
+from app.data_models import Answer, ChatBotUser, Question
+from app.event_processing import (
+    EventScheduler,
+    PartiallyAppliedError,
+    PostgresAdvisoryLock,
+    fail_as_partially_applied,
+)
+from app.flow_manager import FlowManager
+from app.flows.flow_ask_question import RESPONDER_SCHEDULERS
+from app.leader_election import LeaderElectedJobs, SqlLease
+from app.message_dedup import AsyncSqlDedupStore
+from app.timeouts import run_timeouts_tick
+
+from viberbot import Api, AsyncApi
+from viberbot.api.bot_configuration import BotConfiguration
+from viberbot.api.circuit_breaker import CircuitBreaker
+from viberbot.api.event_type import EventType
+from viberbot.api.messages.text_message import TextMessage
+from viberbot.api.ordered_dispatcher import DispatcherFullError
+from viberbot.api.rate_limiter import RateLimiter
+from viberbot.api.viber_requests import ViberConversationStartedRequest
+from viberbot.api.viber_requests import ViberFailedRequest
+from viberbot.api.viber_requests import ViberMessageRequest
+from viberbot.api.viber_requests import ViberSubscribedRequest
+
+from logger import logger
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+FOXBOT_FACE_PATH = os.path.join(APP_DIR, "static/images/resized_foxbot_image.png")
+
+
+def async_database_url(database_url):
+    """
+    Maps a postgres url of the sync engine to the asyncpg driver.
+    """
+    for prefix in ("postgres://", "postgresql://", "postgresql+psycopg2://"):
+        if database_url.startswith(prefix):
+            return "postgresql+asyncpg://" + database_url[len(prefix) :]
+    return database_url
+
+
+def model_rows(session, model):
+    mapper = inspect(model)
+    return [
+        {key: getattr(instance, key) for key in mapper.attrs.keys()}
+        for instance in session.query(model).all()
+    ]
+
+
+def q_and_a_rows(session):
+    question_user_alias = aliased(ChatBotUser)
+    answer_user_alias = aliased(ChatBotUser)
+    questions_and_answers = (
+        session.query(Question, Answer, question_user_alias, answer_user_alias)
+        .join(Answer, Question.question_id == Answer.question_id)
+        .join(question_user_alias, Question.user_id == question_user_alias.user_id)
+        .join(answer_user_alias, Answer.user_id == answer_user_alias.user_id)
+        .filter(Answer.approved == True)
+        .all()
+    )
+    return [
+        {
+            "question_user_name": question_user.name,
+            "question_text": question.question_text,
+            "answer_user_name": answer_user.name,
+            "answer_text": answer.answer_text,
+        }
+        for question, answer, question_user, answer_user in questions_and_answers
+    ]
+
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+async def respond(send, status, body=b"", content_type=b"text/plain; charset=utf-8"):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type),
+                (b"content-length", str(len(body)).encode("ascii")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class AsgiApp:
+    """
+    :param viber: AsyncApi verifying, parsing and answering webhook events
+    :param session_factory: async_sessionmaker of the admin pages
+    :param event_scheduler: EventScheduler running the message flows
+    :param dedup_store: store with coroutine claim and release, such as AsyncSqlDedupStore
+    :param ack_first: answer the webhook before the message flow has run
+    :param engine: Optional. AsyncEngine disposed on shutdown
+    :param background_jobs: Optional. LeaderElectedJobs run from startup to shutdown
+    :param flow_viber: Optional. Sync Api of the message flows, closed on shutdown
+    """
+
+    def __init__(
+        self,
+        viber,
+        session_factory,
+        event_scheduler,
+        dedup_store,
+        ack_first=False,
+        engine=None,
+        background_jobs=None,
+        flow_viber=None,
+    ):
+        self.viber = viber
+        self.session_factory = session_factory
+        self.event_scheduler = event_scheduler
+        self.dedup_store = dedup_store
+        self.ack_first = ack_first
+        self.engine = engine
+        self.background_jobs = background_jobs
+        self.flow_viber = flow_viber
+        self.templates = Environment(
+            loader=FileSystemLoader(os.path.join(APP_DIR, "templates")),
+            autoescape=select_autoescape(),
+        )
+        self._foxbot_face = None
+        self._routes = {
+            ("GET", "/"): self.hello_world,
+            ("GET", "/chatbot_users"): self.display_chat_bot_users,
+            ("GET", "/questions"): self.display_questions,
+            ("GET", "/answers"): self.display_answers,
+            ("GET", "/q_and_a"): self.display_q_and_a,
+            ("GET", "/foxbot_face"): self.show_foxbot_face,
+            ("POST", "/"): self.incoming,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        route = self._routes.get((scope["method"], scope["path"]))
+        if route is not None:
+            await route(scope, receive, send)
+        elif any(path == scope["path"] for _, path in self._routes):
+            await respond(send, 405)
+        else:
+            await respond(send, 404)
+
+    async def close(self):
+        if self.background_jobs is not None:
+            await asyncio.to_thread(self.background_jobs.stop)
+        await asyncio.to_thread(self.event_scheduler.close)
+        if self.flow_viber is not None:
+            await asyncio.to_thread(self.flow_viber.close)
+        await self.viber.close()
+        if self.engine is not None:
+            await self.engine.dispose()
+
+    async def hello_world(self, scope, receive, send):
+        logger.debug("called hello world")
+        await self._render(send, "index_template.html")
+
+    async def display_chat_bot_users(self, scope, receive, send):
+        await self._render_rows(send, model_rows, ChatBotUser)
+
+    async def display_questions(self, scope, receive, send):
+        await self._render_rows(send, model_rows, Question)
+
+    async def display_answers(self, scope, receive, send):
+        await self._render_rows(send, model_rows, Answer)
+
+    async def display_q_and_a(self, scope, receive, send):
+        await self._render_rows(send, q_and_a_rows)
+
+    async def show_foxbot_face(self, scope, receive, send):
+        if self._foxbot_face is None:
+            with open(FOXBOT_FACE_PATH, "rb") as face:
+                self._foxbot_face = face.read()
+        await respond(send, 200, self._foxbot_face, b"image/png")
+
+    async def incoming(self, scope, receive, send):
+        body = await read_body(receive)
+        signature = dict(scope["headers"]).get(b"x-viber-content-signature")
+        if not self.viber.verify_signature(body, signature):
+            logger.warning("rejecting webhook call with invalid signature")
+            await respond(send, 403)
+            return
+
+        viber_request = self.viber.parse_request(body, lazy=True)
+        if isinstance(viber_request, ViberMessageRequest):
+            if not await self.dedup_store.claim(viber_request.message_token):
+                logger.debug(
+                    f"skipping redelivered message_token {viber_request.message_token}"
+                )
+            elif not await self._run_flow(viber_request):
+                await respond(send, 503 if self.ack_first else 500)
+                return
+        elif isinstance(
+            viber_request, (ViberConversationStartedRequest, ViberSubscribedRequest)
+        ):
+            await self.viber.send_messages(
+                viber_request.user.id,
+                [TextMessage(None, None, viber_request.event_type)],
+            )
+        elif isinstance(viber_request, ViberFailedRequest):
+            logger.warning(f"client failed receiving message. failure: {viber_request}")
+
+        await respond(send, 200)
+
+    async def _run_flow(self, viber_request):
+        try:
+            future = self.event_scheduler.submit(viber_request)
+        except DispatcherFullError:
+            # Viber redelivers events answered with an error
+            await self.dedup_store.release(viber_request.message_token)
+            return False
+        if self.ack_first:
+            # Viber gets its 200 now and will not redeliver the event
+            future.add_done_callback(
+                lambda done: EventScheduler.log_lost_event(viber_request, done)
+            )
+            return True
+        try:
+            await asyncio.wrap_future(future)
+        except PartiallyAppliedError:
+            # the redelivered event is skipped, its flow committed part of its work
+            return False
+        except Exception:
+            # answered with an error, Viber redelivers the event
+            await self.dedup_store.release(viber_request.message_token)
+            return False
+        return True
+
+    async def _render(self, send, template, **context):
+        html = self.templates.get_template(template).render(**context)
+        await respond(send, 200, html.encode("utf-8"), b"text/html; charset=utf-8")
+
+    async def _render_rows(self, send, rows, *args):
+        async with self.session_factory() as session:
+            # the row builders are shared with the sync pages and may lazy load relationships
+            json_data = await session.run_sync(rows, *args)
+        await self._render(send, "json_template.html", json_data=json_data)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.background_jobs is not None:
+                    self.background_jobs.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_app():
+    async_engine = create_async_engine(
+        async_database_url(os.environ["DATABASE_URL_2"])
+    )
+    bot_configuration = BotConfiguration(
+        name="FoxBot",
+        avatar="https://viber-fox-bot-9d12996926ae.herokuapp.com/foxbot_face",
+        auth_token=os.environ["VIBER_AUTH_KEY"],
+    )
+    # both clients share one send budget and one view of the Viber API health
+    rate_limiter = RateLimiter(rate=50, per_receiver_rate=5)
+    circuit_breaker = CircuitBreaker(slow_call_duration=5, open_timeout=30)
+    viber = AsyncApi(
+        bot_configuration,
+        rate_limiter=rate_limiter,
+        circuit_breaker=circuit_breaker,
+        subscribed_events=[
+            EventType.MESSAGE,
+            EventType.CONVERSATION_STARTED,
+            EventType.SUBSCRIBED,
+            EventType.UNSUBSCRIBED,
+            EventType.FAILED,
+        ],
+    )
+    # the flows are synchronous and send with the requests based client from the lanes
+    flow_viber = Api(
+        bot_configuration, rate_limiter=rate_limiter, circuit_breaker=circuit_breaker
+    )
+
+    responder_scheduler = RESPONDER_SCHEDULERS[
+        os.environ.get("RESPONDER_STRATEGY", "least_recently_assigned")
+    ](
+        max_open_conversations=int(
+            os.environ.get("RESPONDER_MAX_OPEN_CONVERSATIONS", "1")
+        )
+    )
+
+    def process_message(viber_request):
+        session = get_session_factory()()
+        try:
+            with fail_as_partially_applied(session):
+                FlowManager(
+                    session, flow_viber, viber_request, responder_scheduler
+                ).execute_flow()
+        finally:
+            session.close()
+
+    ack_first = os.environ.get("WEBHOOK_ACK_FIRST") == "1"
+    event_scheduler = EventScheduler(
+        process_message,
+        lanes=int(os.environ.get("FLOW_WORKERS", "8")),
+        max_pending=int(os.environ.get("FLOW_QUEUE_SIZE", "1000")),
+        user_lock=(
+            PostgresAdvisoryLock(get_engine())
+            if os.environ.get("USER_EVENT_LOCKS") == "advisory"
+            else None
+        ),
+        # Viber only redelivers failed events the webhook waited for
+        attempts=int(os.environ.get("FLOW_ATTEMPTS", "3")) if ack_first else 1,
+        retry_delay=float(os.environ.get("FLOW_RETRY_SECONDS", "1")),
+    )
+    # every worker competes for the lease of the periodic jobs, one of them runs them
+    background_jobs = LeaderElectedJobs(
+        SqlLease(
+            get_session_factory(),
+            "background_jobs",
+            timedelta(seconds=float(os.environ.get("LEADER_LEASE_SECONDS", "30"))),
+        ),
+        jobs={
+            "timeouts": (
+                float(os.environ.get("TIMEOUT_TICK_SECONDS", "60")),
+                lambda holds_lease: run_timeouts_tick(
+                    get_session_factory(),
+                    flow_viber,
+                    responder_scheduler,
+                    holds_lease=holds_lease,
+                ),
+            )
+        },
+    )
+    session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+    return AsgiApp(
+        viber,
+        session_factory,
+        event_scheduler,
+        AsyncSqlDedupStore(session_factory),
+        ack_first=ack_first,
+        engine=async_engine,
+        background_jobs=background_jobs,
+        flow_viber=flow_viber,
+    )
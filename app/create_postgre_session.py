@@ -1,4 +1,6 @@
 import os
+from functools import lru_cache
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -6,7 +8,14 @@ load_dotenv()
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-# Create the SQLAlchemy engine
-engine = create_engine(os.environ["DATABASE_URL_2"])
 
-Session = sessionmaker(bind=engine)
+# The engine is created on first use, in the process that uses it, so importing this
+# module reads no configuration and forked workers never share pooled connections
+@lru_cache(maxsize=None)
+def get_engine():
+    return create_engine(os.environ["DATABASE_URL_2"])
+
+
+@lru_cache(maxsize=None)
+def get_session_factory():
+    return sessionmaker(bind=get_engine())
@@ -1,11 +1,50 @@
-from app.data_models import Base
-from create_postgre_session import engine
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from app.data_models import Base, recount_open_conversations
+from app.create_postgre_session import get_engine
+
+
+def add_missing_columns(engine):
+    """
+    Adds columns declared on the models but missing from existing tables, with their
+    server defaults.
+    """
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = (
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                    f"{column.type.compile(engine.dialect)}"
+                )
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg.text}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                connection.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+    return added
 
 
 def create_tables(engine):
     Base.metadata.create_all(engine)
+    added = add_missing_columns(engine)
+    # create_all skips tables that exist, indexes added to them later are created here
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    if "chat_bot_users.open_conversations" in added:
+        with Session(engine) as session:
+            recount_open_conversations(session)
 
 
 if __name__ == "__main__":
 
-    create_tables(engine)
+    create_tables(get_engine())
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from datetime import datetime, timedelta
 
 
 @dataclass
@@ -39,3 +40,22 @@ class ConversationStatus:
     pending: str = "pending"
     waiting_for_approval: str = "waiting_for_approval"
     closed: str = "closed"
+
+
+@dataclass(frozen=True)
+class TimeoutPolicy:
+    responder_reminder_after: timedelta = timedelta(hours=2)
+    # reminders sent to a silent responder before the question is reassigned
+    responder_reminders: int = 2
+    approval_reminder_after: timedelta = timedelta(hours=24)
+    approval_reminders: int = 1
+
+    def deadline_for(self, status: str, now: datetime):
+        if status == ConversationStatus.active:
+            return now + self.responder_reminder_after
+        if status == ConversationStatus.waiting_for_approval:
+            return now + self.approval_reminder_after
+        return None
+
+
+DEFAULT_TIMEOUT_POLICY = TimeoutPolicy()
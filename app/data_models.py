@@ -1,5 +1,5 @@
 from datetime import datetime
-from logger import logger
+from app.data_classes import DEFAULT_TIMEOUT_POLICY
 import os
 from typing import List
 
@@ -12,8 +12,12 @@ from sqlalchemy import (
     Boolean,
     DateTime,
     ForeignKey,
+    Index,
+    func,
+    or_,
     select,
-    union_all,
+    text,
+    update,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import declarative_base
@@ -34,6 +38,16 @@ class ChatBotUser(Base):
     viber_id = Column(String)
     created_at = Column(DateTime)
     active = Column(Boolean)
+    # responder load, maintained on assignment and release of conversations
+    open_conversations = Column(Integer, nullable=False, server_default=text("0"))
+    last_assigned_at = Column(
+        DateTime, nullable=False, server_default=text("'1970-01-01 00:00:00'")
+    )
+
+    __table_args__ = (
+        Index("ix_chat_bot_users_open_conversations", "open_conversations", "user_id"),
+        Index("ix_chat_bot_users_last_assigned_at", "last_assigned_at", "user_id"),
+    )
 
 
 # Define the Question table
@@ -82,6 +96,13 @@ class Conversation(Base):
     created_at = Column(DateTime)
     updated_at = Column(DateTime)
     status = Column(String)  # e.g., "pending", "answered", "closed"
+    # responder whose answer was rejected, not given the conversation again
+    previous_responder_user_id = Column(
+        Integer, ForeignKey("chat_bot_users.user_id"), nullable=True
+    )
+    # next reminder or reassignment, set from the status by DEFAULT_TIMEOUT_POLICY
+    deadline = Column(DateTime, nullable=True)
+    reminders_sent = Column(Integer, nullable=False, server_default=text("0"))
 
     # Relationships
     question = relationship("Question")
@@ -91,6 +112,31 @@ class Conversation(Base):
         "Answer", back_populates="conversation"
     )  # Relationship to the Answer
 
+    # serve the per-user lookups of open conversations, such as get_free_responder
+    __table_args__ = (
+        Index("ix_conversations_status_asker", "status", "asker_user_id"),
+        Index("ix_conversations_status_responder", "status", "responder_user_id"),
+        # pending conversations in arrival order
+        Index("ix_conversations_status_id", "status", "conversation_id"),
+        # conversations whose timeout is due
+        Index("ix_conversations_deadline", "deadline"),
+    )
+
+
+class ProcessedMessage(Base):
+    __tablename__ = "processed_messages"
+
+    message_token = Column(String, primary_key=True)
+    processed_at = Column(DateTime, nullable=False, index=True)
+
+
+class SchedulerLease(Base):
+    __tablename__ = "scheduler_leases"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
 
 def create_user(session, name, viber_id, active=True):
     user = ChatBotUser(
@@ -311,9 +357,14 @@ def update_conversation(
             conversation.answer_id = answer_id
         if status is not None:
             conversation.status = status
+            conversation.deadline = DEFAULT_TIMEOUT_POLICY.deadline_for(
+                status, datetime.now()
+            )
+            conversation.reminders_sent = 0
         if updated_at is not None:
             conversation.updated_at = updated_at
         if reset_responder_and_answer:
+            conversation.previous_responder_user_id = conversation.responder_user_id
             conversation.responder_user_id = None
             conversation.answer_id = None
         else:
@@ -341,38 +392,172 @@ def get_conversation_by_id(session, conversation_id) -> Conversation:
     return conversation
 
 
-def get_users_not_in_active_pending_conversations(session) -> List[ChatBotUser]:
+def open_conversation_exists(role_column, user_id_column, statuses):
     """
-    Query to find users not involved as asker or responder in active or pending conversations.
+    EXISTS clause for a conversation in one of statuses where role_column, asker_user_id
+    or responder_user_id, is the given user. Served by the (status, <role>) indexes.
     """
+    return (
+        select(Conversation.conversation_id)
+        .where(Conversation.status.in_(statuses))
+        .where(role_column == user_id_column)
+        .exists()
+    )
+
 
-    # Ensure that only non-None asker and responder IDs are selected
-    asker_ids = (
-        select(Conversation.asker_user_id.label("user_id"))
-        .where(Conversation.asker_user_id.isnot(None))
-        .where(Conversation.status.in_(["active", "pending"]))
+def free_responders_query(session, exclude_user_ids=(), max_open_conversations=1):
+    """
+    Query of the users that can take a question: responders of fewer than
+    max_open_conversations conversations, not waiting for an answer as askers and
+    not in exclude_user_ids. Order and limit are left to the caller.
+    """
+    query = session.query(ChatBotUser).filter(
+        ChatBotUser.open_conversations < max_open_conversations,
+        ~open_conversation_exists(
+            Conversation.asker_user_id, ChatBotUser.user_id, ["active", "pending"]
+        ),
     )
+    exclude_user_ids = [user_id for user_id in exclude_user_ids if user_id is not None]
+    if exclude_user_ids:
+        query = query.filter(ChatBotUser.user_id.notin_(exclude_user_ids))
+    return query
 
-    responder_ids = (
-        select(Conversation.responder_user_id.label("user_id"))
-        .where(Conversation.responder_user_id.isnot(None))
-        .where(Conversation.status.in_(["active", "pending"]))
+
+def record_responder_assigned(session, user_id: int, assigned_at: datetime = None):
+    """
+    Counts a conversation assigned to the responder, in one UPDATE so concurrent
+    assignments never lose an increment.
+    """
+    session.execute(
+        update(ChatBotUser)
+        .where(ChatBotUser.user_id == user_id)
+        .values(
+            open_conversations=ChatBotUser.open_conversations + 1,
+            last_assigned_at=assigned_at or datetime.now(),
+        )
     )
+    session.commit()
 
-    # Combine the two sets of IDs with UNION ALL
-    combined_ids = union_all(asker_ids, responder_ids).subquery()
 
-    # Use the combined IDs in a NOT IN filter to find users not involved in those conversations
-    users_not_involved = (
-        session.query(ChatBotUser)
-        .filter(~ChatBotUser.user_id.in_(select(combined_ids.c.user_id)))
+def record_responder_released(session, user_id: int):
+    """
+    Uncounts a conversation of the responder that was closed or taken back.
+    """
+    session.execute(
+        update(ChatBotUser)
+        .where(ChatBotUser.user_id == user_id, ChatBotUser.open_conversations > 0)
+        .values(open_conversations=ChatBotUser.open_conversations - 1)
+    )
+    session.commit()
+
+
+def next_pending_conversation(session, responder_user_id) -> Conversation:
+    """
+    Returns the oldest pending conversation the responder can take, walking the
+    (status, conversation_id) index from its head, or None.
+    """
+    return (
+        session.query(Conversation)
+        .filter(Conversation.status == "pending")
+        .filter(Conversation.asker_user_id != responder_user_id)
+        .filter(
+            or_(
+                Conversation.previous_responder_user_id.is_(None),
+                Conversation.previous_responder_user_id != responder_user_id,
+            )
+        )
+        .order_by(Conversation.conversation_id)
+        .limit(1)
+        .one_or_none()
+    )
+
+
+def claim_pending_conversation(session, conversation_id, responder_user_id) -> bool:
+    """
+    Makes a pending conversation active with the responder, unless another process
+    assigned it first.
+    """
+    now = datetime.now()
+    claimed = session.execute(
+        update(Conversation)
+        .where(
+            Conversation.conversation_id == conversation_id,
+            Conversation.status == "pending",
+        )
+        .values(
+            status="active",
+            responder_user_id=responder_user_id,
+            answer_id=None,
+            updated_at=now,
+            deadline=DEFAULT_TIMEOUT_POLICY.deadline_for("active", now),
+            reminders_sent=0,
+        )
+    ).rowcount
+    session.commit()
+    return claimed == 1
+
+
+def rearm_conversation_deadline(session, conversation_id):
+    """
+    Restarts the timeout of a conversation after activity in it.
+    """
+    conversation = session.get(Conversation, conversation_id)
+    if conversation:
+        conversation.deadline = DEFAULT_TIMEOUT_POLICY.deadline_for(
+            conversation.status, datetime.now()
+        )
+        conversation.reminders_sent = 0
+        session.commit()
+    return conversation
+
+
+def get_due_conversations(session, now: datetime, limit: int) -> List[Conversation]:
+    """
+    Returns up to limit conversations whose deadline has passed, earliest first,
+    read from the deadline index so the cost follows the number of due ones.
+    """
+    return (
+        session.query(Conversation)
+        .filter(Conversation.deadline <= now)
+        .order_by(Conversation.deadline)
+        .limit(limit)
         .all()
     )
 
-    # Debug logging
-    logger.debug(f"Users not involved: {[user.user_id for user in users_not_involved]}")
 
-    return users_not_involved
+def claim_due_conversation(
+    session, conversation: Conversation, next_deadline, reminders_sent: int
+) -> bool:
+    """
+    Moves the deadline of a due conversation on, unless another process or new
+    activity in the conversation changed it first.
+    """
+    claimed = session.execute(
+        update(Conversation)
+        .where(
+            Conversation.conversation_id == conversation.conversation_id,
+            Conversation.deadline == conversation.deadline,
+            Conversation.reminders_sent == conversation.reminders_sent,
+        )
+        .values(deadline=next_deadline, reminders_sent=reminders_sent)
+    ).rowcount
+    session.commit()
+    return claimed == 1
+
+
+def recount_open_conversations(session):
+    """
+    Rebuilds open_conversations from the conversations table, for existing data.
+    """
+    session.execute(
+        update(ChatBotUser).values(
+            open_conversations=select(func.count(Conversation.conversation_id))
+            .where(Conversation.responder_user_id == ChatBotUser.user_id)
+            .where(Conversation.status != "closed")
+            .scalar_subquery()
+        )
+    )
+    session.commit()
 
 
 # Assuming the Conversation class is defined elsewhere
@@ -403,6 +588,7 @@ def create_new_conversation(
         created_at=datetime.now(),
         updated_at=datetime.now(),
         status=status,
+        deadline=DEFAULT_TIMEOUT_POLICY.deadline_for(status, datetime.now()),
     )
     session.add(new_conversation)
     session.commit()
@@ -0,0 +1,194 @@
+import time
+import zlib
+from contextlib import contextmanager
+
+from sqlalchemy import event, text
+
+from viberbot.api.ordered_dispatcher import OrderedDispatcher
+from viberbot.api.viber_requests import (
+    ViberConversationStartedRequest,
+    ViberFailedRequest,
+    ViberMessageRequest,
+    ViberSubscribedRequest,
+    ViberUnsubscribedRequest,
+)
+
+from logger import logger
+
+# first key of the two-key advisory locks, keeps them apart from other advisory locks
+USER_LOCK_NAMESPACE = 0x7669
+
+
+def event_user_id(viber_request):
+    """
+    Returns the viber id of the user an event belongs to, or None for events without one.
+    """
+    if isinstance(viber_request, ViberMessageRequest):
+        return viber_request.sender.id
+    if isinstance(
+        viber_request,
+        (ViberConversationStartedRequest, ViberSubscribedRequest),
+    ):
+        return viber_request.user.id
+    if isinstance(viber_request, (ViberUnsubscribedRequest, ViberFailedRequest)):
+        return viber_request.user_id
+    return None
+
+
+class PartiallyAppliedError(Exception):
+    """
+    An event failed after its flow committed part of its work, such as a new
+    question and conversation. Running it again would repeat that work.
+    """
+
+
+@contextmanager
+def fail_as_partially_applied(session):
+    """
+    Turns an error raised after session committed into PartiallyAppliedError,
+    so the event is not retried.
+    """
+    commits = []
+
+    def count_commit(session):
+        commits.append(True)
+
+    event.listen(session, "after_commit", count_commit)
+    try:
+        yield
+    except Exception as e:
+        if commits:
+            raise PartiallyAppliedError(f"failed after committing: {e}") from e
+        raise
+    finally:
+        event.remove(session, "after_commit", count_commit)
+
+
+class PostgresAdvisoryLock:
+    """
+    Per-user lock shared by all app processes, a session level postgres advisory
+    lock held on its own connection while the event runs.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    @staticmethod
+    def lock_key(user_id) -> int:
+        key = zlib.crc32(user_id.encode("utf-8"))
+        # pg_advisory_lock(int, int) takes signed 32 bit keys
+        return key - 2**32 if key >= 2**31 else key
+
+    @contextmanager
+    def hold(self, user_id):
+        params = {"namespace": USER_LOCK_NAMESPACE, "key": self.lock_key(user_id)}
+        with self.engine.connect() as connection:
+            connection.execute(
+                text("SELECT pg_advisory_lock(:namespace, :key)"), params
+            )
+            try:
+                yield
+            finally:
+                try:
+                    connection.execute(
+                        text("SELECT pg_advisory_unlock(:namespace, :key)"), params
+                    )
+                    connection.commit()
+                except Exception:
+                    # never hand a connection still holding the lock back to the pool
+                    connection.invalidate()
+                    raise
+
+
+class EventScheduler:
+    """
+    Runs webhook events on lanes partitioned by user.
+
+    Events of one user run one at a time in arrival order, events of different
+    users run in parallel on up to lanes threads, so no global lock is needed.
+    With user_lock, such as PostgresAdvisoryLock, each event also holds its
+    user's lock, which keeps the order across app processes. At most max_pending
+    events wait or run at once, submit raises DispatcherFullError beyond that.
+
+    A failing event runs again in place, up to attempts times, before the next
+    event of its user, after retry_delay seconds doubled on every attempt. Meant
+    for events answered before they ran, which Viber does not redeliver. Events
+    failing with PartiallyAppliedError are not run again.
+    """
+
+    def __init__(
+        self,
+        handler,
+        lanes=8,
+        max_pending=None,
+        user_lock=None,
+        attempts=1,
+        retry_delay=1.0,
+    ):
+        self.handler = handler
+        self.user_lock = user_lock
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self._dispatcher = OrderedDispatcher(
+            lanes=lanes, thread_name_prefix="flow-worker", max_pending=max_pending
+        )
+
+    def submit(self, viber_request):
+        """
+        :return: concurrent.futures.Future of the handler call
+        """
+        future = self._dispatcher.submit(
+            event_user_id(viber_request), self._handle, viber_request
+        )
+        future.add_done_callback(lambda done: self._log_error(viber_request, done))
+        return future
+
+    def run(self, viber_request):
+        """
+        Runs the event in its user's lane and waits for it.
+        """
+        return self.submit(viber_request).result()
+
+    def close(self, wait=True):
+        self._dispatcher.close(wait=wait)
+
+    def _handle(self, viber_request):
+        user_id = event_user_id(viber_request)
+        if self.user_lock is None or user_id is None:
+            return self._attempt(viber_request)
+        with self.user_lock.hold(user_id):
+            return self._attempt(viber_request)
+
+    def _attempt(self, viber_request):
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return self.handler(viber_request)
+            except PartiallyAppliedError:
+                raise
+            except Exception as e:
+                if attempt == self.attempts:
+                    raise
+                logger.warning(
+                    f"processing {viber_request.event_type} event failed, "
+                    f"attempt {attempt} of {self.attempts}: {e}"
+                )
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    @staticmethod
+    def log_lost_event(viber_request, future):
+        """
+        Done callback of events answered before they ran, Viber does not redeliver them.
+        """
+        if future.exception() is not None:
+            logger.error(
+                f"lost {viber_request.event_type} event "
+                f"{getattr(viber_request, 'message_token', '')}: "
+                f"its flow failed after the webhook was answered"
+            )
+
+    @staticmethod
+    def _log_error(viber_request, future):
+        if future.exception() is not None:
+            logger.error(
+                f"failed processing {viber_request.event_type} event: {future.exception()}"
+            )
@@ -11,6 +11,7 @@ from app.flows.flow_accept_or_reject_answer import (
     handle_reject_response,
 )
 from app.flows.flow_answer_question import handle_responder_answer
+from app.flows.flow_dispatch_pending import dispatch_pending_conversations
 from app.flows.flow_ask_question import (
     get_asker,
     initiate_conversation,
@@ -39,9 +40,10 @@ from logger import logger
 
 class FlowManager:
 
-    def __init__(self, session, viber, viber_request):
+    def __init__(self, session, viber, viber_request, responder_scheduler=None):
         self.session = session
         self.viber = viber
+        self.responder_scheduler = responder_scheduler
         self.viber_message = parse_viber_request(viber_request=viber_request)
         self.intentions = get_message_intention(self.viber_message.message_text)
 
@@ -60,7 +62,7 @@ class FlowManager:
             self.session, self.viber_message.message_text, asker.user_id
         )
 
-        responder = select_responder(self.session, asker)
+        responder = select_responder(self.session, asker, self.responder_scheduler)
 
         conversation, send_question = initiate_conversation(
             self.session, asker, responder, question
@@ -101,6 +103,10 @@ class FlowManager:
             conversation status close
             """
             approve_answer_and_close_conversation(self.session, conversation)
+            # the responder and the asker can take pending questions now
+            dispatch_pending_conversations(
+                self.session, self.viber, self.responder_scheduler
+            )
 
         elif self.viber_message.message_text.lower().strip().startswith("ne"):
             """
@@ -116,7 +122,15 @@ class FlowManager:
             )
 
             handle_reject_response(
-                self.session, self.viber, conversation, message_sender
+                self.session,
+                self.viber,
+                conversation,
+                message_sender,
+                self.responder_scheduler,
+            )
+            # the rejected responder can take other pending questions
+            dispatch_pending_conversations(
+                self.session, self.viber, self.responder_scheduler
             )
 
     def list_unanswered_question_flow(self):
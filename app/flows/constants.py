@@ -14,3 +14,5 @@ WELCOME_HELP_MESSAGE = "Labas! Aš esu FoxBot. Mano darbas padėti atsakyti į J
 QUESTION_PREFIX = "Prašau atsakyti į klausimą :)\n"
 UNANSWERED_QUESTIONS_PREFIX = "Neatsakyti klausimai:\n"
 ANSWER_PREFIX = "Siūlomas atsakymas.\n"
+RESPONDER_REMINDER_PREFIX = "Primename, laukiame Jūsų atsakymo į klausimą :)\n"
+APPROVAL_REMINDER_MESSAGE = "Primename, ar priimate atsakymą?\nAtsakykite taip arba ne."
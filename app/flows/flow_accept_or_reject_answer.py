@@ -4,21 +4,27 @@ from app.data_models import (
     ChatBotUser,
     Conversation,
     get_question,
-    get_users_not_in_active_pending_conversations,
+    record_responder_assigned,
+    record_responder_released,
     update_answer,
     update_conversation,
 )
 from app.flows.constants import QUESTION_PREFIX
+from app.flows.flow_ask_question import ResponderScheduler, default_responder_scheduler
 from app.message_utils import MessageBuilder, MessageSenger
 
 
 def approve_answer_and_close_conversation(session, conversation: Conversation):
+    # a conversation closed by its approval timeout released the responder already
+    already_closed = conversation.status == ConversationStatus.closed
     update_answer(session, conversation.answer_id, approved=True)
     conversation = update_conversation(
         session,
         conversation_id=conversation.conversation_id,
         status=ConversationStatus.closed,
     )
+    if conversation.responder_user_id is not None and not already_closed:
+        record_responder_released(session, conversation.responder_user_id)
 
 
 def assign_responder_and_send_question(
@@ -45,20 +51,28 @@ def assign_responder_and_send_question(
         conversation_id=conversation.conversation_id,
         responder_user_id=responder.user_id,
     )
+    record_responder_assigned(session, responder.user_id)
 
 
 def handle_reject_response(
-    session, viber, conversation: Conversation, message_sender: ChatBotUser
+    session,
+    viber,
+    conversation: Conversation,
+    message_sender: ChatBotUser,
+    scheduler: ResponderScheduler = None,
 ):
-    responders = get_users_not_in_active_pending_conversations(session)
-    responders = [
-        candidate_responder
-        for candidate_responder in responders
-        if candidate_responder.user_id != message_sender.user_id
-    ]
-    if responders:
+    # the rejected responder is free again, for other questions
+    rejected_user_id = conversation.responder_user_id
+    if rejected_user_id is not None:
+        record_responder_released(session, rejected_user_id)
+
+    scheduler = scheduler or default_responder_scheduler
+    responder = scheduler.select(
+        session, exclude_user_ids=[message_sender.user_id, rejected_user_id]
+    )
+    if responder is not None:
         assign_responder_and_send_question(
-            session, viber, responder=responders.pop(), conversation=conversation
+            session, viber, responder=responder, conversation=conversation
         )
 
     else:
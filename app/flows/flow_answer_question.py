@@ -11,6 +11,7 @@ from app.data_models import (
     create_answer,
     get_answer,
     get_user_by_user_id,
+    rearm_conversation_deadline,
     update_answer,
     update_conversation,
 )
@@ -41,6 +42,8 @@ def append_answer_text_to_existing_answer(
     answer = get_answer(session, conversation.answer_id)
     updated_answer_text = answer.answer_text + "\n " + viber_message.message_text
     answer = update_answer(session, answer.answer_id, answer_text=updated_answer_text)
+    # the responder is still writing, hold the reminder back
+    rearm_conversation_deadline(session, conversation.conversation_id)
 
 
 def send_answer_acceptance_message(
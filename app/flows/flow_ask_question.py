@@ -1,5 +1,6 @@
+import threading
 from dataclasses import asdict
-from typing import Tuple
+from typing import Optional, Tuple
 from app.data_classes import ConversationStatus, IntentionName, TrackingData
 from app.flows.constants import QUESTION_PREFIX
 from app.message_utils import MessageBuilder, MessageSenger
@@ -8,8 +9,9 @@ from app.data_models import (
     Conversation,
     Question,
     create_new_conversation,
+    free_responders_query,
     get_user_by_viber_id,
-    get_users_not_in_active_pending_conversations,
+    record_responder_assigned,
 )
 
 
@@ -18,13 +20,95 @@ def get_asker(session, viber_id) -> ChatBotUser:
     return asker
 
 
-def select_responder(session, asker: ChatBotUser) -> ChatBotUser:
-    responders = get_users_not_in_active_pending_conversations(session)
-    responder = next(
-        (responder for responder in responders if responder.user_id != asker.user_id),
-        None,
-    )
-    return responder
+class ResponderScheduler:
+    """
+    Picks the responder of a question among the users free to take one.
+
+    Each strategy is a single ordered LIMIT 1 query over the load columns of
+    chat_bot_users, never a scan of the conversations table.
+    """
+
+    def __init__(self, max_open_conversations=1):
+        self.max_open_conversations = max_open_conversations
+
+    def select(self, session, exclude_user_ids=()) -> Optional[ChatBotUser]:
+        query = free_responders_query(
+            session,
+            exclude_user_ids=exclude_user_ids,
+            max_open_conversations=self.max_open_conversations,
+        )
+        return self.pick(query)
+
+    def pick(self, query) -> Optional[ChatBotUser]:
+        raise NotImplementedError
+
+
+class RoundRobinScheduler(ResponderScheduler):
+    """
+    Takes the free users in user id order, continuing after the last one picked by
+    this process.
+    """
+
+    def __init__(self, max_open_conversations=1):
+        super().__init__(max_open_conversations)
+        self._last_user_id = None
+        self._lock = threading.Lock()
+
+    def pick(self, query):
+        with self._lock:
+            responder = None
+            if self._last_user_id is not None:
+                responder = (
+                    query.filter(ChatBotUser.user_id > self._last_user_id)
+                    .order_by(ChatBotUser.user_id)
+                    .first()
+                )
+            if responder is None:
+                # wrap around to the lowest user id
+                responder = query.order_by(ChatBotUser.user_id).first()
+            if responder is not None:
+                self._last_user_id = responder.user_id
+            return responder
+
+
+class LeastRecentlyAssignedScheduler(ResponderScheduler):
+    """
+    Takes the free user who waited longest since their last question, shared by all
+    processes through last_assigned_at.
+    """
+
+    def pick(self, query):
+        return query.order_by(
+            ChatBotUser.last_assigned_at, ChatBotUser.user_id
+        ).first()
+
+
+class LeastOpenConversationsScheduler(ResponderScheduler):
+    """
+    Takes the free user holding the fewest open conversations, useful with
+    max_open_conversations above 1.
+    """
+
+    def pick(self, query):
+        return query.order_by(
+            ChatBotUser.open_conversations, ChatBotUser.user_id
+        ).first()
+
+
+RESPONDER_SCHEDULERS = {
+    "round_robin": RoundRobinScheduler,
+    "least_recently_assigned": LeastRecentlyAssignedScheduler,
+    "least_open_conversations": LeastOpenConversationsScheduler,
+}
+
+default_responder_scheduler = LeastRecentlyAssignedScheduler()
+
+
+def select_responder(
+    session, asker: ChatBotUser, scheduler: ResponderScheduler = None
+) -> ChatBotUser:
+    scheduler = scheduler or default_responder_scheduler
+    return scheduler.select(session, exclude_user_ids=[asker.user_id])
 
 
 def initiate_conversation(
@@ -40,6 +124,8 @@ def initiate_conversation(
         asker_user_id=asker.user_id,
         status=status,
     )
+    if responder is not None:
+        record_responder_assigned(session, responder.user_id)
     return conversation, responder is not None
 
 
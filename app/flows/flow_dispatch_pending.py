@@ -0,0 +1,55 @@
+from app.data_models import (
+    claim_pending_conversation,
+    get_question,
+    next_pending_conversation,
+    record_responder_assigned,
+)
+from app.flows.flow_ask_question import (
+    ResponderScheduler,
+    default_responder_scheduler,
+    send_question_to_responder,
+)
+
+from logger import logger
+
+
+def dispatch_pending_conversations(
+    session, viber, scheduler: ResponderScheduler = None, limit: int = None
+) -> int:
+    """
+    Assigns pending conversations, oldest first, to free responders until either
+    runs out. Runs when a responder or an asker is freed, instead of a review loop
+    over the conversations table.
+
+    :return: number of conversations assigned
+    """
+    scheduler = scheduler or default_responder_scheduler
+    assigned = 0
+    skipped_user_ids = []
+    while limit is None or assigned < limit:
+        responder = scheduler.select(session, exclude_user_ids=skipped_user_ids)
+        if responder is None:
+            break
+        conversation = next_pending_conversation(session, responder.user_id)
+        if conversation is None:
+            # only a responder who was rejected on every pending conversation, or the
+            # asker of all of them, finds none, so one other responder is enough
+            if skipped_user_ids:
+                break
+            skipped_user_ids.append(responder.user_id)
+            continue
+        if not claim_pending_conversation(
+            session, conversation.conversation_id, responder.user_id
+        ):
+            continue
+
+        record_responder_assigned(session, responder.user_id)
+        session.refresh(conversation)
+        question = get_question(session, conversation.question_id)
+        send_question_to_responder(viber, responder, conversation, question)
+        assigned += 1
+        logger.debug(
+            f"assigned pending conversation {conversation.conversation_id} "
+            f"to user {responder.user_id}"
+        )
+    return assigned
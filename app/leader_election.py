@@ -0,0 +1,207 @@
+"""
+Runs periodic jobs in one process out of all app workers and nodes.
+
+Every process runs a heartbeat thread that takes or renews a lease row in the
+scheduler_leases table. Only the process holding the lease runs the jobs, on a
+thread of their own so a long job does not hold up the renewals. When it dies,
+its lease runs out within lease seconds and the next heartbeat of another
+process takes over. A job checks it still holds the lease before each commit,
+so a leader whose renewals failed stops writing once its lease may have run
+out. The server clocks must agree to well within the lease.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from app.data_models import SchedulerLease
+
+from logger import logger
+
+
+def default_holder():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class SqlLease:
+    """
+    A named lease on the scheduler_leases table, held by one holder at a time.
+    """
+
+    def __init__(self, session_factory, name, duration, clock=datetime.now):
+        self.session_factory = session_factory
+        self.name = name
+        self.duration = duration
+        self.clock = clock
+
+    def acquire(self, holder) -> bool:
+        """
+        Takes the lease, or renews it when holder has it already.
+
+        :return: True if holder has the lease for the next duration
+        """
+        now = self.clock()
+        session = self.session_factory()
+        try:
+            acquired = session.execute(
+                update(SchedulerLease)
+                .where(
+                    SchedulerLease.name == self.name,
+                    or_(
+                        SchedulerLease.holder == holder,
+                        SchedulerLease.expires_at <= now,
+                    ),
+                )
+                .values(holder=holder, expires_at=now + self.duration)
+            ).rowcount
+            session.commit()
+            if acquired:
+                return True
+            if session.get(SchedulerLease, self.name) is not None:
+                return False
+            session.add(
+                SchedulerLease(
+                    name=self.name, holder=holder, expires_at=now + self.duration
+                )
+            )
+            try:
+                session.commit()
+                return True
+            except IntegrityError:
+                # another process created the lease first
+                session.rollback()
+                return False
+        finally:
+            session.close()
+
+    def release(self, holder):
+        """
+        Ends the lease of holder early, so another process takes over on its next
+        heartbeat instead of after the lease runs out.
+        """
+        session = self.session_factory()
+        try:
+            session.execute(
+                update(SchedulerLease)
+                .where(
+                    SchedulerLease.name == self.name, SchedulerLease.holder == holder
+                )
+                .values(expires_at=self.clock())
+            )
+            session.commit()
+        finally:
+            session.close()
+
+
+class LeaderElectedJobs:
+    """
+    :param lease: SqlLease shared by the processes competing to run the jobs
+    :param jobs: dict of job name to (interval in seconds, callable), the callable
+        gets holds_lease to check it may still commit its next batch
+    :param heartbeat_seconds: Optional. Seconds between renewals of the lease, a
+        third of its duration by default
+    :param holder: Optional. Identity of this process in the lease row
+    """
+
+    def __init__(self, lease, jobs, heartbeat_seconds=None, holder=None):
+        self.lease = lease
+        self.jobs = jobs
+        self.heartbeat_seconds = (
+            heartbeat_seconds or lease.duration.total_seconds() / 3
+        )
+        self.holder = holder or default_holder()
+        self.is_leader = False
+        self._lease_until = 0.0
+        self._last_runs = {}
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if not self._threads:
+            self._stopped.clear()
+            self._threads = [
+                threading.Thread(target=target, name=name, daemon=True)
+                for target, name in (
+                    (self._run_heartbeats, "leader-election-heartbeat"),
+                    (self._run_jobs, "leader-elected-jobs"),
+                )
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self.is_leader:
+            self.lease.release(self.holder)
+            self.is_leader = False
+
+    def heartbeat(self) -> bool:
+        """
+        Renews or takes the lease.
+
+        :return: True if this process is the leader
+        """
+        # the lease runs from before the renewal was sent, not from its answer
+        renewed_at = time.monotonic()
+        try:
+            is_leader = self.lease.acquire(self.holder)
+        except Exception:
+            logger.exception(f"renewing lease {self.lease.name} failed")
+            is_leader = False
+        with self._lock:
+            if is_leader != self.is_leader:
+                logger.info(
+                    f"{self.holder} {'took' if is_leader else 'lost'} "
+                    f"lease {self.lease.name}"
+                )
+                # a new leader runs every job right away
+                self._last_runs.clear()
+            self.is_leader = is_leader
+            if is_leader:
+                self._lease_until = renewed_at + self.lease.duration.total_seconds()
+        return is_leader
+
+    def holds_lease(self) -> bool:
+        """
+        :return: True while the last renewal keeps this process the leader
+        """
+        with self._lock:
+            return self.is_leader and time.monotonic() < self._lease_until
+
+    def run_due_jobs(self):
+        """
+        Runs the jobs that are due, when this process leads.
+        """
+        for name, (interval, job) in self.jobs.items():
+            with self._lock:
+                if not self.holds_lease():
+                    return
+                now = time.monotonic()
+                last_run = self._last_runs.get(name)
+                if last_run is not None and now - last_run < interval:
+                    continue
+                self._last_runs[name] = now
+            try:
+                job(self.holds_lease)
+            except Exception:
+                logger.exception(f"background job {name} failed")
+
+    def _run_heartbeats(self):
+        while not self._stopped.is_set():
+            self.heartbeat()
+            self._stopped.wait(self.heartbeat_seconds)
+
+    def _run_jobs(self):
+        while not self._stopped.is_set():
+            self.run_due_jobs()
+            self._stopped.wait(self.heartbeat_seconds)
@@ -1,78 +1,285 @@
-from flask import Flask, render_template, request, Response, send_file
+import os
+import threading
+import time
+from datetime import timedelta
+
+import click
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    current_app,
+    render_template,
+    request,
+    send_file,
+)
+from flask.cli import with_appcontext
 from sqlalchemy import inspect
 from sqlalchemy.orm import aliased
 from app.flow_manager import FlowManager
+from app.flows.flow_ask_question import RESPONDER_SCHEDULERS
 from app.data_models import ChatBotUser, Question, Answer
-from app.create_postgre_session import Session
+from app.create_postgre_session import get_engine, get_session_factory
+from app.event_processing import (
+    EventScheduler,
+    PartiallyAppliedError,
+    PostgresAdvisoryLock,
+    fail_as_partially_applied,
+)
+from app.leader_election import LeaderElectedJobs, SqlLease
+from app.message_dedup import SqlDedupStore
+from app.timeouts import run_timeouts_tick
 
 from viberbot import Api
 from viberbot.api.bot_configuration import BotConfiguration
+from viberbot.api.circuit_breaker import CircuitBreaker
+from viberbot.api.event_type import EventType
 from viberbot.api.messages.text_message import TextMessage
+from viberbot.api.ordered_dispatcher import DispatcherFullError
+from viberbot.api.outbound_queue import SqliteOutboundQueue
+from viberbot.api.rate_limiter import RateLimiter
 from viberbot.api.viber_requests import ViberConversationStartedRequest
 from viberbot.api.viber_requests import ViberFailedRequest
 from viberbot.api.viber_requests import ViberMessageRequest
 from viberbot.api.viber_requests import ViberSubscribedRequest
 from viberbot.api.viber_requests import ViberUnsubscribedRequest
 
-import sched
-import time
-import threading
-
-
-import os
-
 from logger import logger
 
-app = Flask(__name__)
-
+DEFAULT_WEBHOOK_URL = "https://viber-fox-bot-9d12996926ae.herokuapp.com/"
 
-# Define your ConversationManager class and functions here
+bp = Blueprint("foxbot", __name__)
 
 
-def conversation_manager_review(conversation_manager):
-    logger.debug("Checking meesage status via conversation_manager_review every 60s. ")
-    # review_message_statuses(conversation_manager)
-
-
-viber = Api(
-    BotConfiguration(
-        name="FoxBot",
-        avatar="https://viber-fox-bot-9d12996926ae.herokuapp.com/foxbot_face",
-        auth_token=os.environ["VIBER_AUTH_KEY"],
+def create_viber_client(environ):
+    # replies are spooled to a local SQLite file and sent by background workers when set
+    outbound_spool_path = environ.get("OUTBOUND_SPOOL_PATH")
+    outbound_queue = (
+        SqliteOutboundQueue(outbound_spool_path) if outbound_spool_path else None
     )
-)
 
-
-def set_webhook(viber):
-    viber.set_webhook("https://viber-fox-bot-9d12996926ae.herokuapp.com/")
-
-
-# Schedule conversation manager review
-scheduler = sched.scheduler(time.time, time.sleep)
-scheduler.enter(5, 1, set_webhook, (viber,))
-# scheduler.enter(60, 1, conversation_manager_review, (conversation_manager,))
-t = threading.Thread(target=scheduler.run)
-t.start()
-
-
-scheduler2 = sched.scheduler(time.time, time.sleep)
-# scheduler2.enter(5, 1, set_webhook, (viber,))
-conversation_manager = "ConversationManager()"
-logger.debug(f"main function conversation_manager_id {id(conversation_manager)}")
-scheduler2.enter(60, 1, conversation_manager_review, (conversation_manager,))
-t2 = threading.Thread(target=scheduler2.run)
-t2.start()
-
-
-@app.route("/", methods=["GET"])
+    viber = Api(
+        BotConfiguration(
+            name="FoxBot",
+            avatar="https://viber-fox-bot-9d12996926ae.herokuapp.com/foxbot_face",
+            auth_token=environ["VIBER_AUTH_KEY"],
+        ),
+        rate_limiter=RateLimiter(rate=50, per_receiver_rate=5),
+        circuit_breaker=CircuitBreaker(slow_call_duration=5, open_timeout=30),
+        outbound_queue=outbound_queue,
+        # delivered and seen callbacks are not handled and skipped before parsing
+        subscribed_events=[
+            EventType.MESSAGE,
+            EventType.CONVERSATION_STARTED,
+            EventType.SUBSCRIBED,
+            EventType.UNSUBSCRIBED,
+            EventType.FAILED,
+        ],
+    )
+    if outbound_queue is not None:
+        viber.start_outbound_workers(
+            workers=int(environ.get("OUTBOUND_SENDER_WORKERS", "4"))
+        )
+    return viber
+
+
+class BotServices:
+    """
+    Clients used by the routes, each built on first use.
+
+    Creating the app reads no configuration, opens no connection and starts no
+    thread, so every gunicorn worker builds its own clients after the fork.
+    """
+
+    def __init__(self, environ=None):
+        self.environ = os.environ if environ is None else environ
+        self._lock = threading.RLock()
+        self._session_factory = None
+        self._viber = None
+        self._dedup_store = None
+        self._event_scheduler = None
+        self._responder_scheduler = None
+        self._background_jobs = None
+
+    @property
+    def session_factory(self):
+        with self._lock:
+            if self._session_factory is None:
+                self._session_factory = get_session_factory()
+            return self._session_factory
+
+    @property
+    def viber(self):
+        with self._lock:
+            if self._viber is None:
+                self._viber = create_viber_client(self.environ)
+            return self._viber
+
+    @property
+    def dedup_store(self):
+        # Viber redelivers events answered slowly, each message runs its flow once
+        with self._lock:
+            if self._dedup_store is None:
+                self._dedup_store = SqlDedupStore(self.session_factory)
+            return self._dedup_store
+
+    @property
+    def event_scheduler(self):
+        # events of one user run one at a time, in order, on the lane of that user.
+        # With USER_EVENT_LOCKS=advisory the order also holds across app processes.
+        with self._lock:
+            if self._event_scheduler is None:
+                self._event_scheduler = EventScheduler(
+                    lambda viber_request: process_viber_request(self, viber_request),
+                    lanes=int(self.environ.get("FLOW_WORKERS", "8")),
+                    max_pending=int(self.environ.get("FLOW_QUEUE_SIZE", "1000")),
+                    user_lock=(
+                        PostgresAdvisoryLock(get_engine())
+                        if self.environ.get("USER_EVENT_LOCKS") == "advisory"
+                        else None
+                    ),
+                    # Viber only redelivers failed events the webhook waited for
+                    attempts=(
+                        int(self.environ.get("FLOW_ATTEMPTS", "3"))
+                        if self.ack_first
+                        else 1
+                    ),
+                    retry_delay=float(self.environ.get("FLOW_RETRY_SECONDS", "1")),
+                )
+            return self._event_scheduler
+
+    @property
+    def responder_scheduler(self):
+        # RESPONDER_STRATEGY is one of RESPONDER_SCHEDULERS
+        with self._lock:
+            if self._responder_scheduler is None:
+                strategy = self.environ.get(
+                    "RESPONDER_STRATEGY", "least_recently_assigned"
+                )
+                self._responder_scheduler = RESPONDER_SCHEDULERS[strategy](
+                    max_open_conversations=int(
+                        self.environ.get("RESPONDER_MAX_OPEN_CONVERSATIONS", "1")
+                    )
+                )
+            return self._responder_scheduler
+
+    @property
+    def background_jobs(self):
+        # started per worker by gunicorn.conf.py, only the lease holder runs the jobs
+        with self._lock:
+            if self._background_jobs is None:
+                lease = SqlLease(
+                    self.session_factory,
+                    "background_jobs",
+                    timedelta(
+                        seconds=float(self.environ.get("LEADER_LEASE_SECONDS", "30"))
+                    ),
+                )
+                self._background_jobs = LeaderElectedJobs(
+                    lease,
+                    jobs={
+                        "timeouts": (
+                            float(self.environ.get("TIMEOUT_TICK_SECONDS", "60")),
+                            lambda holds_lease: run_timeouts_tick(
+                                self.session_factory,
+                                self.viber,
+                                self.responder_scheduler,
+                                holds_lease=holds_lease,
+                            ),
+                        )
+                    },
+                )
+            return self._background_jobs
+
+    @property
+    def ack_first(self):
+        # with WEBHOOK_ACK_FIRST=1 the webhook answers before the flow has run
+        return self.environ.get("WEBHOOK_ACK_FIRST") == "1"
+
+    def close(self):
+        with self._lock:
+            if self._background_jobs is not None:
+                # a graceful shutdown hands the lease over right away
+                self._background_jobs.stop()
+                self._background_jobs = None
+            if self._event_scheduler is not None:
+                self._event_scheduler.close()
+                self._event_scheduler = None
+            if self._viber is not None:
+                self._viber.close()
+                self._viber = None
+
+
+def services() -> BotServices:
+    return current_app.extensions["foxbot"]
+
+
+def set_webhook(viber, url=DEFAULT_WEBHOOK_URL, attempts=3, retry_delay=5):
+    # Viber calls the url while setting it, which fails until a web process answers
+    for attempt in range(1, attempts + 1):
+        try:
+            return viber.set_webhook(url)
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            logger.warning(f"setting webhook failed, attempt {attempt}: {e}")
+            time.sleep(retry_delay)
+
+
+@click.command("set-webhook")
+@with_appcontext
+def set_webhook_command():
+    """
+    Points the Viber webhook at WEBHOOK_URL, run once per deployment.
+    """
+    url = services().environ.get("WEBHOOK_URL", DEFAULT_WEBHOOK_URL)
+    event_types = set_webhook(services().viber, url)
+    logger.info(f"webhook set to {url} for events {event_types}")
+
+
+@click.command("run-timeouts")
+@click.option("--once", is_flag=True, help="Fire the due timeouts and exit.")
+@with_appcontext
+def run_timeouts_command(once):
+    """
+    Sends the reminders and reassignments of timed out conversations, every
+    TIMEOUT_TICK_SECONDS until stopped.
+    """
+    tick_seconds = float(services().environ.get("TIMEOUT_TICK_SECONDS", "60"))
+    while True:
+        fired = run_timeouts_tick(
+            services().session_factory,
+            services().viber,
+            services().responder_scheduler,
+        )
+        if fired:
+            logger.info(f"fired {fired} conversation timeouts")
+        if once:
+            return
+        time.sleep(tick_seconds)
+
+
+def create_app(bot_services=None):
+    """
+    :param bot_services: Optional. BotServices of the app, from os.environ by default
+    """
+    app = Flask(__name__)
+    app.extensions["foxbot"] = bot_services or BotServices()
+    app.register_blueprint(bp)
+    app.cli.add_command(set_webhook_command)
+    app.cli.add_command(run_timeouts_command)
+    return app
+
+
+@bp.route("/", methods=["GET"])
 def hello_world():
     logger.debug("called hello world")
     return render_template("index_template.html")
 
 
-@app.route("/chatbot_users", methods=["GET"])
+@bp.route("/chatbot_users", methods=["GET"])
 def display_chat_bot_users():
-    session = Session()
+    session = services().session_factory()
     users = session.query(ChatBotUser).all()
 
     mapper = inspect(ChatBotUser)
@@ -85,9 +292,9 @@ def display_chat_bot_users():
     return render_template("json_template.html", json_data=users_simple_types)
 
 
-@app.route("/questions", methods=["GET"])
+@bp.route("/questions", methods=["GET"])
 def display_questions():
-    session = Session()
+    session = services().session_factory()
 
     questions = session.query(Question).all()
     mapper = inspect(Question)
@@ -101,9 +308,9 @@ def display_questions():
     return render_template("json_template.html", json_data=questions_simple_types)
 
 
-@app.route("/answers", methods=["GET"])
+@bp.route("/answers", methods=["GET"])
 def display_answers():
-    session = Session()
+    session = services().session_factory()
 
     answers = session.query(Answer).all()
     mapper = inspect(Answer)
@@ -115,9 +322,9 @@ def display_answers():
     return render_template("json_template.html", json_data=answers_simple_types)
 
 
-@app.route("/q_and_a", methods=["GET"])
+@bp.route("/q_and_a", methods=["GET"])
 def display_q_and_a():
-    session = Session()
+    session = services().session_factory()
     question_user_alias = aliased(ChatBotUser)
 
     answer_user_alias = aliased(ChatBotUser)
@@ -147,35 +354,88 @@ def display_q_and_a():
     return render_template("json_template.html", json_data=result)
 
 
-@app.route("/foxbot_face")
+@bp.route("/foxbot_face")
 def show_foxbot_face():
     # Imagine that user_image is determined dynamically for each user
     face_path = "static/images/resized_foxbot_image.png"
     return send_file(face_path, mimetype="image/png")
 
 
-@app.route("/", methods=["POST"])
+@bp.route("/", methods=["POST"])
 def incoming():
-    session = Session()
-    viber_request = viber.parse_request(request.get_data().decode("utf8"))
-    if isinstance(viber_request, ViberMessageRequest):
-        viber_request = viber.parse_request(request.get_data().decode("utf8"))
-        fm = FlowManager(session, viber, viber_request)
-        fm.execute_flow()
-
-    elif (
-        isinstance(viber_request, ViberConversationStartedRequest)
-        or isinstance(viber_request, ViberSubscribedRequest)
-        or isinstance(viber_request, ViberUnsubscribedRequest)
+    bot_services = services()
+    viber = bot_services.viber
+    dedup_store = bot_services.dedup_store
+    body = request.get_data()
+    if not viber.verify_signature(
+        body, request.headers.get("X-Viber-Content-Signature")
     ):
-        viber.send_messages(
-            viber_request.user.id,
-            [TextMessage(None, None, viber_request.event_type)],
+        logger.warning("rejecting webhook call with invalid signature")
+        return Response(status=403)
+
+    viber_request = viber.parse_request(body, lazy=True)
+    if viber_request is None:
+        # an event the bot is not subscribed to, skipped before parsing
+        return Response(status=200)
+    if isinstance(viber_request, ViberMessageRequest) and not dedup_store.claim(
+        viber_request.message_token
+    ):
+        logger.debug(
+            f"skipping redelivered message_token {viber_request.message_token}"
         )
-    elif isinstance(viber_request, ViberFailedRequest):
-        logger.warn(
-            "client failed receiving message. failure: {0}".format(viber_request)
+        return Response(status=200)
+
+    try:
+        future = bot_services.event_scheduler.submit(viber_request)
+    except DispatcherFullError:
+        # Viber redelivers events answered with an error
+        if isinstance(viber_request, ViberMessageRequest):
+            dedup_store.release(viber_request.message_token)
+        return Response(status=503)
+
+    if bot_services.ack_first:
+        # Viber gets its 200 now and will not redeliver the event
+        future.add_done_callback(
+            lambda done: EventScheduler.log_lost_event(viber_request, done)
         )
-
-    session.close()
+        return Response(status=200)
+
+    try:
+        future.result()
+    except Exception as e:
+        # answered with an error, Viber redelivers the event, which is skipped
+        # when the flow committed part of its work already
+        if isinstance(viber_request, ViberMessageRequest) and not isinstance(
+            e, PartiallyAppliedError
+        ):
+            dedup_store.release(viber_request.message_token)
+        raise
     return Response(status=200)
+
+
+def process_viber_request(bot_services, viber_request):
+    viber = bot_services.viber
+    session = bot_services.session_factory()
+    try:
+        if isinstance(viber_request, ViberMessageRequest):
+            with fail_as_partially_applied(session):
+                fm = FlowManager(
+                    session, viber, viber_request, bot_services.responder_scheduler
+                )
+                fm.execute_flow()
+
+        elif (
+            isinstance(viber_request, ViberConversationStartedRequest)
+            or isinstance(viber_request, ViberSubscribedRequest)
+            or isinstance(viber_request, ViberUnsubscribedRequest)
+        ):
+            viber.send_messages(
+                viber_request.user.id,
+                [TextMessage(None, None, viber_request.event_type)],
+            )
+        elif isinstance(viber_request, ViberFailedRequest):
+            logger.warn(
+                "client failed receiving message. failure: {0}".format(viber_request)
+            )
+    finally:
+        session.close()
@@ -0,0 +1,170 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+
+from app.data_models import ProcessedMessage
+
+DEFAULT_DEDUP_WINDOW = timedelta(hours=1)
+
+
+class MemoryDedupStore:
+    """
+    Remembers the message tokens seen within the window, up to max_size of them.
+    """
+
+    def __init__(self, window=DEFAULT_DEDUP_WINDOW, max_size=100_000, clock=datetime.now):
+        self.window = window
+        self.max_size = max_size
+        self.clock = clock
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, message_token) -> bool:
+        """
+        :return: True if the token was not seen within the window, False for a duplicate
+        """
+        now = self.clock()
+        with self._lock:
+            seen_at = self._seen.get(message_token)
+            if seen_at is not None and now - seen_at < self.window:
+                return False
+            self._seen[message_token] = now
+            self._seen.move_to_end(message_token)
+            while len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+            return True
+
+    def release(self, message_token):
+        """
+        Forgets a claimed token, so a redelivery of a message that failed is processed again.
+        """
+        with self._lock:
+            self._seen.pop(message_token, None)
+
+
+class SqlDedupStore:
+    """
+    Dedup store on the processed_messages table, shared by all app processes.
+
+    Rows older than the window are purged every purge_every claims.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        window=DEFAULT_DEDUP_WINDOW,
+        purge_every=1000,
+        clock=datetime.now,
+    ):
+        self.session_factory = session_factory
+        self.window = window
+        self.purge_every = purge_every
+        self.clock = clock
+        self._claims = 0
+        self._lock = threading.Lock()
+
+    def claim(self, message_token) -> bool:
+        now = self.clock()
+        token = str(message_token)
+        session = self.session_factory()
+        try:
+            session.add(ProcessedMessage(message_token=token, processed_at=now))
+            try:
+                session.commit()
+                claimed = True
+            except IntegrityError:
+                session.rollback()
+                # a token older than the window is treated as a new message
+                claimed = (
+                    session.query(ProcessedMessage)
+                    .filter(
+                        ProcessedMessage.message_token == token,
+                        ProcessedMessage.processed_at <= now - self.window,
+                    )
+                    .update({ProcessedMessage.processed_at: now})
+                    == 1
+                )
+                session.commit()
+            if self._should_purge():
+                self.purge(session, now)
+            return claimed
+        finally:
+            session.close()
+
+    def release(self, message_token):
+        session = self.session_factory()
+        try:
+            session.execute(
+                delete(ProcessedMessage).where(
+                    ProcessedMessage.message_token == str(message_token)
+                )
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def purge(self, session, now=None):
+        now = now or self.clock()
+        session.execute(
+            delete(ProcessedMessage).where(
+                ProcessedMessage.processed_at < now - self.window
+            )
+        )
+        session.commit()
+
+    def _should_purge(self):
+        with self._lock:
+            self._claims += 1
+            return self._claims % self.purge_every == 0
+
+
+class AsyncSqlDedupStore(SqlDedupStore):
+    """
+    SqlDedupStore on an async_sessionmaker, used by the ASGI app. claim, release
+    and purge are coroutines.
+    """
+
+    async def claim(self, message_token) -> bool:
+        now = self.clock()
+        token = str(message_token)
+        async with self.session_factory() as session:
+            session.add(ProcessedMessage(message_token=token, processed_at=now))
+            try:
+                await session.commit()
+                claimed = True
+            except IntegrityError:
+                await session.rollback()
+                result = await session.execute(
+                    update(ProcessedMessage)
+                    .where(
+                        ProcessedMessage.message_token == token,
+                        ProcessedMessage.processed_at <= now - self.window,
+                    )
+                    .values(processed_at=now)
+                )
+                claimed = result.rowcount == 1
+                await session.commit()
+            if self._should_purge():
+                await self.purge(session, now)
+            return claimed
+
+    async def release(self, message_token):
+        async with self.session_factory() as session:
+            await session.execute(
+                delete(ProcessedMessage).where(
+                    ProcessedMessage.message_token == str(message_token)
+                )
+            )
+            await session.commit()
+
+    async def purge(self, session, now=None):
+        now = now or self.clock()
+        await session.execute(
+            delete(ProcessedMessage).where(
+                ProcessedMessage.processed_at < now - self.window
+            )
+        )
+        await session.commit()
@@ -0,0 +1,193 @@
+from dataclasses import asdict
+from datetime import datetime
+
+from app.data_classes import (
+    DEFAULT_TIMEOUT_POLICY,
+    ConversationStatus,
+    IntentionName,
+    TimeoutPolicy,
+    TrackingData,
+)
+from app.data_models import (
+    Conversation,
+    claim_due_conversation,
+    get_due_conversations,
+    get_question,
+    get_user_by_user_id,
+    record_responder_released,
+    update_conversation,
+)
+from app.flows.constants import APPROVAL_REMINDER_MESSAGE, RESPONDER_REMINDER_PREFIX
+from app.flows.flow_ask_question import ResponderScheduler
+from app.flows.flow_dispatch_pending import dispatch_pending_conversations
+from app.message_utils import MessageBuilder, MessageSenger
+
+from logger import logger
+
+
+def remind_responder(session, viber, conversation: Conversation) -> bool:
+    responder = get_user_by_user_id(session, conversation.responder_user_id)
+    if responder is None:
+        # unsubscribed since the question was sent
+        return False
+    question = get_question(session, conversation.question_id)
+    # same tracking data as the question, so the reply is taken as the answer
+    tracking_data = TrackingData(
+        conversation_id=conversation.conversation_id,
+        flow=IntentionName.ask_question,
+    )
+    MessageSenger.send_viber_messagess(
+        viber=viber,
+        recipient_viber_id=responder.viber_id,
+        viber_message=MessageBuilder.build_viber_message(
+            message_text=RESPONDER_REMINDER_PREFIX + question.question_text,
+            tracking_data=asdict(tracking_data),
+        ),
+    )
+    return True
+
+
+def remind_asker(session, viber, conversation: Conversation):
+    asker = get_user_by_user_id(session, conversation.asker_user_id)
+    if asker is None:
+        return
+    tracking_data = TrackingData(
+        conversation_id=conversation.conversation_id,
+        system_message=True,
+        flow=IntentionName.answer_question,
+    )
+    MessageSenger.send_viber_messagess(
+        viber=viber,
+        recipient_viber_id=asker.viber_id,
+        viber_message=MessageBuilder.build_viber_message(
+            message_text=APPROVAL_REMINDER_MESSAGE,
+            tracking_data=asdict(tracking_data),
+        ),
+    )
+
+
+def reassign_conversation(
+    session, viber, conversation: Conversation, scheduler: ResponderScheduler = None
+):
+    responder_user_id = conversation.responder_user_id
+    record_responder_released(session, responder_user_id)
+    update_conversation(
+        session,
+        conversation_id=conversation.conversation_id,
+        status=ConversationStatus.pending,
+        reset_responder_and_answer=True,
+    )
+    logger.debug(
+        f"conversation {conversation.conversation_id} timed out with "
+        f"responder {responder_user_id}, reassigning"
+    )
+    dispatch_pending_conversations(session, viber, scheduler)
+
+
+def close_unapproved_conversation(
+    session, viber, conversation: Conversation, scheduler: ResponderScheduler = None
+):
+    # the asker never approved, the answer stands and the responder is free again
+    update_conversation(
+        session,
+        conversation_id=conversation.conversation_id,
+        status=ConversationStatus.closed,
+    )
+    if conversation.responder_user_id is not None:
+        record_responder_released(session, conversation.responder_user_id)
+    logger.debug(
+        f"conversation {conversation.conversation_id} closed without the approval "
+        "of the asker"
+    )
+    dispatch_pending_conversations(session, viber, scheduler)
+
+
+def fire_due_timeouts(
+    session,
+    viber,
+    scheduler: ResponderScheduler = None,
+    policy: TimeoutPolicy = DEFAULT_TIMEOUT_POLICY,
+    now: datetime = None,
+    batch_size: int = 100,
+    holds_lease=None,
+) -> int:
+    """
+    Sends the reminders and reassignments of the conversations whose deadline has
+    passed, up to batch_size of them.
+
+    Only the due conversations are read, through the deadline index. Each timer is
+    claimed by moving its deadline on first, so one process fires it even when
+    several tick at once, and the deadlines in the table survive restarts.
+
+    :param holds_lease: Optional. Callable checked before each conversation is
+        claimed, the remaining ones are left to the next leader once it is False
+    :return: number of conversations read, batch_size when more may be due
+    """
+    now = now or datetime.now()
+    due = get_due_conversations(session, now, batch_size)
+    for conversation in due:
+        if holds_lease is not None and not holds_lease():
+            logger.warning("lost the lease of the background jobs, stopping timeouts")
+            return 0
+        status = conversation.status
+        reminders_sent = conversation.reminders_sent
+        if status == ConversationStatus.active and conversation.responder_user_id:
+            if reminders_sent < policy.responder_reminders:
+                if claim_due_conversation(
+                    session,
+                    conversation,
+                    now + policy.responder_reminder_after,
+                    reminders_sent + 1,
+                ) and not remind_responder(session, viber, conversation):
+                    reassign_conversation(session, viber, conversation, scheduler)
+            elif claim_due_conversation(session, conversation, None, reminders_sent):
+                reassign_conversation(session, viber, conversation, scheduler)
+        elif status == ConversationStatus.waiting_for_approval:
+            if reminders_sent < policy.approval_reminders:
+                if claim_due_conversation(
+                    session,
+                    conversation,
+                    now + policy.approval_reminder_after,
+                    reminders_sent + 1,
+                ):
+                    remind_asker(session, viber, conversation)
+            elif claim_due_conversation(session, conversation, None, reminders_sent):
+                close_unapproved_conversation(session, viber, conversation, scheduler)
+        else:
+            # nothing more to do for the conversation, disarm it
+            claim_due_conversation(session, conversation, None, reminders_sent)
+    return len(due)
+
+
+def run_timeouts_tick(
+    session_factory,
+    viber,
+    scheduler: ResponderScheduler = None,
+    policy: TimeoutPolicy = DEFAULT_TIMEOUT_POLICY,
+    batch_size: int = 100,
+    holds_lease=None,
+) -> int:
+    """
+    Fires every due timeout, a batch at a time.
+
+    :param holds_lease: Optional. Callable telling whether this process may still
+        fire timeouts, see fire_due_timeouts
+    :return: number of conversations read
+    """
+    session = session_factory()
+    try:
+        total = 0
+        while True:
+            fired = fire_due_timeouts(
+                session,
+                viber,
+                scheduler,
+                policy,
+                batch_size=batch_size,
+                holds_lease=holds_lease,
+            )
+            total += fired
+            if fired < batch_size:
+                return total
+    finally:
+        session.close()
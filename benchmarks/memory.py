@@ -0,0 +1,46 @@
+"""
+Memory held per parsed webhook event and per queued outbound message.
+
+Each case keeps many objects alive and divides the traced allocation by their
+number.
+
+    python -m benchmarks.memory [count]
+"""
+import sys
+import tracemalloc
+
+from viberbot.api.event_type import EventType
+from viberbot.api.messages import MessageType, TextMessage
+from viberbot.api.viber_requests import create_request
+
+MESSAGE_EVENT = dict(
+    event=EventType.MESSAGE,
+    timestamp=1457764197627,
+    message_token=4912661846655238145,
+    sender=dict(id="01234567890A=", name="John McClane", avatar="http://avatar.example.com"),
+    message=dict(type=MessageType.TEXT, text="a message to the service"),
+)
+
+
+def bytes_per_object(build, count):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [build(index) for index in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / float(count)
+
+
+def main(count=20000):
+    text = "a queued reply"
+    cases = [
+        ("parsed message event", lambda index: create_request(MESSAGE_EVENT)),
+        ("queued TextMessage", lambda index: TextMessage(text=text, tracking_data="{}")),
+    ]
+    for name, build in cases:
+        print("{0:<40} {1:8.1f} bytes".format(name, bytes_per_object(build, count)))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,98 @@
+"""
+Per-event CPU cost of webhook parsing.
+
+Compares the previous request path of app.main.incoming (decode the body,
+parse it, then parse it again for message events) with a single
+parse_request call on the raw bytes, for each available JSON backend, and
+eager with lazy parsing of events whose fields are never looked at.
+
+    python -m benchmarks.parse_request [iterations]
+"""
+import json
+import sys
+import timeit
+
+from viberbot import Api, BotConfiguration
+from viberbot.api.json_backend import OrjsonBackend, StdlibJsonBackend, orjson
+from viberbot.api.viber_requests import create_request
+
+MESSAGE_EVENT = json.dumps(
+    {
+        "event": "message",
+        "timestamp": 1457764197627,
+        "message_token": 4912661846655238145,
+        "sender": {
+            "id": "01234567890A=",
+            "name": "John McClane",
+            "avatar": "http://avatar.example.com",
+            "country": "UK",
+            "language": "en",
+            "api_version": 1,
+        },
+        "message": {
+            "type": "text",
+            "text": "a message to the service " * 8,
+            "tracking_data": json.dumps({"conversation_id": 1, "flow": "ask_question"}),
+        },
+    }
+).encode("utf-8")
+
+
+DELIVERED_EVENT = json.dumps(
+    {
+        "event": "delivered",
+        "timestamp": 1457764197627,
+        "message_token": 4912661846655238145,
+        "user_id": "01234567890A=",
+    }
+).encode("utf-8")
+
+
+def double_parse(body):
+    create_request(json.loads(body.decode("utf8")))
+    return create_request(json.loads(body.decode("utf8")))
+
+
+def main(iterations=20000):
+    configuration = BotConfiguration("auth-token", "bench", "http://avatar.example.com")
+    cases = [("decode + json + parse twice", lambda: double_parse(MESSAGE_EVENT))]
+    backends = [StdlibJsonBackend] + ([OrjsonBackend] if orjson is not None else [])
+    for backend in backends:
+        viber = Api(configuration, json_backend=backend)
+        cases.append(
+            (
+                "parse_request(bytes), {0}".format(backend.name),
+                lambda viber=viber: viber.parse_request(MESSAGE_EVENT),
+            )
+        )
+
+    run(cases, iterations)
+
+    print()
+    viber = Api(configuration)
+    run(
+        [
+            ("message, eager", lambda: viber.parse_request(MESSAGE_EVENT)),
+            ("message, lazy", lambda: viber.parse_request(MESSAGE_EVENT, lazy=True)),
+            ("delivered, eager", lambda: viber.parse_request(DELIVERED_EVENT)),
+            ("delivered, lazy", lambda: viber.parse_request(DELIVERED_EVENT, lazy=True)),
+        ],
+        iterations,
+    )
+
+
+def run(cases, iterations):
+    baseline = None
+    for name, case in cases:
+        seconds = min(timeit.repeat(case, number=iterations, repeat=3))
+        per_event = seconds / iterations * 1e6
+        baseline = baseline or per_event
+        print(
+            "{0:<36} {1:8.2f} us/event  {2:5.2f}x".format(
+                name, per_event, baseline / per_event
+            )
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,93 @@
+"""
+Time to pick a responder with many users, on an in-memory SQLite database.
+
+Compares the previous selection, loading every user outside active and pending
+conversations and taking the first one in Python, with the responder
+schedulers. The users with the lowest ids are the busy ones, the worst case
+for the index walks of the schedulers.
+
+    python -m benchmarks.responder_selection [users] [busy_users]
+"""
+
+import sys
+import timeit
+
+from sqlalchemy import create_engine, insert, select, union_all
+from sqlalchemy.orm import sessionmaker
+
+from app.data_models import Base, ChatBotUser, Conversation
+from app.flows.flow_ask_question import RESPONDER_SCHEDULERS
+
+from logger import logger
+
+
+def previous_select_responder(session, asker_user_id):
+    asker_ids = (
+        select(Conversation.asker_user_id.label("user_id"))
+        .where(Conversation.asker_user_id.isnot(None))
+        .where(Conversation.status.in_(["active", "pending"]))
+    )
+    responder_ids = (
+        select(Conversation.responder_user_id.label("user_id"))
+        .where(Conversation.responder_user_id.isnot(None))
+        .where(Conversation.status.in_(["active", "pending"]))
+    )
+    combined_ids = union_all(asker_ids, responder_ids).subquery()
+    responders = (
+        session.query(ChatBotUser)
+        .filter(~ChatBotUser.user_id.in_(select(combined_ids.c.user_id)))
+        .all()
+    )
+    return next((user for user in responders if user.user_id != asker_user_id), None)
+
+
+def build_session(users, busy_users):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(ChatBotUser),
+            [
+                dict(
+                    user_id=user_id,
+                    name=f"user{user_id}",
+                    viber_id=str(user_id),
+                    # the responders of the busy users' questions
+                    open_conversations=int(user_id <= busy_users and user_id % 2 == 0),
+                )
+                for user_id in range(1, users + 1)
+            ],
+        )
+        connection.execute(
+            insert(Conversation),
+            [
+                dict(
+                    asker_user_id=user_id,
+                    responder_user_id=user_id + 1,
+                    status="active",
+                )
+                for user_id in range(1, busy_users + 1, 2)
+            ],
+        )
+    return sessionmaker(bind=engine)()
+
+
+def main(users=100000, busy_users=1000, repeat=5):
+    # the selection logs at debug level on every call
+    logger.setLevel("INFO")
+    session = build_session(users, busy_users)
+    print(f"{users} users, the first {busy_users} in active conversations")
+    cases = [
+        ("previous select_responder", lambda: previous_select_responder(session, 1))
+    ]
+    for name, scheduler_class in RESPONDER_SCHEDULERS.items():
+        scheduler = scheduler_class()
+        cases.append((name, lambda scheduler=scheduler: scheduler.select(session, [1])))
+    for name, select_responder in cases:
+        session.expunge_all()
+        seconds = min(timeit.repeat(select_responder, number=1, repeat=repeat))
+        print("{0:<28} {1:10.2f} ms".format(name, seconds * 1000))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,228 @@
+"""
+Webhook throughput of the Flask WSGI app and the ASGI app side by side.
+
+Two paths are measured, with the Viber API replaced by a fixed latency:
+
+- greeting: conversation_started events, answered with one Viber API call. In
+  the ASGI app this runs on the event loop with AsyncApi.
+- message: message events of many users, whose flow makes one Viber API call.
+  The flows are synchronous in both apps and run on the EventScheduler lanes,
+  the ASGI app only awaits them, so its gain here is bounded by the lanes.
+
+The WSGI app runs on as many threads as a gunicorn gthread worker, the ASGI
+app on one event loop, and both get the same number of concurrent calls.
+
+    python -m benchmarks.webhook_load [requests] [concurrency] [latency_ms] [wsgi_threads] [lanes]
+"""
+
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, Response, request
+
+from viberbot import Api, AsyncApi, BotConfiguration
+from viberbot.api.messages.text_message import TextMessage
+from viberbot.api.signature_verifier import SignatureVerifier
+from viberbot.api.viber_requests import ViberMessageRequest
+
+from app.asgi import AsgiApp
+from app.event_processing import EventScheduler
+from app.message_dedup import MemoryDedupStore
+
+BOT_CONFIGURATION = BotConfiguration(
+    "auth-token-sample", "FoxBot", "http://avatars.com/"
+)
+USERS = 100
+
+
+def greeting_body(index):
+    return json.dumps(
+        {
+            "event": "conversation_started",
+            "timestamp": 1457764197627,
+            "message_token": index,
+            "type": "open",
+            "user": {"id": f"user-{index % USERS}", "name": "John McClane"},
+            "subscribed": False,
+        }
+    ).encode("utf-8")
+
+
+def message_body(index):
+    return json.dumps(
+        {
+            "event": "message",
+            "timestamp": 1457764197627,
+            "message_token": index,
+            "sender": {"id": f"user-{index % USERS}", "name": "John McClane"},
+            "message": {"type": "text", "text": "labas"},
+        }
+    ).encode("utf-8")
+
+
+def signed_bodies(build_body, requests):
+    verifier = SignatureVerifier(BOT_CONFIGURATION.auth_token)
+    bodies = [build_body(index) for index in range(requests)]
+    return [(body, verifier.signature(body)) for body in bodies]
+
+
+class AsyncMemoryDedupStore(MemoryDedupStore):
+    async def claim(self, message_token):
+        return super().claim(message_token)
+
+    async def release(self, message_token):
+        super().release(message_token)
+
+
+def flow_viber(latency):
+    viber = Api(BOT_CONFIGURATION)
+
+    def post_request(endpoint, payload, receiver=None):
+        time.sleep(latency)
+        return dict(status=0, status_message="ok", message_token=1)
+
+    viber._request_sender.post_request = post_request
+    return viber
+
+
+def flow_scheduler(viber, lanes):
+    # a message flow answering with one message, as the ask question flow does
+    def process_message(viber_request):
+        viber.send_messages(viber_request.sender.id, [TextMessage(text="ačiū")])
+
+    return EventScheduler(process_message, lanes=lanes)
+
+
+def wsgi_app(latency, lanes):
+    viber = flow_viber(latency)
+    event_scheduler = flow_scheduler(viber, lanes)
+    app = Flask(__name__)
+
+    # the greeting and message paths of app.main.incoming
+    @app.route("/", methods=["POST"])
+    def incoming():
+        body = request.get_data()
+        if not viber.verify_signature(
+            body, request.headers.get("X-Viber-Content-Signature")
+        ):
+            return Response(status=403)
+        viber_request = viber.parse_request(body, lazy=True)
+        if isinstance(viber_request, ViberMessageRequest):
+            event_scheduler.submit(viber_request).result()
+        else:
+            viber.send_messages(
+                viber_request.user.id,
+                [TextMessage(None, None, viber_request.event_type)],
+            )
+        return Response(status=200)
+
+    return app, event_scheduler
+
+
+def asgi_app(latency, lanes):
+    viber = AsyncApi(BOT_CONFIGURATION)
+
+    async def post_request(endpoint, payload, receiver=None):
+        await asyncio.sleep(latency)
+        return dict(status=0, status_message="ok", message_token=1)
+
+    viber._request_sender.post_request = post_request
+    synchronous_viber = flow_viber(latency)
+    return AsgiApp(
+        viber,
+        None,
+        flow_scheduler(synchronous_viber, lanes),
+        AsyncMemoryDedupStore(),
+        flow_viber=synchronous_viber,
+    )
+
+
+def run_wsgi(bodies, concurrency, latency, threads, lanes):
+    app, event_scheduler = wsgi_app(latency, lanes)
+
+    def call(signed_body):
+        body, signature = signed_body
+        started = time.perf_counter()
+        response = app.test_client().post(
+            "/", data=body, headers={"X-Viber-Content-Signature": signature}
+        )
+        assert response.status_code == 200
+        return time.perf_counter() - started
+
+    # calls beyond the worker threads wait for a free thread, as in gunicorn
+    with ThreadPoolExecutor(max_workers=min(concurrency, threads)) as executor:
+        started = time.perf_counter()
+        latencies = list(executor.map(call, bodies))
+        elapsed = time.perf_counter() - started
+    event_scheduler.close()
+    return elapsed, latencies
+
+
+def run_asgi(bodies, concurrency, latency, lanes):
+    app = asgi_app(latency, lanes)
+
+    async def call(slots, signed_body):
+        body, signature = signed_body
+        headers = [(b"x-viber-content-signature", signature.encode("ascii"))]
+        scope = {"type": "http", "method": "POST", "path": "/", "headers": headers}
+        async with slots:
+            started = time.perf_counter()
+            sent = []
+
+            async def receive():
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            async def send(message):
+                sent.append(message)
+
+            await app(scope, receive, send)
+            assert sent[0]["status"] == 200
+            return time.perf_counter() - started
+
+    async def run():
+        slots = asyncio.Semaphore(concurrency)
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*[call(slots, body) for body in bodies])
+        elapsed = time.perf_counter() - started
+        await app.close()
+        return elapsed, latencies
+
+    return asyncio.run(run())
+
+
+def report(name, elapsed, latencies):
+    latencies = sorted(latencies)
+    print(
+        "{0:<36} {1:8.1f} req/s   p50 {2:7.1f} ms   p99 {3:7.1f} ms".format(
+            name,
+            len(latencies) / elapsed,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000,
+        )
+    )
+
+
+def main(requests=2000, concurrency=200, latency_ms=50, wsgi_threads=8, lanes=8):
+    latency = latency_ms / 1000.0
+    print(
+        "{0} webhook calls, {1} concurrent, Viber API latency {2} ms, {3} lanes".format(
+            requests, concurrency, latency_ms, lanes
+        )
+    )
+    for path, build_body in (("greeting", greeting_body), ("message", message_body)):
+        bodies = signed_bodies(build_body, requests)
+        report(
+            "{0}: WSGI, {1} threads".format(path, wsgi_threads),
+            *run_wsgi(bodies, concurrency, latency, wsgi_threads, lanes),
+        )
+        report(
+            "{0}: ASGI, one event loop".format(path),
+            *run_asgi(bodies, concurrency, latency, lanes),
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,10 @@
+# Loaded by gunicorn from the working directory.
+
+
+def post_worker_init(worker):
+    # every worker competes for the lease of the periodic jobs, one of them runs them
+    worker.wsgi.extensions["foxbot"].background_jobs.start()
+
+
+def worker_exit(server, worker):
+    worker.wsgi.extensions["foxbot"].close()
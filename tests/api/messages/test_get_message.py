@@ -10,6 +10,7 @@ from viberbot.api.messages import PictureMessage
 from viberbot.api.messages import TextMessage
 from viberbot.api.messages import URLMessage
 from viberbot.api.messages import VideoMessage
+from viberbot.api.messages import MESSAGE_TYPE_TO_CLASS
 from viberbot.api.messages import get_message
 
 
@@ -219,3 +220,8 @@ def test_get_message_missing_type():
 
 		get_message(json.loads(message_data))
 		assert exc.value.message.startswith("message data doesn't contain a type")
+
+
+@pytest.mark.parametrize("message_class", list(MESSAGE_TYPE_TO_CLASS.values()))
+def test_messages_have_no_instance_dict(message_class):
+	assert not hasattr(message_class(), '__dict__')
@@ -1,9 +1,16 @@
+import json
 import os
+import threading
+import time
 
 import pytest
 
 from viberbot import Api
 from viberbot import BotConfiguration
+from viberbot.api.event_type import EventType
+from viberbot.api.json_backend import StdlibJsonBackend, default_backend
+from viberbot.api.messages import TextMessage
+from viberbot.api.send_result import SendResult
 from viberbot.api.viber_requests import ViberMessageRequest
 
 VIBER_BOT_CONFIGURATION = BotConfiguration(
@@ -31,6 +38,18 @@ def test_verify_signature_failure():
     assert not viber.verify_signature(message, invalid_signature)
 
 
+@pytest.mark.parametrize("wrap", [bytes, bytearray, memoryview])
+def test_verify_signature_on_raw_body(wrap):
+    valid_signature = "d21b343448c8aee33b8e93768ef6ceb64a6ba6163099973a2b8bd028fea510ef"
+    message = b'{"event":"webhook","timestamp":4977069964384421269,"message_token":1478683725125}'
+
+    viber = Api(VIBER_BOT_CONFIGURATION)
+    assert viber.verify_signature(wrap(message), valid_signature)
+    assert viber.verify_signature(wrap(message), valid_signature)
+    assert not viber.verify_signature(wrap(message), None)
+    assert not viber.verify_signature(wrap(message), "ä" * 64)
+
+
 def test_parse_request_not_json():
     viber = Api(VIBER_BOT_CONFIGURATION)
 
@@ -50,3 +69,264 @@ def test_parse_request_unicode():
         req = f.read()
         viber_request = viber.parse_request(req)
         assert isinstance(viber_request, ViberMessageRequest)
+
+
+@pytest.mark.parametrize("json_backend", [StdlibJsonBackend, default_backend()])
+@pytest.mark.parametrize("wrap", [bytes, bytearray, memoryview])
+def test_parse_request_from_raw_body(json_backend, wrap):
+    viber = Api(VIBER_BOT_CONFIGURATION, json_backend=json_backend)
+
+    with open(
+        os.path.join(
+            os.path.dirname(os.path.realpath(__file__)), "test_data", "unicode_request"
+        ),
+        "rb",
+    ) as f:
+        viber_request = viber.parse_request(wrap(f.read()))
+
+    assert isinstance(viber_request, ViberMessageRequest)
+    assert viber_request.sender.id == "01234567890A="
+
+
+def test_parse_request_skips_unsubscribed_events():
+    viber = Api(
+        VIBER_BOT_CONFIGURATION,
+        subscribed_events=[EventType.MESSAGE, EventType.SUBSCRIBED],
+    )
+    seen = b'{"event":"seen","timestamp":1457764197627,"message_token":1,"user_id":"01234567890A="}'
+    webhook = b'{"event": "webhook", "timestamp": 4977069964384421269, "message_token": 1}'
+
+    assert viber.parse_request(seen) is None
+    assert viber.parse_request(memoryview(seen)) is None
+    assert viber.parse_request(webhook).event_type == EventType.WEBHOOK
+    assert viber.skipped_events == {EventType.SEEN: 2}
+
+
+def test_peek_event_type_ignores_escaped_event_in_values():
+    body = '{"message": {"text": "{\\"event\\": \\"seen\\"}"}, "event": "message"}'
+
+    assert json.loads(body)["event"] == "message"
+    assert Api.peek_event_type(body) == "message"
+    assert Api.peek_event_type(b'{"timestamp": 1}') is None
+
+
+def test_set_webhook_defaults_to_subscribed_events_and_reports_mismatch(caplog):
+    viber = Api(
+        VIBER_BOT_CONFIGURATION,
+        subscribed_events=[EventType.MESSAGE, EventType.DELIVERED, EventType.WEBHOOK],
+    )
+    requested = []
+
+    def set_webhook(url, webhook_events=None, is_inline=False):
+        requested.append(webhook_events)
+        return [EventType.SEEN]
+
+    viber._request_sender.set_webhook = set_webhook
+
+    assert viber.set_webhook("https://example.com") == [EventType.SEEN]
+    assert requested == [[EventType.DELIVERED]]
+    assert "not subscribed and will be skipped: ['seen']" in caplog.text
+    assert "will not send subscribed events: ['delivered']" in caplog.text
+
+
+def test_set_webhook_leaves_out_mandatory_events(caplog):
+    viber = Api(
+        VIBER_BOT_CONFIGURATION,
+        subscribed_events=[EventType.MESSAGE, EventType.SUBSCRIBED, EventType.SEEN],
+    )
+    requested = []
+
+    def set_webhook(url, webhook_events=None, is_inline=False):
+        requested.append(webhook_events)
+        return [EventType.SEEN]
+
+    viber._request_sender.set_webhook = set_webhook
+    viber.set_webhook("https://example.com")
+
+    assert requested == [[EventType.SEEN]]
+    assert "will not send subscribed events" not in caplog.text
+
+
+def test_send_messages_concurrent_keeps_input_order():
+    def post_request(endpoint, payload, receiver=None):
+        text = json.loads(payload)["text"]
+        if text == "2":
+            return dict(status=1, status_message="failed")
+        return dict(status=0, message_token="token-" + text)
+
+    viber = Api(VIBER_BOT_CONFIGURATION, max_workers=4)
+    viber._request_sender.post_request = post_request
+
+    result = viber.send_messages(
+        "012345A=", [TextMessage(text=str(i)) for i in range(5)], concurrent=True
+    ).wait()
+    viber.close()
+
+    assert isinstance(result, SendResult)
+    assert result.tokens == ["token-0", "token-1", None, "token-3", "token-4"]
+    assert list(result.errors.keys()) == [2]
+    assert not result.ok
+
+
+def test_send_messages_concurrent_delivers_every_message_in_order():
+    # the two receivers hash to different lanes of 8
+    receivers = ["012345A=", "543210B="]
+    lock = threading.Lock()
+    delivered = {receiver: [] for receiver in receivers}
+    in_flight = set()
+    overlapped = []
+
+    def post_request(endpoint, payload, receiver=None):
+        data = json.loads(payload)
+        with lock:
+            in_flight.add(data["receiver"])
+            overlapped.append(len(in_flight) > 1)
+        # later messages answer faster, reordering any that are sent at once
+        time.sleep(0.002 * (20 - int(data["text"])))
+        with lock:
+            in_flight.discard(data["receiver"])
+            delivered[data["receiver"]].append(int(data["text"]))
+        return dict(status=0, message_token=data["text"])
+
+    viber = Api(VIBER_BOT_CONFIGURATION, max_workers=8)
+    viber._request_sender.post_request = post_request
+    messages = [TextMessage(text=str(i)) for i in range(20)]
+
+    callers = [
+        threading.Thread(
+            target=viber.send_messages,
+            args=(receiver, messages),
+            kwargs=dict(concurrent=True),
+        )
+        for receiver in receivers
+    ]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+    viber.close()
+
+    assert delivered == {receiver: list(range(20)) for receiver in receivers}
+    assert any(overlapped)
+
+
+def test_send_messages_concurrent_returns_after_the_first_message():
+    release = threading.Event()
+
+    def post_request(endpoint, payload, receiver=None):
+        text = json.loads(payload)["text"]
+        if text != "0":
+            assert release.wait(5)
+        return dict(status=0, message_token=text)
+
+    viber = Api(VIBER_BOT_CONFIGURATION)
+    viber._request_sender.post_request = post_request
+
+    result = viber.send_messages(
+        "012345A=", [TextMessage(text=str(i)) for i in range(3)], concurrent=True
+    )
+    assert result.tokens == ["0", None, None]
+    assert result.pending == [1, 2]
+    assert not result.ok
+
+    release.set()
+    assert result.wait(timeout=5).tokens == ["0", "1", "2"]
+    assert result.ok
+    viber.close()
+
+
+def test_send_messages_concurrent_does_not_overtake_dispatched_messages():
+    release = threading.Event()
+    delivered = []
+
+    def post_request(endpoint, payload, receiver=None):
+        text = json.loads(payload)["text"]
+        if text == "dispatched":
+            assert release.wait(5)
+        delivered.append(text)
+        return dict(status=0, message_token=text)
+
+    viber = Api(VIBER_BOT_CONFIGURATION)
+    viber._request_sender.post_request = post_request
+
+    viber.dispatch_messages("012345A=", [TextMessage(text="dispatched")])
+    result = viber.send_messages(
+        "012345A=", [TextMessage(text="0"), TextMessage(text="1")], concurrent=True
+    )
+    release.set()
+    result.wait(timeout=5)
+    viber.close()
+
+    assert delivered == ["dispatched", "0", "1"]
+
+
+def test_send_messages_concurrent_from_a_lane_sends_in_place():
+    def post_request(endpoint, payload, receiver=None):
+        return dict(status=0, message_token=json.loads(payload)["text"])
+
+    viber = Api(VIBER_BOT_CONFIGURATION, max_workers=1)
+    viber._request_sender.post_request = post_request
+    messages = [TextMessage(text=str(i)) for i in range(3)]
+
+    # every receiver shares the single lane, waiting on it from the lane deadlocks
+    result = (
+        viber._get_dispatcher()
+        .submit(
+            "012345A=",
+            lambda: viber.send_messages("543210B=", messages, concurrent=True),
+        )
+        .result(timeout=5)
+    )
+    viber.close()
+
+    assert result.pending == []
+    assert result.tokens == ["0", "1", "2"]
+
+
+def test_post_messages_to_public_account_concurrent():
+    def post_request(endpoint, payload, receiver=None):
+        return dict(status=0, message_token=json.loads(payload)["text"])
+
+    viber = Api(VIBER_BOT_CONFIGURATION)
+    viber._request_sender.post_request = post_request
+
+    result = viber.post_messages_to_public_account(
+        "012345A=", [TextMessage(text="a"), TextMessage(text=None)], concurrent=True
+    ).wait()
+    viber.close()
+
+    assert result.tokens == ["a", None]
+    assert 1 in result.errors
+
+
+def test_broadcast_messages_chunks_and_merges_failed_list():
+    receivers = ["user-{0}".format(i) for i in range(650)]
+    lock = threading.Lock()
+    chunk_sizes = []
+
+    def post_request(endpoint, payload, receiver=None):
+        broadcast_list = json.loads(payload)["broadcast_list"]
+        with lock:
+            chunk_sizes.append(len(broadcast_list))
+        if broadcast_list[0] == "user-600":
+            return dict(status=1, status_message="failed")
+        return dict(
+            status=0,
+            message_token=broadcast_list[0],
+            failed_list=[
+                dict(receiver=broadcast_list[-1], status=6, status_message="Not subscribed")
+            ],
+        )
+
+    viber = Api(VIBER_BOT_CONFIGURATION)
+    viber._request_sender.post_request = post_request
+
+    result = viber.broadcast_messages(receivers, TextMessage(text="hi!"))
+    viber.close()
+
+    assert sorted(chunk_sizes) == [50, 300, 300]
+    assert result.message_tokens == ["user-0", "user-300", None]
+    assert [failed["receiver"] for failed in result.failed_list] == ["user-299", "user-599"]
+    assert list(result.errors.keys()) == [2]
+    assert result.failed_receivers == ["user-299", "user-599"] + receivers[600:]
+    assert not result.ok
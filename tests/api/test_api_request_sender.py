@@ -53,7 +53,7 @@ def test_set_webhook_failure():
 
 
 def test_post_request_success(monkeypatch):
-	def callback(endpoint, data, headers):
+	def callback(session, endpoint, data, headers, timeout):
 		request = json.loads(data)
 		assert endpoint == VIBER_BOT_API_URL + "/" + BOT_API_ENDPOINT.GET_ACCOUNT_INFO
 		assert request['auth_token'] == VIBER_BOT_CONFIGURATION.auth_token
@@ -64,14 +64,14 @@ def test_post_request_success(monkeypatch):
 
 		return response
 
-	monkeypatch.setattr("requests.post", callback)
+	monkeypatch.setattr("requests.Session.post", callback)
 
 	request_sender = ApiRequestSender(logging.getLogger(), VIBER_BOT_API_URL, VIBER_BOT_CONFIGURATION, VIBER_BOT_USER_AGENT)
 	request_sender.get_account_info()
 
 
 def test_post_request_json_exception(monkeypatch):
-	def callback(endpoint, data, headers):
+	def callback(session, endpoint, data, headers, timeout):
 		request = json.loads(data)
 		assert endpoint == VIBER_BOT_API_URL + "/" + BOT_API_ENDPOINT.GET_ACCOUNT_INFO
 		assert request['auth_token'] == VIBER_BOT_CONFIGURATION.auth_token
@@ -82,7 +82,7 @@ def test_post_request_json_exception(monkeypatch):
 
 		return response
 
-	monkeypatch.setattr("requests.post", callback)
+	monkeypatch.setattr("requests.Session.post", callback)
 	request_sender = ApiRequestSender(logging.getLogger(), VIBER_BOT_API_URL, VIBER_BOT_CONFIGURATION, VIBER_BOT_USER_AGENT)
 
 	with pytest.raises(Exception) as exc:
@@ -90,7 +90,7 @@ def test_post_request_json_exception(monkeypatch):
 
 
 def test_get_online_status_fail(monkeypatch):
-	def callback(endpoint, data, headers):
+	def callback(session, endpoint, data, headers, timeout):
 		request = json.loads(data)
 		assert endpoint == VIBER_BOT_API_URL + "/" + BOT_API_ENDPOINT.GET_ONLINE
 		assert request['auth_token'] == VIBER_BOT_CONFIGURATION.auth_token
@@ -101,7 +101,7 @@ def test_get_online_status_fail(monkeypatch):
 
 		return response
 
-	monkeypatch.setattr("requests.post", callback)
+	monkeypatch.setattr("requests.Session.post", callback)
 	request_sender = ApiRequestSender(logging.getLogger(), VIBER_BOT_API_URL, VIBER_BOT_CONFIGURATION, VIBER_BOT_USER_AGENT)
 
 	with pytest.raises(Exception) as exc:
@@ -111,7 +111,7 @@ def test_get_online_status_fail(monkeypatch):
 
 
 def test_get_online_missing_ids(monkeypatch):
-	monkeypatch.setattr("requests.post", stub)
+	monkeypatch.setattr("requests.Session.post", stub)
 	request_sender = ApiRequestSender(logging.getLogger(), VIBER_BOT_API_URL, VIBER_BOT_CONFIGURATION, VIBER_BOT_USER_AGENT)
 
 	with pytest.raises(Exception) as exc:
@@ -121,7 +121,7 @@ def test_get_online_missing_ids(monkeypatch):
 
 
 def test_get_online_success(monkeypatch):
-	def callback(endpoint, data, headers):
+	def callback(session, endpoint, data, headers, timeout):
 		request = json.loads(data)
 		assert endpoint == VIBER_BOT_API_URL + "/" + BOT_API_ENDPOINT.GET_ONLINE
 		assert request['auth_token'] == VIBER_BOT_CONFIGURATION.auth_token
@@ -131,14 +131,14 @@ def test_get_online_success(monkeypatch):
 
 		return response
 
-	monkeypatch.setattr("requests.post", callback)
+	monkeypatch.setattr("requests.Session.post", callback)
 	request_sender = ApiRequestSender(logging.getLogger(), VIBER_BOT_API_URL, VIBER_BOT_CONFIGURATION, VIBER_BOT_USER_AGENT)
 
 	request_sender.get_online_status(ids=["03249305A="])
 
 
 def test_get_user_details_success(monkeypatch):
-	def callback(endpoint, data, headers):
+	def callback(session, endpoint, data, headers, timeout):
 		request = json.loads(data)
 		assert endpoint == VIBER_BOT_API_URL + "/" + BOT_API_ENDPOINT.GET_USER_DETAILS
 		assert request['auth_token'] == VIBER_BOT_CONFIGURATION.auth_token
@@ -148,7 +148,7 @@ def test_get_user_details_success(monkeypatch):
 
 		return response
 
-	monkeypatch.setattr("requests.post", callback)
+	monkeypatch.setattr("requests.Session.post", callback)
 	request_sender = ApiRequestSender(logging.getLogger(), VIBER_BOT_API_URL, VIBER_BOT_CONFIGURATION, VIBER_BOT_USER_AGENT)
 
 	request_sender.get_user_details(user_id="03249305A=")
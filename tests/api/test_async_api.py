@@ -0,0 +1,250 @@
+import asyncio
+import json
+
+import pytest
+import requests
+
+from viberbot import AsyncApi
+from viberbot import BotConfiguration
+from viberbot.api.circuit_breaker import CircuitBreaker, CircuitOpenError
+from viberbot.api.consts import BOT_API_ENDPOINT
+from viberbot.api.deferred_queue import DeferredQueue
+from viberbot.api.event_type import EventType
+from viberbot.api.messages import TextMessage
+from viberbot.api.transport import AsyncTransportResponse
+from viberbot.api.viber_requests import ViberMessageRequest
+
+VIBER_BOT_CONFIGURATION = BotConfiguration("auth-token-sample", "testbot", "http://avatars.com/")
+
+
+def test_send_messages_sanity():
+	to = "012345A="
+	sent = []
+
+	async def post_request(endpoint, payload, receiver=None):
+		data = json.loads(payload)
+		assert endpoint == BOT_API_ENDPOINT.SEND_MESSAGE
+		assert data['auth_token'] == VIBER_BOT_CONFIGURATION.auth_token
+		assert data['receiver'] == to
+		sent.append(data['text'])
+		return dict(status=0, message_token=len(sent))
+
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION)
+	viber._request_sender.post_request = post_request
+
+	tokens = asyncio.run(viber.send_messages(to, [TextMessage(text="1"), TextMessage(text="2")]))
+
+	assert tokens == [1, 2]
+	assert sent == ["1", "2"]
+
+
+def test_send_messages_failed():
+	async def post_request(endpoint, payload, receiver=None):
+		return dict(status=1, status_message="failed")
+
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION)
+	viber._request_sender.post_request = post_request
+
+	with pytest.raises(Exception) as exc:
+		asyncio.run(viber.send_messages("012345A=", TextMessage(text="hi!")))
+
+	assert str(exc.value).startswith("failed with status: 1, message: failed")
+
+
+def test_set_webhook_sanity():
+	webhook_events = [EventType.DELIVERED, EventType.SEEN]
+
+	async def post_request(endpoint, payload, receiver=None):
+		request = json.loads(payload)
+		assert endpoint == BOT_API_ENDPOINT.SET_WEBHOOK
+		assert request['event_types'] == webhook_events
+		return dict(status=0, event_types=webhook_events)
+
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION)
+	viber._request_sender.post_request = post_request
+
+	assert asyncio.run(viber.set_webhook("http://sample.url.com", webhook_events)) == webhook_events
+
+
+def test_get_user_details_and_online():
+	async def post_request(endpoint, payload, receiver=None):
+		if endpoint == BOT_API_ENDPOINT.GET_USER_DETAILS:
+			return dict(status=0, user={'id': json.loads(payload)['id']})
+		return dict(status=0, users=[{'id': i} for i in json.loads(payload)['ids']])
+
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION)
+	viber._request_sender.post_request = post_request
+
+	assert asyncio.run(viber.get_user_details("01A=")) == {'id': "01A="}
+	assert asyncio.run(viber.get_online(["01A=", "02A="])) == [{'id': "01A="}, {'id': "02A="}]
+
+
+def test_post_request_through_transport():
+	class Transport(object):
+		async def post(self, url, data, headers):
+			assert url.endswith('/' + BOT_API_ENDPOINT.GET_ACCOUNT_INFO)
+			return AsyncTransportResponse(url, 200, "{\"status\": 0, \"name\": \"testbot\"}")
+
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION, transport=Transport())
+
+	assert asyncio.run(viber.get_account_info())['name'] == "testbot"
+
+
+def test_post_request_http_error():
+	class Transport(object):
+		async def post(self, url, data, headers):
+			return AsyncTransportResponse(url, 503, "")
+
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION, transport=Transport())
+
+	with pytest.raises(requests.HTTPError) as exc:
+		asyncio.run(viber.get_account_info())
+
+	assert exc.value.response.status_code == 503
+
+
+def test_cancelled_trial_call_lets_the_circuit_close():
+	circuit = CircuitBreaker(minimum_calls=1, open_timeout=0)
+	circuit.record_failure()
+	calls = []
+
+	class Transport(object):
+		async def post(self, url, data, headers):
+			calls.append(url)
+			if len(calls) == 1:
+				await asyncio.sleep(10)
+			return AsyncTransportResponse(url, 200, "{\"status\": 0, \"name\": \"testbot\"}")
+
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION, transport=Transport(), circuit_breaker=circuit)
+
+	async def run():
+		trial = asyncio.ensure_future(viber.get_account_info())
+		await asyncio.sleep(0.01)
+		trial.cancel()
+		with pytest.raises(asyncio.CancelledError):
+			await trial
+		return await viber.get_account_info()
+
+	assert asyncio.run(run())['name'] == "testbot"
+	assert circuit.state == CircuitBreaker.CLOSED
+
+
+def test_parse_request_is_shared():
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION)
+	request = viber.parse_request(json.dumps(dict(
+		event=EventType.MESSAGE,
+		timestamp=1457764197627,
+		message_token=4912661846655238145,
+		sender=dict(id="01234567890A=", name="viberUser"),
+		message=dict(type="text", text="HI!"))))
+
+	assert isinstance(request, ViberMessageRequest)
+
+
+def test_send_messages_concurrent():
+	async def post_request(endpoint, payload, receiver=None):
+		text = json.loads(payload)['text']
+		if text == "1":
+			return dict(status=1, status_message="failed")
+		return dict(status=0, message_token=text)
+
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION)
+	viber._request_sender.post_request = post_request
+
+	async def send():
+		result = await viber.send_messages(
+			"012345A=", [TextMessage(text=str(i)) for i in range(3)], concurrent=True)
+		assert result.pending == [1, 2]
+		return await result.wait_async()
+
+	result = asyncio.run(send())
+
+	assert result.tokens == ["0", None, "2"]
+	assert list(result.errors.keys()) == [1]
+
+
+def test_send_messages_concurrent_from_a_lane_sends_in_place():
+	async def post_request(endpoint, payload, receiver=None):
+		return dict(status=0, message_token=json.loads(payload)['text'])
+
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION, lanes=1)
+	viber._request_sender.post_request = post_request
+	messages = [TextMessage(text=str(i)) for i in range(3)]
+
+	async def send_from_lane():
+		# every receiver shares the single lane, awaiting it from the lane deadlocks
+		result = await asyncio.wait_for(viber._dispatcher.submit(
+			"012345A=", viber.send_messages, "543210B=", messages, None, True), 5)
+		await viber.close()
+		return result
+
+	result = asyncio.run(send_from_lane())
+
+	assert result.pending == []
+	assert result.tokens == ["0", "1", "2"]
+
+
+def test_send_messages_concurrent_delivers_every_message_in_order():
+	receivers = ["012345A=", "543210B="]
+	delivered = {receiver: [] for receiver in receivers}
+
+	async def post_request(endpoint, payload, receiver=None):
+		data = json.loads(payload)
+		# later messages answer faster, reordering any that are sent at once
+		await asyncio.sleep(0.001 * (20 - int(data['text'])))
+		delivered[data['receiver']].append(int(data['text']))
+		return dict(status=0, message_token=data['text'])
+
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION)
+	viber._request_sender.post_request = post_request
+	messages = [TextMessage(text=str(i)) for i in range(20)]
+
+	async def send_to_all():
+		results = await asyncio.gather(*[
+			viber.send_messages(receiver, messages, concurrent=True) for receiver in receivers])
+		for result in results:
+			await result.wait_async()
+		await viber.close()
+		return results
+
+	results = asyncio.run(send_to_all())
+
+	assert [result.tokens for result in results] == [[str(i) for i in range(20)]] * 2
+	assert delivered == {receiver: list(range(20)) for receiver in receivers}
+
+
+def test_deferred_sends_are_replayed_before_the_next_send():
+	sent = []
+	circuit_open = [True]
+
+	async def post_request(endpoint, payload, receiver=None):
+		if circuit_open[0]:
+			raise CircuitOpenError("circuit open")
+		sent.append(json.loads(payload)['text'])
+		return dict(status=0, message_token=len(sent))
+
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION, deferred_queue=DeferredQueue())
+	viber._request_sender.post_request = post_request
+
+	async def send():
+		deferred_tokens = await viber.send_messages("012345A=", [TextMessage(text="1"), TextMessage(text="2")])
+		circuit_open[0] = False
+		return deferred_tokens, await viber.send_messages("012345A=", [TextMessage(text="3")])
+
+	assert asyncio.run(send()) == ([None, None], [3])
+	assert sent == ["1", "2", "3"]
+
+
+def test_broadcast_messages():
+	async def post_request(endpoint, payload, receiver=None):
+		broadcast_list = json.loads(payload)['broadcast_list']
+		assert endpoint == BOT_API_ENDPOINT.BROADCAST_MESSAGE
+		return dict(status=0, message_token=len(broadcast_list), failed_list=[])
+
+	viber = AsyncApi(VIBER_BOT_CONFIGURATION)
+	viber._request_sender.post_request = post_request
+
+	result = asyncio.run(viber.broadcast_messages([str(i) for i in range(301)], TextMessage(text="hi!")))
+
+	assert result.message_tokens == [300, 1]
+	assert result.ok
@@ -0,0 +1,255 @@
+import json
+import logging
+import pytest
+import requests
+
+from viberbot import Api
+from viberbot import BotConfiguration
+from viberbot.api.api_request_sender import ApiRequestSender
+from viberbot.api.circuit_breaker import CircuitBreaker, CircuitOpenError
+from viberbot.api.consts import BOT_API_ENDPOINT, VIBER_BOT_USER_AGENT
+from viberbot.api.deferred_queue import DeferredQueue
+from viberbot.api.messages import TextMessage
+from viberbot.api.retry_policy import NO_RETRY
+
+VIBER_BOT_API_URL = "http://site.com"
+VIBER_BOT_CONFIGURATION = BotConfiguration("auth-token-sample", "testbot", "http://avatars.com/")
+
+
+class Stub(object): pass
+
+
+def stub(*args): pass
+
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 0.0
+
+	def __call__(self):
+		return self.now
+
+
+def breaker(clock, **kwargs):
+	return CircuitBreaker(window_size=4, minimum_calls=4, failure_rate_threshold=0.5, open_timeout=10, clock=clock,
+		**kwargs)
+
+
+def test_opens_on_failure_rate():
+	clock = FakeClock()
+	circuit = breaker(clock)
+
+	for success in [True, False, True]:
+		circuit.before_call()
+		circuit.record_success() if success else circuit.record_failure()
+	assert circuit.state == CircuitBreaker.CLOSED
+
+	circuit.before_call()
+	circuit.record_failure()
+	assert circuit.state == CircuitBreaker.OPEN
+
+	with pytest.raises(CircuitOpenError):
+		circuit.before_call()
+
+
+def test_slow_calls_count_as_failures():
+	clock = FakeClock()
+	circuit = breaker(clock, slow_call_duration=1.0)
+
+	for _ in range(4):
+		circuit.before_call()
+		circuit.record_success(duration=2.0)
+
+	assert circuit.state == CircuitBreaker.OPEN
+
+
+def test_half_open_trial_closes_circuit():
+	clock = FakeClock()
+	circuit = breaker(clock)
+	for _ in range(4):
+		circuit.record_failure()
+
+	clock.now += 10
+	assert circuit.state == CircuitBreaker.HALF_OPEN
+
+	circuit.before_call()
+	with pytest.raises(CircuitOpenError):
+		circuit.before_call()
+
+	circuit.record_success()
+	assert circuit.state == CircuitBreaker.CLOSED
+	assert circuit.failure_rate == 0.0
+
+
+def test_half_open_trial_failure_reopens_circuit():
+	clock = FakeClock()
+	circuit = breaker(clock)
+	for _ in range(4):
+		circuit.record_failure()
+
+	clock.now += 10
+	circuit.before_call()
+	circuit.record_failure()
+
+	assert circuit.state == CircuitBreaker.OPEN
+
+
+def test_interrupted_trial_call_frees_its_slot():
+	clock = FakeClock()
+	circuit = breaker(clock)
+	for _ in range(4):
+		circuit.record_failure()
+	clock.now += 10
+
+	class WorkerTimeout(BaseException):
+		pass
+
+	class Transport(object):
+		def post(self, url, data, headers):
+			raise WorkerTimeout()
+
+	request_sender = ApiRequestSender(
+		logging.getLogger(), VIBER_BOT_API_URL, VIBER_BOT_CONFIGURATION, VIBER_BOT_USER_AGENT,
+		transport=Transport(), retry_policy=NO_RETRY, circuit_breaker=circuit)
+	with pytest.raises(WorkerTimeout):
+		request_sender.post_request(BOT_API_ENDPOINT.GET_ONLINE, "{}")
+	assert circuit.state == CircuitBreaker.HALF_OPEN
+
+	circuit.before_call()
+	circuit.record_success()
+	assert circuit.state == CircuitBreaker.CLOSED
+
+
+def test_request_sender_fails_fast_when_open():
+	clock = FakeClock()
+	calls = []
+
+	class Transport(object):
+		def post(self, url, data, headers):
+			calls.append(url)
+			raise requests.ConnectionError()
+
+	request_sender = ApiRequestSender(
+		logging.getLogger(), VIBER_BOT_API_URL, VIBER_BOT_CONFIGURATION, VIBER_BOT_USER_AGENT,
+		transport=Transport(), retry_policy=NO_RETRY, circuit_breaker=breaker(clock))
+
+	for _ in range(4):
+		with pytest.raises(requests.ConnectionError):
+			request_sender.post_request(BOT_API_ENDPOINT.GET_ONLINE, "{}")
+
+	with pytest.raises(CircuitOpenError):
+		request_sender.post_request(BOT_API_ENDPOINT.GET_ONLINE, "{}")
+
+	assert len(calls) == 4
+
+
+def test_client_errors_do_not_open_circuit():
+	clock = FakeClock()
+
+	class Transport(object):
+		def post(self, url, data, headers):
+			response = Stub()
+			response.status_code = 400
+
+			def raise_for_status():
+				raise requests.HTTPError(response=response)
+
+			response.raise_for_status = raise_for_status
+			return response
+
+	request_sender = ApiRequestSender(
+		logging.getLogger(), VIBER_BOT_API_URL, VIBER_BOT_CONFIGURATION, VIBER_BOT_USER_AGENT,
+		transport=Transport(), retry_policy=NO_RETRY, circuit_breaker=breaker(clock))
+
+	for _ in range(5):
+		with pytest.raises(requests.HTTPError):
+			request_sender.post_request(BOT_API_ENDPOINT.GET_ONLINE, "{}")
+
+	assert request_sender.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_circuit_diverts_sends_to_deferred_queue():
+	clock = FakeClock()
+	circuit = breaker(clock)
+	for _ in range(4):
+		circuit.record_failure()
+	deferred = DeferredQueue()
+
+	viber = Api(VIBER_BOT_CONFIGURATION, circuit_breaker=circuit, deferred_queue=deferred)
+
+	tokens = viber.send_messages("012345A=", [TextMessage(text="hi!")])
+
+	assert tokens == [None]
+	endpoint, payload, receiver = deferred.peek()
+	assert endpoint == BOT_API_ENDPOINT.SEND_MESSAGE
+	assert receiver == "012345A="
+	assert json.loads(payload)['receiver'] == "012345A="
+
+
+def test_open_circuit_without_deferred_queue_raises():
+	clock = FakeClock()
+	circuit = breaker(clock)
+	for _ in range(4):
+		circuit.record_failure()
+
+	viber = Api(VIBER_BOT_CONFIGURATION, circuit_breaker=circuit)
+
+	with pytest.raises(CircuitOpenError):
+		viber.send_messages("012345A=", [TextMessage(text="hi!")])
+
+
+def deferring_viber(clock, deferred, sent):
+	circuit = breaker(clock)
+	for _ in range(4):
+		circuit.record_failure()
+
+	class Transport(object):
+		def post(self, url, data, headers):
+			sent.append(json.loads(data)['text'])
+			response = Stub()
+			response.raise_for_status = stub
+			response.text = json.dumps(dict(status=0, message_token=len(sent)))
+			return response
+
+	return Api(VIBER_BOT_CONFIGURATION, transport=Transport(), circuit_breaker=circuit, deferred_queue=deferred)
+
+
+def test_deferred_sends_are_replayed_in_order_once_the_circuit_lets_calls_through():
+	clock = FakeClock()
+	deferred = DeferredQueue()
+	sent = []
+	viber = deferring_viber(clock, deferred, sent)
+
+	assert viber.send_messages("012345A=", [TextMessage(text=str(i)) for i in range(3)]) == [None] * 3
+	assert len(deferred) == 3
+
+	clock.now += 10
+	tokens = viber.send_messages("012345A=", [TextMessage(text="3")])
+
+	assert sent == ["0", "1", "2", "3"]
+	assert tokens == [4]
+	assert len(deferred) == 0
+
+
+def test_replay_deferred_sends_without_a_new_message():
+	clock = FakeClock()
+	deferred = DeferredQueue()
+	sent = []
+	viber = deferring_viber(clock, deferred, sent)
+	viber.send_messages("012345A=", [TextMessage(text="hi!")])
+
+	assert viber.replay_deferred() == 1
+	clock.now += 10
+	assert viber.replay_deferred() == 0
+	assert sent == ["hi!"]
+
+
+def test_full_deferred_queue_raises():
+	clock = FakeClock()
+	deferred = DeferredQueue(maxsize=1)
+	viber = deferring_viber(clock, deferred, [])
+	viber.send_messages("012345A=", [TextMessage(text="kept")])
+
+	with pytest.raises(CircuitOpenError):
+		viber.send_messages("012345A=", [TextMessage(text="refused")])
+	assert len(deferred) == 1
@@ -0,0 +1,155 @@
+import threading
+
+import pytest
+
+from viberbot import Api
+from viberbot import BotConfiguration
+from viberbot.api.lookup_cache import LookupCache, TtlCache
+
+VIBER_BOT_CONFIGURATION = BotConfiguration("auth-token-sample", "testbot", "http://avatars.com/")
+
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 0.0
+
+	def __call__(self):
+		return self.now
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used():
+	clock = FakeClock()
+	cache = TtlCache(max_size=2, ttl=10, clock=clock)
+	cache.set('a', 1)
+	cache.set('b', 2)
+	assert cache.get('a') == (True, 1)
+
+	cache.set('c', 3)
+	assert cache.get('b') == (False, None)
+	assert cache.get('a') == (True, 1)
+
+	clock.now = 10
+	assert cache.get('a') == (False, None)
+	assert len(cache) == 1
+
+
+def test_user_details_are_cached_until_ttl():
+	clock = FakeClock()
+	cache = LookupCache(user_details_ttl=60, clock=clock)
+	fetched = []
+
+	def fetch(user_id):
+		fetched.append(user_id)
+		return {'id': user_id, 'name': 'name'}
+
+	assert cache.get_user_details('user1', fetch) == {'id': 'user1', 'name': 'name'}
+	cache.get_user_details('user1', fetch)
+	clock.now = 60
+	cache.get_user_details('user1', fetch)
+
+	assert fetched == ['user1', 'user1']
+	assert cache.stats['user_details_hits'] == 1
+	assert cache.stats['user_details_misses'] == 2
+
+
+def test_concurrent_user_details_lookups_share_one_request():
+	cache = LookupCache()
+	release = threading.Event()
+	fetched = []
+
+	def fetch(user_id):
+		fetched.append(user_id)
+		release.wait()
+		return {'id': user_id}
+
+	results = []
+	threads = [threading.Thread(target=lambda: results.append(cache.get_user_details('user1', fetch)))
+		for _ in range(5)]
+	for thread in threads:
+		thread.start()
+	while cache.stats.get('user_details_coalesced', 0) < 4:
+		pass
+	release.set()
+	for thread in threads:
+		thread.join()
+
+	assert fetched == ['user1']
+	assert results == [{'id': 'user1'}] * 5
+
+
+def test_failed_user_details_lookup_is_not_cached():
+	cache = LookupCache()
+	calls = []
+
+	def fetch(user_id):
+		calls.append(user_id)
+		if len(calls) == 1:
+			raise Exception("failed with status: 12")
+		return {'id': user_id}
+
+	with pytest.raises(Exception):
+		cache.get_user_details('user1', fetch)
+
+	assert cache.get_user_details('user1', fetch) == {'id': 'user1'}
+
+
+def test_get_online_batches_within_window_and_splits_at_the_id_limit():
+	requests = []
+	ids = ['user{0}'.format(index) for index in range(150)]
+	follower_result = []
+
+	def fetch(chunk):
+		requests.append(chunk)
+		return [{'id': user_id, 'online_status': 0} for user_id in chunk]
+
+	def sleep(seconds):
+		# another lookup arrives while the first one waits for the batch window
+		follower.start()
+		while cache.stats.get('online_coalesced', 0) < 1:
+			pass
+
+	cache = LookupCache(sleep=sleep)
+	follower = threading.Thread(target=lambda: follower_result.extend(cache.get_online(ids[100:] + ids[:1], fetch)))
+
+	leader_result = cache.get_online(ids[:100], fetch)
+	follower.join()
+
+	assert [len(chunk) for chunk in requests] == [100, 50]
+	assert [status['id'] for status in leader_result] == ids[:100]
+	assert [status['id'] for status in follower_result] == ids[100:] + ids[:1]
+	assert cache.stats['online_requests'] == 2
+
+
+def test_get_online_serves_cached_statuses():
+	requests = []
+
+	def fetch(chunk):
+		requests.append(chunk)
+		return [{'id': user_id, 'online_status': 0} for user_id in chunk if user_id != 'unknown']
+
+	cache = LookupCache(sleep=lambda seconds: None)
+	cache.get_online(['user1', 'unknown'], fetch)
+	result = cache.get_online(['user2', 'user1'], fetch)
+
+	assert requests == [['user1', 'unknown'], ['user2']]
+	assert [status['id'] for status in result] == ['user2', 'user1']
+	assert cache.stats['online_hits'] == 1
+
+
+def test_api_uses_lookup_cache():
+	viber = Api(VIBER_BOT_CONFIGURATION, lookup_cache=LookupCache(sleep=lambda seconds: None))
+	calls = []
+
+	def get_user_details(user_id):
+		calls.append(user_id)
+		return {'id': user_id}
+
+	viber._request_sender.get_user_details = get_user_details
+
+	assert viber.get_user_details('user1') == {'id': 'user1'}
+	assert viber.get_user_details('user1') == {'id': 'user1'}
+	assert calls == ['user1']
+	assert viber.lookup_cache.stats['user_details_hits'] == 1
+
+	with pytest.raises(Exception):
+		viber.get_online([])
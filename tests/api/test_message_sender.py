@@ -23,9 +23,10 @@ def test_send_message_sanity():
 	message_token = "a token"
 	chat_id = 'my chat id sample'
 
-	def post_request(endpoint, payload):
+	def post_request(endpoint, payload, receiver=None):
 		data = json.loads(payload)
 		assert endpoint == BOT_API_ENDPOINT.SEND_MESSAGE
+		assert receiver == to
 		assert data['auth_token'] == VIBER_BOT_CONFIGURATION.auth_token
 		assert data['receiver'] == to
 		assert data['sender']['name'] == VIBER_BOT_CONFIGURATION.name
@@ -50,7 +51,7 @@ def test_post_to_public_account_sanity():
 	text = "hi!"
 	message_token = "a token"
 
-	def post_request(endpoint, payload):
+	def post_request(endpoint, payload, receiver=None):
 		data = json.loads(payload)
 		assert endpoint == BOT_API_ENDPOINT.POST
 		assert data['auth_token'] == VIBER_BOT_CONFIGURATION.auth_token
@@ -74,7 +75,7 @@ def test_post_to_public_account_sanity():
 def test_message_invalid():
 	to = "012345A="
 
-	def post_request(endpoint, payload):
+	def post_request(endpoint, payload, receiver=None):
 		pytest.fail("message sender not supposed to call post_request")
 
 	request_sender = Stub()
@@ -93,7 +94,7 @@ def test_send_result_failed():
 	to = "012345A="
 	text = "hi!"
 
-	def post_request(endpoint, payload):
+	def post_request(endpoint, payload, receiver=None):
 		data = json.loads(payload)
 		return dict(status=1, status_message="failed")
 
@@ -113,7 +114,7 @@ def test_post_message_to_public_account_failed():
 	sender = "012345A="
 	text = "hi!"
 
-	def post_request(endpoint, payload):
+	def post_request(endpoint, payload, receiver=None):
 		data = json.loads(payload)
 		return dict(status=1, status_message="failed")
 
@@ -127,4 +128,42 @@ def test_post_message_to_public_account_failed():
 		message_sender.post_to_public_account(
 			sender, VIBER_BOT_CONFIGURATION.name, VIBER_BOT_CONFIGURATION.avatar, text_message)
 
-		assert exc.value.message.startswith("failed with status: 1, message: failed")
\ No newline at end of file
+		assert exc.value.message.startswith("failed with status: 1, message: failed")
+
+
+def test_broadcast_message_sanity():
+	broadcast_list = ["012345A=", "012345B="]
+	text = "hi!"
+
+	def post_request(endpoint, payload, receiver=None):
+		data = json.loads(payload)
+		assert endpoint == BOT_API_ENDPOINT.BROADCAST_MESSAGE
+		assert data['auth_token'] == VIBER_BOT_CONFIGURATION.auth_token
+		assert data['broadcast_list'] == broadcast_list
+		assert 'receiver' not in data
+		assert data['text'] == text
+		return dict(status=0, message_token="a token", failed_list=[])
+
+	request_sender = Stub()
+	request_sender.post_request = post_request
+
+	message_sender = MessageSender(LOGGER, request_sender, VIBER_BOT_CONFIGURATION)
+	result = message_sender.broadcast_message(
+		broadcast_list, VIBER_BOT_CONFIGURATION.name, VIBER_BOT_CONFIGURATION.avatar, TextMessage(text=text))
+	assert result['message_token'] == "a token"
+
+
+def test_broadcast_message_too_many_receivers():
+	def post_request(endpoint, payload, receiver=None):
+		pytest.fail("message sender not supposed to call post_request")
+
+	request_sender = Stub()
+	request_sender.post_request = post_request
+
+	message_sender = MessageSender(LOGGER, request_sender, VIBER_BOT_CONFIGURATION)
+	with pytest.raises(Exception) as exc:
+		message_sender.broadcast_message(
+			[str(i) for i in range(301)], VIBER_BOT_CONFIGURATION.name, VIBER_BOT_CONFIGURATION.avatar,
+			TextMessage(text="hi!"))
+
+	assert str(exc.value).startswith("broadcast_list is limited to 300 receivers")
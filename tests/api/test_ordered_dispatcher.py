@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from viberbot import Api, AsyncApi
+from viberbot import BotConfiguration
+from viberbot.api.messages import TextMessage
+from viberbot.api.ordered_dispatcher import AsyncOrderedDispatcher, DispatcherFullError, OrderedDispatcher
+
+VIBER_BOT_CONFIGURATION = BotConfiguration("auth-token-sample", "testbot", "http://avatars.com/")
+
+
+def test_same_key_runs_in_submission_order():
+	dispatcher = OrderedDispatcher(lanes=4)
+	calls = []
+
+	def call(index):
+		time.sleep(0.001 * (5 - index))
+		calls.append(index)
+		return index
+
+	futures = [dispatcher.submit("user1", call, index) for index in range(5)]
+
+	assert [future.result() for future in futures] == list(range(5))
+	assert calls == list(range(5))
+	dispatcher.close()
+
+
+def test_different_keys_run_in_parallel():
+	dispatcher = OrderedDispatcher(lanes=16)
+	keys = ["user{0}".format(index) for index in range(64)]
+	lanes = set()
+	for key in keys:
+		lanes.add(dispatcher.submit(key, threading.current_thread).result().name)
+	dispatcher.close()
+
+	assert len(lanes) > 1
+
+
+def test_errors_are_returned_through_the_future():
+	dispatcher = OrderedDispatcher(lanes=1)
+
+	def fail():
+		raise Exception("boom")
+
+	failed = dispatcher.submit("user1", fail)
+	succeeded = dispatcher.submit("user1", lambda: "ok")
+
+	with pytest.raises(Exception) as exc:
+		failed.result()
+	assert str(exc.value) == "boom"
+	assert succeeded.result() == "ok"
+	dispatcher.close()
+
+
+def test_submit_after_close_raises():
+	dispatcher = OrderedDispatcher(lanes=2)
+	dispatcher.close()
+
+	with pytest.raises(Exception):
+		dispatcher.submit("user1", lambda: None)
+
+
+def test_async_same_key_runs_in_submission_order():
+	calls = []
+
+	async def call(index):
+		await asyncio.sleep(0.001 * (5 - index))
+		calls.append(index)
+		return index
+
+	async def run():
+		dispatcher = AsyncOrderedDispatcher(lanes=4)
+		futures = [dispatcher.submit("user1", call, index) for index in range(5)]
+		results = await asyncio.gather(*futures)
+		await dispatcher.close()
+		return results
+
+	assert asyncio.run(run()) == list(range(5))
+	assert calls == list(range(5))
+
+
+def test_api_dispatch_messages_keeps_order_per_receiver():
+	viber = Api(VIBER_BOT_CONFIGURATION, max_workers=4)
+	sent = []
+	lock = threading.Lock()
+
+	def post_request(endpoint, payload, receiver=None):
+		with lock:
+			sent.append((receiver, len(sent)))
+		return dict(status=0, status_message="ok", message_token=len(sent))
+
+	viber._request_sender.post_request = post_request
+
+	futures = []
+	for index in range(3):
+		for receiver in ("user1", "user2", "user3"):
+			futures.append(viber.dispatch_messages(receiver, [TextMessage(text=str(index))]))
+	for future in futures:
+		assert len(future.result()) == 1
+	viber.close()
+
+	for receiver in ("user1", "user2", "user3"):
+		order = [position for sent_to, position in sent if sent_to == receiver]
+		assert order == sorted(order) and len(order) == 3
+
+
+def test_async_api_dispatch_messages():
+	async def post_request(endpoint, payload, receiver=None):
+		return dict(status=0, status_message="ok", message_token=receiver)
+
+	async def run():
+		viber = AsyncApi(VIBER_BOT_CONFIGURATION)
+		viber._request_sender.post_request = post_request
+		tokens = await viber.dispatch_messages("user1", [TextMessage(text="hi")])
+		await viber.close()
+		return tokens
+
+	assert asyncio.run(run()) == ["user1"]
+
+
+def test_submit_beyond_max_pending_raises():
+	dispatcher = OrderedDispatcher(lanes=2, max_pending=2)
+	release = threading.Event()
+
+	first = dispatcher.submit("user1", release.wait)
+	second = dispatcher.submit("user2", release.wait)
+	with pytest.raises(DispatcherFullError):
+		dispatcher.submit("user3", release.wait)
+
+	release.set()
+	first.result()
+	second.result()
+	assert dispatcher.submit("user3", lambda: "ok").result() == "ok"
+	dispatcher.close()
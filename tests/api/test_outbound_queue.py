@@ -0,0 +1,228 @@
+import json
+import logging
+import time
+
+import pytest
+import requests
+
+from viberbot import Api
+from viberbot import BotConfiguration
+from viberbot.api.circuit_breaker import CircuitBreaker
+from viberbot.api.consts import BOT_API_ENDPOINT
+from viberbot.api.messages import TextMessage
+from viberbot.api.outbound_queue import MemoryOutboundQueue, SqliteOutboundQueue
+from viberbot.api.outbound_worker import OutboundWorkerPool
+from viberbot.api.retry_policy import RetryPolicy
+
+VIBER_BOT_CONFIGURATION = BotConfiguration("auth-token-sample", "testbot", "http://avatars.com/")
+
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self):
+		return self.now
+
+
+class Stub(object): pass
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_queue(request, tmp_path):
+	def make(clock):
+		if request.param == 'memory':
+			return MemoryOutboundQueue(clock=clock)
+		return SqliteOutboundQueue(str(tmp_path / 'outbound.db'), visibility_timeout=30, poll_interval=0.01,
+			clock=clock)
+	return make
+
+
+def test_get_returns_entries_in_order(make_queue):
+	outbound = make_queue(FakeClock())
+	outbound.put((BOT_API_ENDPOINT.SEND_MESSAGE, '{"a": 1}', 'user1'))
+	outbound.put((BOT_API_ENDPOINT.POST, '{"b": 2}', None))
+
+	first = outbound.get(timeout=0)
+	second = outbound.get(timeout=0)
+
+	assert (first.endpoint, first.payload, first.receiver, first.attempts) == \
+		(BOT_API_ENDPOINT.SEND_MESSAGE, '{"a": 1}', 'user1', 1)
+	assert (second.endpoint, second.payload, second.receiver) == (BOT_API_ENDPOINT.POST, '{"b": 2}', None)
+	assert outbound.get(timeout=0) is None
+	assert len(outbound) == 2
+
+
+def test_receiver_messages_are_handed_out_one_at_a_time(make_queue):
+	outbound = make_queue(FakeClock())
+	outbound.put((BOT_API_ENDPOINT.SEND_MESSAGE, '1', 'user1'))
+	outbound.put((BOT_API_ENDPOINT.SEND_MESSAGE, '2', 'user1'))
+	outbound.put((BOT_API_ENDPOINT.SEND_MESSAGE, '3', 'user2'))
+
+	first = outbound.get(timeout=0)
+	other = outbound.get(timeout=0)
+	assert (first.payload, other.payload) == ('1', '3')
+	assert outbound.get(timeout=0) is None
+
+	outbound.ack(first)
+	assert outbound.get(timeout=0).payload == '2'
+
+
+def test_nacked_entry_keeps_its_place_and_is_delayed(make_queue):
+	clock = FakeClock()
+	outbound = make_queue(clock)
+	outbound.put((BOT_API_ENDPOINT.SEND_MESSAGE, '1', 'user1'))
+	outbound.put((BOT_API_ENDPOINT.SEND_MESSAGE, '2', 'user1'))
+
+	entry = outbound.get(timeout=0)
+	outbound.nack(entry, delay=5)
+	assert outbound.get(timeout=0) is None
+
+	clock.now += 5
+	retried = outbound.get(timeout=0)
+	assert (retried.payload, retried.attempts) == ('1', 2)
+
+
+def test_sqlite_queue_survives_restart_and_redelivers_unacked_entries(tmp_path):
+	path = str(tmp_path / 'outbound.db')
+	clock = FakeClock()
+	outbound = SqliteOutboundQueue(path, visibility_timeout=30, clock=clock)
+	outbound.put((BOT_API_ENDPOINT.SEND_MESSAGE, '1', 'user1'))
+	outbound.put((BOT_API_ENDPOINT.SEND_MESSAGE, '2', 'user1'))
+	assert outbound.get(timeout=0).payload == '1'
+	outbound.close()
+
+	reopened = SqliteOutboundQueue(path, visibility_timeout=30, clock=clock)
+	assert len(reopened) == 2
+	assert reopened.get(timeout=0) is None
+
+	clock.now += 31
+	entry = reopened.get(timeout=0)
+	assert (entry.payload, entry.attempts) == ('1', 2)
+	reopened.ack(entry)
+	assert reopened.get(timeout=0).payload == '2'
+
+
+def test_send_messages_spools_instead_of_sending():
+	outbound = MemoryOutboundQueue()
+	viber = Api(VIBER_BOT_CONFIGURATION, outbound_queue=outbound)
+
+	def post_request(endpoint, payload, receiver=None):
+		pytest.fail("messages should be spooled, not sent")
+
+	viber._request_sender.post_request = post_request
+
+	tokens = viber.send_messages("012345A=", [TextMessage(text="one"), TextMessage(text="two")], concurrent=True)
+
+	assert tokens.tokens == [None, None]
+	first = outbound.get(timeout=0)
+	assert first.receiver == "012345A="
+	assert json.loads(first.payload)['text'] == "one"
+	outbound.ack(first)
+	assert json.loads(outbound.get(timeout=0).payload)['text'] == "two"
+
+
+def test_start_outbound_workers_requires_queue():
+	with pytest.raises(Exception) as exc:
+		Api(VIBER_BOT_CONFIGURATION).start_outbound_workers()
+
+	assert "outbound_queue" in str(exc.value)
+
+
+def worker_pool(outbound, post_request, max_attempts=3, circuit_breaker=None):
+	request_sender = Stub()
+	request_sender.post_request = post_request
+	request_sender.circuit_breaker = circuit_breaker
+	request_sender.retry_policy = RetryPolicy(base_delay=1, jitter=False)
+	return OutboundWorkerPool(logging.getLogger(), request_sender, outbound, workers=1, max_attempts=max_attempts)
+
+
+def test_worker_acks_delivered_and_rejected_entries():
+	outbound = MemoryOutboundQueue()
+	outbound.put((BOT_API_ENDPOINT.SEND_MESSAGE, '1', 'user1'))
+	outbound.put((BOT_API_ENDPOINT.SEND_MESSAGE, '2', 'user2'))
+	statuses = iter([0, 6])
+	sent = []
+
+	def post_request(endpoint, payload, receiver=None):
+		sent.append((endpoint, payload, receiver))
+		return dict(status=next(statuses), status_message="ok", message_token=1)
+
+	pool = worker_pool(outbound, post_request)
+	pool.process(outbound.get(timeout=0))
+	pool.process(outbound.get(timeout=0))
+
+	assert sent == [(BOT_API_ENDPOINT.SEND_MESSAGE, '1', 'user1'), (BOT_API_ENDPOINT.SEND_MESSAGE, '2', 'user2')]
+	assert len(outbound) == 0
+
+
+def test_worker_retries_undelivered_entries_with_backoff():
+	clock = FakeClock()
+	outbound = MemoryOutboundQueue(clock=clock)
+	outbound.put((BOT_API_ENDPOINT.SEND_MESSAGE, '1', 'user1'))
+	errors = iter([requests.ConnectionError("refused"), requests.ConnectionError("reset")])
+
+	def post_request(endpoint, payload, receiver=None):
+		raise next(errors)
+
+	pool = worker_pool(outbound, post_request, max_attempts=2)
+	pool.process(outbound.get(timeout=0))
+	assert outbound.get(timeout=0) is None
+
+	clock.now += 1
+	entry = outbound.get(timeout=0)
+	assert entry.attempts == 2
+	pool.process(entry)
+	assert len(outbound) == 0
+
+
+def test_open_circuit_does_not_use_up_attempts(make_queue):
+	clock = FakeClock()
+	outbound = make_queue(clock)
+	outbound.put((BOT_API_ENDPOINT.SEND_MESSAGE, '1', 'user1'))
+	# open longer than the whole backoff of max_attempts failed deliveries
+	circuit = CircuitBreaker(window_size=1, minimum_calls=1, open_timeout=120, clock=clock)
+	circuit.record_failure()
+	sent = []
+
+	def post_request(endpoint, payload, receiver=None):
+		circuit.before_call()
+		sent.append(payload)
+		circuit.record_success()
+		return dict(status=0, status_message="ok", message_token=1)
+
+	pool = worker_pool(outbound, post_request, max_attempts=3, circuit_breaker=circuit)
+	deliveries = 0
+	for _ in range(200):
+		entry = outbound.get(timeout=0)
+		if entry is not None:
+			deliveries += 1
+			pool.process(entry)
+		clock.now += 1
+
+	assert sent == ['1']
+	assert deliveries == 2
+	assert len(outbound) == 0
+
+
+def test_started_workers_drain_the_queue(tmp_path):
+	outbound = SqliteOutboundQueue(str(tmp_path / 'outbound.db'), poll_interval=0.01)
+	viber = Api(VIBER_BOT_CONFIGURATION, outbound_queue=outbound)
+	sent = []
+
+	def post_request(endpoint, payload, receiver=None):
+		sent.append(json.loads(payload)['text'])
+		return dict(status=0, status_message="ok", message_token=len(sent))
+
+	viber._request_sender.post_request = post_request
+	viber.send_messages("012345A=", [TextMessage(text=str(index)) for index in range(5)])
+	viber.start_outbound_workers(workers=3)
+
+	for _ in range(500):
+		if len(outbound) == 0:
+			break
+		time.sleep(0.01)
+	viber.close()
+
+	assert sent == [str(index) for index in range(5)]
+	assert len(outbound) == 0
@@ -0,0 +1,127 @@
+import json
+import logging
+
+from viberbot.api.api_request_sender import ApiRequestSender
+from viberbot.api.bot_configuration import BotConfiguration
+from viberbot.api.consts import BOT_API_RESPONSE_STATUS, VIBER_BOT_USER_AGENT
+from viberbot.api.rate_limiter import RateLimiter
+from viberbot.api.retry_policy import NO_RETRY
+
+VIBER_BOT_API_URL = "http://site.com"
+VIBER_BOT_CONFIGURATION = BotConfiguration("auth-token-sample", "testbot", "http://avatars.com/")
+
+
+class Stub(object): pass
+
+
+def stub(*args): pass
+
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 0.0
+		self.sleeps = []
+
+	def __call__(self):
+		return self.now
+
+	def sleep(self, seconds):
+		self.sleeps.append(seconds)
+		self.now += seconds
+
+
+def test_burst_is_spread_out():
+	clock = FakeClock()
+	limiter = RateLimiter(rate=10, burst=2, clock=clock, sleep=clock.sleep)
+
+	delays = [limiter.reserve() for _ in range(4)]
+
+	assert delays == [0.0, 0.0, 0.1, 0.2]
+
+
+def test_tokens_refill_over_time():
+	clock = FakeClock()
+	limiter = RateLimiter(rate=10, burst=1, clock=clock, sleep=clock.sleep)
+
+	assert limiter.reserve() == 0.0
+	clock.now += 0.1
+	assert limiter.reserve() == 0.0
+
+
+def test_acquire_sleeps_and_reports_queue_depth():
+	clock = FakeClock()
+	depths = []
+	limiter = RateLimiter(rate=10, burst=1, clock=clock)
+
+	def sleep(seconds):
+		depths.append(limiter.queue_depth)
+		clock.sleep(seconds)
+
+	limiter._sleep = sleep
+
+	limiter.acquire()
+	limiter.acquire()
+
+	assert clock.sleeps == [0.1]
+	assert depths == [1]
+	assert limiter.queue_depth == 0
+
+
+def test_per_receiver_bucket():
+	clock = FakeClock()
+	limiter = RateLimiter(rate=100, per_receiver_rate=1, clock=clock, sleep=clock.sleep)
+
+	assert limiter.reserve("a") == 0.0
+	assert limiter.reserve("b") == 0.0
+	assert limiter.reserve("a") == 1.0
+
+
+def test_per_receiver_buckets_are_bounded():
+	clock = FakeClock()
+	limiter = RateLimiter(rate=100, per_receiver_rate=1, max_receivers=2, clock=clock, sleep=clock.sleep)
+
+	for receiver in ["a", "b", "c"]:
+		limiter.reserve(receiver)
+
+	assert list(limiter._receiver_buckets.keys()) == ["b", "c"]
+
+
+def test_adaptive_throttling():
+	clock = FakeClock()
+	limiter = RateLimiter(rate=10, min_rate_factor=0.25, recovery_step=0.25, clock=clock, sleep=clock.sleep)
+
+	limiter.on_rate_limited()
+	assert limiter.rate == 5
+	limiter.on_rate_limited()
+	limiter.on_rate_limited()
+	assert limiter.rate == 2.5
+	assert limiter.rate_limited_count == 3
+
+	limiter.on_success()
+	assert limiter.rate == 5
+	for _ in range(5):
+		limiter.on_success()
+	assert limiter.rate == 10
+
+
+def test_request_sender_slows_down_on_rate_limit_status():
+	clock = FakeClock()
+	limiter = RateLimiter(rate=10, clock=clock, sleep=clock.sleep)
+	responses = [BOT_API_RESPONSE_STATUS.TOO_MANY_REQUESTS, BOT_API_RESPONSE_STATUS.OK]
+
+	class Transport(object):
+		def post(self, url, data, headers):
+			response = Stub()
+			response.raise_for_status = stub
+			response.text = json.dumps(dict(status=responses.pop(0), status_message="", message_token=1))
+			return response
+
+	request_sender = ApiRequestSender(
+		logging.getLogger(), VIBER_BOT_API_URL, VIBER_BOT_CONFIGURATION, VIBER_BOT_USER_AGENT,
+		transport=Transport(), rate_limiter=limiter, retry_policy=NO_RETRY)
+
+	request_sender.post_request("send_message", "{}", receiver="012345A=")
+	assert limiter.rate == 5
+
+	request_sender.post_request("send_message", "{}", receiver="012345A=")
+	assert limiter.rate > 5
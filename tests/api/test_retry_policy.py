@@ -0,0 +1,163 @@
+import json
+import logging
+
+import pytest
+import requests
+
+from viberbot.api.api_request_sender import ApiRequestSender
+from viberbot.api.bot_configuration import BotConfiguration
+from viberbot.api.consts import BOT_API_ENDPOINT, BOT_API_RESPONSE_STATUS, VIBER_BOT_USER_AGENT
+from viberbot.api.retry_policy import RetryPolicy
+from viberbot.api.transport import ConnectError, HttpTransport
+
+VIBER_BOT_API_URL = "http://site.com"
+VIBER_BOT_CONFIGURATION = BotConfiguration("auth-token-sample", "testbot", "http://avatars.com/")
+
+
+class Stub(object): pass
+
+
+def stub(*args): pass
+
+
+def http_error(status_code):
+	response = Stub()
+	response.status_code = status_code
+	return requests.HTTPError(response=response)
+
+
+def ok_response(result):
+	response = Stub()
+	response.raise_for_status = stub
+	response.text = json.dumps(result)
+	return response
+
+
+class Transport(object):
+	def __init__(self, outcomes):
+		self.outcomes = outcomes
+		self.calls = 0
+
+	def post(self, url, data, headers):
+		self.calls += 1
+		outcome = self.outcomes.pop(0)
+		if isinstance(outcome, Exception):
+			raise outcome
+		return ok_response(outcome)
+
+
+def request_sender(transport, **policy_kwargs):
+	sleeps = []
+	policy = RetryPolicy(sleep=sleeps.append, jitter=False, base_delay=1, **policy_kwargs)
+	sender = ApiRequestSender(
+		logging.getLogger(), VIBER_BOT_API_URL, VIBER_BOT_CONFIGURATION, VIBER_BOT_USER_AGENT,
+		transport=transport, retry_policy=policy)
+	return sender, sleeps
+
+
+@pytest.mark.parametrize("endpoint, error, retryable", [
+	(BOT_API_ENDPOINT.SEND_MESSAGE, ConnectError(), True),
+	(BOT_API_ENDPOINT.SEND_MESSAGE, requests.ConnectionError(), False),
+	(BOT_API_ENDPOINT.GET_ONLINE, requests.ConnectionError(), True),
+	(BOT_API_ENDPOINT.SEND_MESSAGE, requests.ConnectTimeout(), True),
+	(BOT_API_ENDPOINT.SEND_MESSAGE, requests.ReadTimeout(), False),
+	(BOT_API_ENDPOINT.GET_USER_DETAILS, requests.ReadTimeout(), True),
+	(BOT_API_ENDPOINT.SEND_MESSAGE, http_error(429), True),
+	(BOT_API_ENDPOINT.SEND_MESSAGE, http_error(503), True),
+	(BOT_API_ENDPOINT.SEND_MESSAGE, http_error(500), False),
+	(BOT_API_ENDPOINT.GET_ONLINE, http_error(500), True),
+	(BOT_API_ENDPOINT.GET_ONLINE, http_error(404), False),
+])
+def test_error_classification(endpoint, error, retryable):
+	assert RetryPolicy().should_retry_error(endpoint, error, attempt=1) == retryable
+
+
+def test_no_retry_after_max_attempts():
+	policy = RetryPolicy(max_attempts=2)
+
+	assert not policy.should_retry_error(BOT_API_ENDPOINT.SEND_MESSAGE, requests.ConnectionError(), attempt=2)
+
+
+def test_result_classification():
+	policy = RetryPolicy()
+
+	assert policy.should_retry_result(
+		BOT_API_ENDPOINT.SEND_MESSAGE, dict(status=BOT_API_RESPONSE_STATUS.TOO_MANY_REQUESTS), attempt=1)
+	assert not policy.should_retry_result(
+		BOT_API_ENDPOINT.SEND_MESSAGE, dict(status=BOT_API_RESPONSE_STATUS.RECEIVER_NOT_SUBSCRIBED), attempt=1)
+
+
+def test_exponential_backoff_is_capped():
+	policy = RetryPolicy(base_delay=1, multiplier=2, max_delay=5, jitter=False)
+
+	assert [policy.backoff(attempt) for attempt in range(1, 5)] == [1, 2, 4, 5]
+
+
+def test_jitter_stays_within_backoff():
+	policy = RetryPolicy(base_delay=1, multiplier=2, max_delay=5)
+
+	for attempt in range(1, 5):
+		assert 0 <= policy.backoff(attempt) <= min(5, 2 ** (attempt - 1))
+
+
+def test_request_sender_rides_out_blips():
+	transport = Transport([ConnectError(), http_error(503), dict(status=0, message_token=1)])
+	sender, sleeps = request_sender(transport)
+
+	result = sender.post_request(BOT_API_ENDPOINT.SEND_MESSAGE, "{}")
+
+	assert result['message_token'] == 1
+	assert transport.calls == 3
+	assert sleeps == [1, 2]
+	assert sender.retry_counters == {BOT_API_ENDPOINT.SEND_MESSAGE: 2}
+
+
+def test_request_sender_retries_rate_limit_status():
+	transport = Transport([
+		dict(status=BOT_API_RESPONSE_STATUS.TOO_MANY_REQUESTS, status_message="tooManyRequests"),
+		dict(status=0, message_token=1)])
+	sender, sleeps = request_sender(transport)
+
+	assert sender.post_request(BOT_API_ENDPOINT.SEND_MESSAGE, "{}")['message_token'] == 1
+	assert sender.retry_counters == {BOT_API_ENDPOINT.SEND_MESSAGE: 1}
+
+
+def test_request_sender_does_not_resend_after_read_timeout():
+	transport = Transport([requests.ReadTimeout(), dict(status=0, message_token=1)])
+	sender, sleeps = request_sender(transport)
+
+	with pytest.raises(requests.ReadTimeout):
+		sender.post_request(BOT_API_ENDPOINT.SEND_MESSAGE, "{}")
+
+	assert transport.calls == 1
+	assert sender.retry_counters == {}
+
+
+def test_request_sender_does_not_resend_after_connection_reset():
+	reset = requests.ConnectionError(ConnectionResetError("connection reset by peer"))
+	transport = Transport([reset, dict(status=0, message_token=1)])
+	sender, sleeps = request_sender(transport)
+
+	with pytest.raises(requests.ConnectionError):
+		sender.post_request(BOT_API_ENDPOINT.SEND_MESSAGE, "{}")
+
+	assert transport.calls == 1
+
+
+def test_refused_connection_is_raised_as_connect_error():
+	transport = HttpTransport(connect_timeout=1)
+
+	# nothing listens on port 9 of the loopback interface
+	with pytest.raises(ConnectError):
+		transport.post("http://127.0.0.1:9/", "{}", {})
+	transport.close()
+
+
+def test_request_sender_gives_up_after_max_attempts():
+	transport = Transport([requests.ConnectionError(), requests.ConnectionError()])
+	sender, sleeps = request_sender(transport, max_attempts=2)
+
+	with pytest.raises(requests.ConnectionError):
+		sender.post_request(BOT_API_ENDPOINT.GET_ONLINE, "{}")
+
+	assert transport.calls == 2
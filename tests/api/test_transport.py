@@ -0,0 +1,76 @@
+from viberbot import Api
+from viberbot import BotConfiguration
+from viberbot.api.transport import HttpTransport
+
+VIBER_BOT_CONFIGURATION = BotConfiguration("auth-token-sample", "testbot", "http://avatars.com/")
+
+
+class Stub(object): pass
+
+
+def stub(*args): pass
+
+
+def test_session_is_reused(monkeypatch):
+	sessions = []
+
+	def callback(session, url, data, headers, timeout):
+		sessions.append(session)
+		response = Stub()
+		response.raise_for_status = stub
+		response.text = "{}"
+		return response
+
+	monkeypatch.setattr("requests.Session.post", callback)
+	transport = HttpTransport()
+
+	transport.post("http://site.com/a", data="{}", headers={})
+	transport.post("http://site.com/b", data="{}", headers={})
+
+	assert len(sessions) == 2
+	assert sessions[0] is sessions[1]
+
+
+def test_timeouts_are_passed(monkeypatch):
+	def callback(session, url, data, headers, timeout):
+		assert timeout == (1, 2)
+		assert 'Connection' not in headers
+
+	monkeypatch.setattr("requests.Session.post", callback)
+	transport = HttpTransport(connect_timeout=1, read_timeout=2)
+
+	transport.post("http://site.com", data="{}", headers={})
+
+
+def test_keep_alive_disabled(monkeypatch):
+	def callback(session, url, data, headers, timeout):
+		assert headers['Connection'] == 'close'
+
+	monkeypatch.setattr("requests.Session.post", callback)
+	transport = HttpTransport(keep_alive=False)
+
+	transport.post("http://site.com", data="{}", headers={})
+
+
+def test_pool_size_is_configured():
+	transport = HttpTransport(pool_maxsize=7)
+
+	adapter = transport.session.get_adapter("https://chatapi.viber.com/pa")
+	assert adapter._pool_maxsize == 7
+	assert adapter.max_retries.total == 0
+
+
+def test_close_drops_session():
+	transport = HttpTransport()
+	session = transport.session
+
+	transport.close()
+
+	assert transport.session is not session
+
+
+def test_api_exposes_transport():
+	transport = HttpTransport()
+	viber = Api(VIBER_BOT_CONFIGURATION, transport=transport)
+
+	assert viber.transport is transport
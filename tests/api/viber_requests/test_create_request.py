@@ -2,7 +2,8 @@ from datetime import datetime
 
 import pytest
 from viberbot.api.messages import MessageType
-from viberbot.api.viber_requests import create_request
+from viberbot.api.user_profile import UserProfile
+from viberbot.api.viber_requests import EVENT_TYPE_TO_CLASS, create_request
 
 
 def test_create_request_missing_event():
@@ -21,4 +22,10 @@ def test_create_request_missing_event():
 
 	with pytest.raises(Exception) as exc:
 		create_request(sample_request)
-		assert exc.value.message.startswith("request is missing field 'event'")
\ No newline at end of file
+		assert exc.value.message.startswith("request is missing field 'event'")
+
+
+@pytest.mark.parametrize("request_class", list(EVENT_TYPE_TO_CLASS.values()))
+def test_requests_have_no_instance_dict(request_class):
+	assert not hasattr(request_class(), '__dict__')
+	assert not hasattr(UserProfile(), '__dict__')
@@ -22,3 +22,14 @@ def test_create_request():
 	assert request.message_token == SAMPLE_REQUEST['message_token']
 	assert request.user_id == SAMPLE_REQUEST['user_id']
 	assert request.chat_id == SAMPLE_REQUEST['chat_id']
+
+
+def test_create_lazy_request():
+	request = create_request(SAMPLE_REQUEST, lazy=True)
+
+	assert isinstance(request, ViberDeliveredRequest)
+	assert request.event_type == SAMPLE_REQUEST['event']
+	assert request._message_token is None
+	assert request.message_token == SAMPLE_REQUEST['message_token']
+	assert request.user_id == SAMPLE_REQUEST['user_id']
+	assert request.chat_id == SAMPLE_REQUEST['chat_id']
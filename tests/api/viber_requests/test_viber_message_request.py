@@ -1,5 +1,7 @@
 from datetime import datetime
 
+import pytest
+
 from viberbot.api.event_type import EventType
 from viberbot.api.messages import MessageType
 from viberbot.api.messages import TextMessage
@@ -87,4 +89,31 @@ def test_request_is_chat_extension():
 	assert request.sender.name == SAMPLE_REQUEST['sender']['name']
 	assert request.chat_id == SAMPLE_REQUEST['chat_id']
 	assert request.reply_type == SAMPLE_REQUEST['reply_type']
-	assert isinstance(request.message, TextMessage)
\ No newline at end of file
+	assert isinstance(request.message, TextMessage)
+
+
+def test_create_lazy_request():
+	request = create_request(SAMPLE_REQUEST, lazy=True)
+
+	assert isinstance(request, ViberMessageRequest)
+	assert request.event_type == SAMPLE_REQUEST['event']
+	assert request.timestamp == SAMPLE_REQUEST['timestamp']
+	assert request._sender is None and request._message is None
+	assert request.sender.id == SAMPLE_REQUEST['sender']['id']
+	assert isinstance(request.message, TextMessage)
+	assert request.message_token == SAMPLE_REQUEST['message_token']
+	assert request.silent == SAMPLE_REQUEST['silent']
+	assert str(request) == str(create_request(SAMPLE_REQUEST))
+
+
+def test_lazy_request_fails_on_access_to_invalid_fields():
+	request_dict = dict(SAMPLE_REQUEST)
+	del request_dict['sender']
+	request = create_request(request_dict, lazy=True)
+
+	with pytest.raises(KeyError):
+		request.message
+	with pytest.raises(KeyError):
+		request.sender
+	with pytest.raises(KeyError):
+		request.message
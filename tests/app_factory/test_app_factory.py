@@ -0,0 +1,239 @@
+import json
+import subprocess
+import sys
+from unittest.mock import Mock
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from viberbot.api.signature_verifier import SignatureVerifier
+
+from app.data_models import Base, Question, create_question
+from app.main import BotServices, create_app, set_webhook
+
+AUTH_TOKEN = "auth-token-sample"
+
+
+@pytest.fixture
+def bot_services():
+    bot_services = BotServices(environ={"VIBER_AUTH_KEY": AUTH_TOKEN})
+    engine = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    bot_services._session_factory = sessionmaker(bind=engine)
+    yield bot_services
+    bot_services.close()
+
+
+def test_import_and_create_app_have_no_side_effects():
+    code = (
+        "import os, threading\n"
+        "os.environ.pop('VIBER_AUTH_KEY', None)\n"
+        "os.environ.pop('DATABASE_URL_2', None)\n"
+        "from app.main import create_app\n"
+        "create_app()\n"
+        "print(threading.active_count())\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "1"
+
+
+def test_clients_are_built_on_first_use(bot_services):
+    assert bot_services._viber is None
+    viber = bot_services.viber
+    assert bot_services.viber is viber
+
+
+def test_webhook_greets_a_started_conversation(bot_services):
+    sent = []
+
+    def post_request(endpoint, payload, receiver=None):
+        sent.append(json.loads(payload))
+        return dict(status=0, status_message="ok", message_token=len(sent))
+
+    bot_services.viber._request_sender.post_request = post_request
+    body = json.dumps(
+        {
+            "event": "conversation_started",
+            "timestamp": 1457764197627,
+            "message_token": 1,
+            "type": "open",
+            "user": {"id": "viber_user_1", "name": "name"},
+            "subscribed": False,
+        }
+    ).encode("utf-8")
+    signature = SignatureVerifier(AUTH_TOKEN).signature(body)
+
+    client = create_app(bot_services).test_client()
+    response = client.post(
+        "/", data=body, headers={"X-Viber-Content-Signature": signature}
+    )
+
+    assert response.status_code == 200
+    assert [(data["receiver"], data["text"]) for data in sent] == [
+        ("viber_user_1", "conversation_started")
+    ]
+
+
+def test_webhook_answers_skipped_events_without_scheduling_them(bot_services):
+    bot_services._event_scheduler = Mock()
+    body = json.dumps(
+        {
+            "event": "delivered",
+            "timestamp": 1457764197627,
+            "message_token": 1,
+            "user_id": "viber_user_1",
+        }
+    ).encode("utf-8")
+    signature = SignatureVerifier(AUTH_TOKEN).signature(body)
+
+    client = create_app(bot_services).test_client()
+    response = client.post(
+        "/", data=body, headers={"X-Viber-Content-Signature": signature}
+    )
+
+    assert response.status_code == 200
+    bot_services._event_scheduler.submit.assert_not_called()
+
+
+def message_body(token):
+    return json.dumps(
+        {
+            "event": "message",
+            "timestamp": 1457764197627,
+            "message_token": token,
+            "sender": {"id": "viber_user_1", "name": "name"},
+            "message": {"type": "text", "text": "hi"},
+        }
+    ).encode("utf-8")
+
+
+def signature(body):
+    return SignatureVerifier(AUTH_TOKEN).signature(body)
+
+
+def failing_flow_manager(monkeypatch):
+    attempts = []
+
+    class FlowManager:
+        def __init__(self, session, viber, viber_request, responder_scheduler):
+            attempts.append(viber_request.message_token)
+
+        def execute_flow(self):
+            raise Exception("flow failed")
+
+    monkeypatch.setattr("app.main.FlowManager", FlowManager)
+    return attempts
+
+
+def test_failed_flow_answers_with_an_error_and_releases_the_token(
+    bot_services, monkeypatch
+):
+    attempts = failing_flow_manager(monkeypatch)
+    body = message_body(1)
+    app = create_app(bot_services)
+    app.testing = False
+
+    response = app.test_client().post(
+        "/",
+        data=body,
+        headers={"X-Viber-Content-Signature": signature(body)},
+    )
+
+    assert response.status_code == 500
+    assert attempts == [1]
+    assert bot_services.dedup_store.claim(1)
+
+
+def test_failed_flow_after_an_early_answer_is_retried_and_logged_as_lost(
+    bot_services, monkeypatch, caplog
+):
+    attempts = failing_flow_manager(monkeypatch)
+    bot_services.environ.update(
+        WEBHOOK_ACK_FIRST="1", FLOW_ATTEMPTS="2", FLOW_RETRY_SECONDS="0"
+    )
+    body = message_body(1)
+
+    response = create_app(bot_services).test_client().post(
+        "/",
+        data=body,
+        headers={"X-Viber-Content-Signature": signature(body)},
+    )
+    bot_services.event_scheduler.close()
+
+    assert response.status_code == 200
+    assert attempts == [1, 1]
+    assert not bot_services.dedup_store.claim(1)
+    assert "lost message event 1" in caplog.text
+
+
+def test_flow_failing_after_a_commit_runs_once_and_keeps_the_token(
+    bot_services, monkeypatch, tmp_path
+):
+    # the flow runs on a lane thread, which needs a database shared across connections
+    engine = create_engine(f"sqlite:///{tmp_path / 'flows.db'}", future=True)
+    Base.metadata.create_all(engine)
+    bot_services._session_factory = sessionmaker(bind=engine)
+    attempts = []
+
+    class FlowManager:
+        def __init__(self, session, viber, viber_request, responder_scheduler):
+            self.session = session
+            attempts.append(viber_request.message_token)
+
+        def execute_flow(self):
+            create_question(self.session, "question", 1)
+            raise Exception("send failed")
+
+    monkeypatch.setattr("app.main.FlowManager", FlowManager)
+    bot_services.environ.update(
+        WEBHOOK_ACK_FIRST="1", FLOW_ATTEMPTS="3", FLOW_RETRY_SECONDS="0"
+    )
+    app = create_app(bot_services)
+    for _ in range(2):
+        body = message_body(1)
+        app.test_client().post(
+            "/", data=body, headers={"X-Viber-Content-Signature": signature(body)}
+        )
+    bot_services.event_scheduler.close()
+
+    assert attempts == [1]
+    with bot_services.session_factory() as session:
+        assert session.query(Question).count() == 1
+    engine.dispose()
+
+
+def test_set_webhook_command(bot_services):
+    calls = []
+
+    def set_webhook_request(url, webhook_events=None, is_inline=False):
+        calls.append(url)
+        return webhook_events
+
+    bot_services.environ["WEBHOOK_URL"] = "https://example.com/"
+    bot_services.viber._request_sender.set_webhook = set_webhook_request
+
+    result = create_app(bot_services).test_cli_runner().invoke(args=["set-webhook"])
+
+    assert result.exit_code == 0, result.output
+    assert calls == ["https://example.com/"]
+
+
+def test_set_webhook_retries_until_the_webhook_answers():
+    attempts = []
+
+    class Viber:
+        def set_webhook(self, url):
+            attempts.append(url)
+            if len(attempts) < 3:
+                raise Exception("failed with status: 1, message: webhook not answering")
+            return ["message"]
+
+    assert set_webhook(Viber(), "https://example.com/", retry_delay=0) == ["message"]
+    assert len(attempts) == 3
+
+    attempts.clear()
+    with pytest.raises(Exception):
+        set_webhook(Viber(), "https://example.com/", attempts=2, retry_delay=0)
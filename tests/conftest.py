@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.data_models import Base, ChatBotUser
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    yield engine
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def session(engine):
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def add_users(session, count):
+    users = [
+        ChatBotUser(
+            user_id=user_id,
+            name=f"User {user_id}",
+            viber_id=f"viber_user_{user_id}",
+            active=True,
+        )
+        for user_id in range(1, count + 1)
+    ]
+    session.add_all(users)
+    session.commit()
+    return users
@@ -0,0 +1,216 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from viberbot.api.ordered_dispatcher import DispatcherFullError
+from viberbot.api.viber_requests import create_request
+
+from app.event_processing import (
+    EventScheduler,
+    PartiallyAppliedError,
+    PostgresAdvisoryLock,
+    USER_LOCK_NAMESPACE,
+    event_user_id,
+    fail_as_partially_applied,
+)
+
+
+def message_request(sender_id, text, token):
+    return create_request(
+        {
+            "event": "message",
+            "timestamp": 1457764197627,
+            "message_token": token,
+            "sender": {"id": sender_id, "name": "name"},
+            "message": {"type": "text", "text": text},
+        },
+        lazy=True,
+    )
+
+
+def test_event_user_id():
+    assert event_user_id(message_request("viber_user_1", "hi", 1)) == "viber_user_1"
+    subscribed = create_request(
+        {"event": "subscribed", "timestamp": 1, "user": {"id": "viber_user_2"}}
+    )
+    assert event_user_id(subscribed) == "viber_user_2"
+    failed = create_request(
+        {
+            "event": "failed",
+            "timestamp": 1,
+            "message_token": 1,
+            "user_id": "viber_user_3",
+            "desc": "failure",
+        }
+    )
+    assert event_user_id(failed) == "viber_user_3"
+    webhook = create_request({"event": "webhook", "timestamp": 1})
+    assert event_user_id(webhook) is None
+
+
+def test_events_of_one_user_run_in_order():
+    handled = []
+    lock = threading.Lock()
+
+    def handler(viber_request):
+        with lock:
+            handled.append(
+                (viber_request.sender.id, viber_request.message.text)
+            )
+
+    scheduler = EventScheduler(handler, lanes=4)
+    for index in range(5):
+        for user in ("viber_user_1", "viber_user_2"):
+            scheduler.submit(message_request(user, str(index), index))
+    scheduler.close()
+
+    for user in ("viber_user_1", "viber_user_2"):
+        assert [text for sender, text in handled if sender == user] == [
+            str(index) for index in range(5)
+        ]
+
+
+def test_submit_refuses_events_beyond_queue_bound():
+    release = threading.Event()
+    scheduler = EventScheduler(
+        lambda viber_request: release.wait(), lanes=2, max_pending=1
+    )
+
+    scheduler.submit(message_request("viber_user_1", "hi", 1))
+    with pytest.raises(DispatcherFullError):
+        scheduler.submit(message_request("viber_user_2", "hi", 2))
+
+    release.set()
+    scheduler.close()
+
+
+def test_events_of_one_user_never_overlap():
+    running = {}
+    overlaps = []
+    lock = threading.Lock()
+
+    def handler(viber_request):
+        user = viber_request.sender.id
+        with lock:
+            if running.get(user):
+                overlaps.append(user)
+            running[user] = True
+        time.sleep(0.001)
+        with lock:
+            running[user] = False
+        return user
+
+    scheduler = EventScheduler(handler, lanes=4)
+    requests = [
+        message_request(user, "answer", index)
+        for index in range(10)
+        for user in ("viber_user_1", "viber_user_2", "viber_user_3")
+    ]
+    threads = [
+        threading.Thread(target=scheduler.run, args=(viber_request,))
+        for viber_request in requests
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+
+    assert overlaps == []
+
+
+def test_run_returns_the_handler_result_and_raises_its_errors():
+    def handler(viber_request):
+        if viber_request.message.text == "fail":
+            raise ValueError("flow failed")
+        return viber_request.message.text
+
+    scheduler = EventScheduler(handler, lanes=2)
+
+    assert scheduler.run(message_request("viber_user_1", "hi", 1)) == "hi"
+    with pytest.raises(ValueError):
+        scheduler.run(message_request("viber_user_1", "fail", 2))
+    scheduler.close()
+
+
+def test_failing_event_runs_again_before_the_next_event_of_its_user():
+    handled = []
+
+    def handler(viber_request):
+        handled.append(viber_request.message.text)
+        if viber_request.message.text == "first" and len(handled) < 3:
+            raise Exception("flow failed")
+
+    scheduler = EventScheduler(handler, lanes=1, attempts=3, retry_delay=0.5)
+    with mock.patch("app.event_processing.time.sleep") as sleep:
+        first = scheduler.submit(message_request("viber_user_1", "first", 1))
+        second = scheduler.submit(message_request("viber_user_1", "second", 2))
+        scheduler.close()
+
+    assert first.exception() is None and second.exception() is None
+    assert handled == ["first", "first", "first", "second"]
+    assert sleep.call_args_list == [mock.call(0.5), mock.call(1.0)]
+
+
+def test_partially_applied_event_is_not_run_again():
+    handled = []
+
+    def handler(viber_request):
+        handled.append(viber_request.message_token)
+        raise PartiallyAppliedError("failed after committing")
+
+    scheduler = EventScheduler(handler, lanes=1, attempts=3, retry_delay=0)
+    future = scheduler.submit(message_request("viber_user_1", "hi", 1))
+    scheduler.close()
+
+    assert isinstance(future.exception(), PartiallyAppliedError)
+    assert handled == [1]
+
+
+def test_errors_after_a_commit_fail_as_partially_applied(session):
+    with pytest.raises(ValueError):
+        with fail_as_partially_applied(session):
+            raise ValueError("failed before committing")
+
+    with pytest.raises(PartiallyAppliedError):
+        with fail_as_partially_applied(session):
+            session.commit()
+            raise ValueError("failed after committing")
+
+
+def test_user_lock_is_held_while_the_handler_runs():
+    held = []
+    user_lock = mock.MagicMock()
+    user_lock.hold.return_value.__enter__.side_effect = lambda: held.append(True)
+
+    def handler(viber_request):
+        assert held == [True]
+        return "done"
+
+    scheduler = EventScheduler(handler, lanes=1, user_lock=user_lock)
+    assert scheduler.run(message_request("viber_user_1", "hi", 1)) == "done"
+    scheduler.close()
+
+    user_lock.hold.assert_called_once_with("viber_user_1")
+    assert user_lock.hold.return_value.__exit__.called
+
+
+def test_advisory_lock_locks_and_unlocks_the_user_key():
+    engine = mock.MagicMock()
+    connection = engine.connect.return_value.__enter__.return_value
+    key = PostgresAdvisoryLock.lock_key("viber_user_1")
+
+    with PostgresAdvisoryLock(engine).hold("viber_user_1"):
+        assert connection.execute.call_count == 1
+
+    statements = [str(call.args[0]) for call in connection.execute.call_args_list]
+    assert statements == [
+        "SELECT pg_advisory_lock(:namespace, :key)",
+        "SELECT pg_advisory_unlock(:namespace, :key)",
+    ]
+    for call in connection.execute.call_args_list:
+        assert call.args[1] == {"namespace": USER_LOCK_NAMESPACE, "key": key}
+    assert -(2**31) <= key < 2**31
+    assert key == PostgresAdvisoryLock.lock_key("viber_user_1")
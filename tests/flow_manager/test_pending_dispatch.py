@@ -0,0 +1,95 @@
+from unittest.mock import ANY, Mock, call
+
+from app.data_classes import ViberMessage
+from app.data_models import (
+    ChatBotUser,
+    Conversation,
+    create_answer,
+    create_question,
+)
+from app.flow_manager import FlowManager
+from app.flows.flow_dispatch_pending import dispatch_pending_conversations
+from tests.conftest import add_users
+
+
+def add_conversation(session, asker_user_id, status, responder_user_id=None, **kwargs):
+    question = create_question(session, f"question of {asker_user_id}", asker_user_id)
+    conversation = Conversation(
+        question_id=question.question_id,
+        asker_user_id=asker_user_id,
+        responder_user_id=responder_user_id,
+        status=status,
+        **kwargs,
+    )
+    session.add(conversation)
+    session.commit()
+    return conversation
+
+
+def test_pending_conversations_are_assigned_oldest_first(session):
+    add_users(session, 5)
+    first = add_conversation(session, 3, "pending")
+    second = add_conversation(session, 4, "pending")
+    third = add_conversation(session, 5, "pending")
+    viber = Mock()
+
+    assert dispatch_pending_conversations(session, viber) == 2
+
+    assert (first.status, first.responder_user_id) == ("active", 1)
+    assert (second.status, second.responder_user_id) == ("active", 2)
+    assert third.status == "pending"
+    viber.send_messages.assert_has_calls(
+        [call("viber_user_1", ANY), call("viber_user_2", ANY)]
+    )
+
+
+def test_rejected_responder_is_not_given_the_conversation_again(session):
+    add_users(session, 2)
+    conversation = add_conversation(
+        session, 2, "pending", previous_responder_user_id=1
+    )
+
+    assert dispatch_pending_conversations(session, Mock()) == 0
+
+    session.add(ChatBotUser(user_id=3, name="User 3", viber_id="viber_user_3"))
+    session.commit()
+
+    assert dispatch_pending_conversations(session, Mock()) == 1
+    assert conversation.responder_user_id == 3
+
+
+def test_dispatch_stops_at_limit(session):
+    add_users(session, 4)
+    add_conversation(session, 3, "pending")
+    add_conversation(session, 4, "pending")
+
+    assert dispatch_pending_conversations(session, Mock(), limit=1) == 1
+
+
+def test_approving_an_answer_assigns_a_pending_question(session):
+    add_users(session, 3)
+    answered = add_conversation(session, 1, "waiting_for_approval", 2)
+    answered.answer_id = create_answer(
+        session, "answer", answered.question_id, 2
+    ).answer_id
+    session.query(ChatBotUser).filter_by(user_id=2).update({"open_conversations": 1})
+    session.commit()
+    queued = add_conversation(session, 3, "pending")
+    viber = Mock()
+
+    approval = ViberMessage(
+        sender_viber_id="viber_user_1",
+        message_text="taip",
+        media_link="",
+        tracking_data={
+            "conversation_id": answered.conversation_id,
+            "system_message": True,
+            "flow": "klausimas",
+        },
+    )
+    FlowManager(session=session, viber=viber, viber_request=approval).execute_flow()
+
+    assert answered.status == "closed"
+    # both freed users were never assigned before, the lower user id goes first
+    assert (queued.status, queued.responder_user_id) == ("active", 1)
+    viber.send_messages.assert_called_once_with("viber_user_1", ANY)
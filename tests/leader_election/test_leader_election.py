@@ -0,0 +1,163 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app import leader_election
+from app.data_models import Base, SchedulerLease
+from app.leader_election import LeaderElectedJobs, SqlLease
+
+LEASE = timedelta(seconds=30)
+
+
+class Clock:
+    def __init__(self):
+        self.now = datetime(2024, 1, 1)
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'leases.db'}", future=True)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_one_holder_at_a_time_and_renewal(session_factory, clock):
+    lease = SqlLease(session_factory, "jobs", LEASE, clock=clock)
+
+    assert lease.acquire("first")
+    assert not lease.acquire("second")
+    clock.now += LEASE / 2
+    assert lease.acquire("first")
+    clock.now += LEASE / 2
+    assert not lease.acquire("second")
+
+
+def test_lease_fails_over_when_the_holder_stops_renewing(session_factory, clock):
+    lease = SqlLease(session_factory, "jobs", LEASE, clock=clock)
+    assert lease.acquire("first")
+
+    clock.now += LEASE
+    assert lease.acquire("second")
+    assert not lease.acquire("first")
+    with session_factory() as session:
+        assert session.get(SchedulerLease, "jobs").holder == "second"
+
+
+def test_released_lease_is_taken_right_away(session_factory, clock):
+    lease = SqlLease(session_factory, "jobs", LEASE, clock=clock)
+    assert lease.acquire("first")
+
+    lease.release("second")
+    assert not lease.acquire("second")
+    lease.release("first")
+    assert lease.acquire("second")
+
+
+def test_only_the_leader_runs_the_jobs(session_factory, clock):
+    runs = []
+    workers = [
+        LeaderElectedJobs(
+            SqlLease(session_factory, "jobs", LEASE, clock=clock),
+            jobs={"tick": (60, lambda holds_lease, holder=holder: runs.append(holder))},
+            holder=holder,
+        )
+        for holder in ("first", "second")
+    ]
+
+    for _ in range(3):
+        assert [worker.heartbeat() for worker in workers] == [True, False]
+        for worker in workers:
+            worker.run_due_jobs()
+    assert runs == ["first"]
+
+    workers[0].stop()
+    assert workers[1].heartbeat()
+    workers[1].run_due_jobs()
+    assert runs == ["first", "second"]
+
+
+def test_failing_job_keeps_the_lease_and_other_jobs(session_factory, clock):
+    runs = []
+
+    def fail(holds_lease):
+        raise RuntimeError("job failed")
+
+    worker = LeaderElectedJobs(
+        SqlLease(session_factory, "jobs", LEASE, clock=clock),
+        jobs={"fail": (0, fail), "tick": (0, lambda holds_lease: runs.append(1))},
+    )
+
+    for _ in range(2):
+        assert worker.heartbeat()
+        worker.run_due_jobs()
+    assert runs == [1, 1]
+
+
+def test_lease_is_not_held_once_it_may_have_run_out(session_factory, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(leader_election.time, "monotonic", lambda: now[0])
+    lease = SqlLease(session_factory, "jobs", LEASE)
+    worker = LeaderElectedJobs(lease, jobs={})
+
+    assert worker.heartbeat()
+    now[0] += LEASE.total_seconds() - 1
+    assert worker.holds_lease()
+    # the renewals fail, another process may take the lease from here on
+    failure = OperationalError("UPDATE scheduler_leases", {}, None)
+    monkeypatch.setattr(lease, "acquire", Mock(side_effect=failure))
+    assert not worker.heartbeat()
+    assert not worker.holds_lease()
+
+
+def test_long_job_does_not_hold_up_the_heartbeat(session_factory):
+    lease = SqlLease(session_factory, "jobs", timedelta(seconds=0.3))
+    finished = threading.Event()
+    leadership = []
+
+    def long_job(holds_lease):
+        # runs several leases long, the heartbeats keep renewing meanwhile
+        for _ in range(10):
+            time.sleep(0.1)
+            leadership.append(holds_lease())
+        finished.set()
+
+    worker = LeaderElectedJobs(
+        lease, jobs={"long": (60, long_job)}, heartbeat_seconds=0.05
+    )
+    worker.start()
+    assert finished.wait(5)
+    worker.stop(timeout=5)
+
+    assert all(leadership)
+    assert SqlLease(session_factory, "jobs", LEASE).acquire("other")
+
+
+def test_heartbeat_thread_runs_the_jobs_and_releases_on_stop(session_factory):
+    ran = threading.Event()
+    worker = LeaderElectedJobs(
+        SqlLease(session_factory, "jobs", LEASE),
+        jobs={"tick": (60, lambda holds_lease: ran.set())},
+        heartbeat_seconds=0.05,
+    )
+
+    worker.start()
+    assert ran.wait(5)
+    worker.stop(timeout=5)
+
+    assert not worker.is_leader
+    assert SqlLease(session_factory, "jobs", LEASE).acquire("other")
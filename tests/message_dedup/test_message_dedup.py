@@ -0,0 +1,103 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.data_models import Base, ProcessedMessage
+from app.message_dedup import AsyncSqlDedupStore, MemoryDedupStore, SqlDedupStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime(2024, 1, 1, 12, 0, 0)
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture(params=["memory", "sql"])
+def make_store(request, session_factory):
+    def make(clock, window=timedelta(minutes=10)):
+        if request.param == "memory":
+            return MemoryDedupStore(window=window, clock=clock)
+        return SqlDedupStore(session_factory, window=window, clock=clock)
+
+    return make
+
+
+def test_duplicate_token_is_rejected_within_window(make_store):
+    clock = FakeClock()
+    store = make_store(clock)
+
+    assert store.claim(4912661846655238145)
+    assert not store.claim(4912661846655238145)
+    assert store.claim(4912661846655238146)
+
+    clock.now += timedelta(minutes=10)
+    assert store.claim(4912661846655238145)
+
+
+def test_released_token_can_be_claimed_again(make_store):
+    store = make_store(FakeClock())
+
+    assert store.claim("912661846655238145")
+    store.release("912661846655238145")
+    assert store.claim("912661846655238145")
+
+
+def test_memory_store_is_bounded():
+    store = MemoryDedupStore(max_size=2, clock=FakeClock())
+    for token in (1, 2, 3):
+        assert store.claim(token)
+
+    assert store.claim(1)
+    assert not store.claim(3)
+
+
+def test_sql_store_purges_rows_outside_window(session_factory):
+    clock = FakeClock()
+    store = SqlDedupStore(
+        session_factory, window=timedelta(minutes=10), purge_every=3, clock=clock
+    )
+    store.claim(1)
+    store.claim(2)
+    clock.now += timedelta(minutes=11)
+    store.claim(3)
+
+    session = session_factory()
+    assert [row.message_token for row in session.query(ProcessedMessage)] == ["3"]
+    session.close()
+
+
+def test_async_sql_store_claims_and_releases():
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    clock = FakeClock()
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        store = AsyncSqlDedupStore(
+            async_sessionmaker(engine), window=timedelta(minutes=10), clock=clock
+        )
+        claims = [await store.claim(1), await store.claim(1)]
+        await store.release(1)
+        claims.append(await store.claim(1))
+        clock.now += timedelta(minutes=10)
+        claims.append(await store.claim(1))
+        await engine.dispose()
+        return claims
+
+    assert asyncio.run(run()) == [True, False, True, True]
@@ -0,0 +1,188 @@
+from datetime import datetime, timedelta
+from unittest.mock import ANY, Mock
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app.data_classes import DEFAULT_TIMEOUT_POLICY
+from app.data_models import (
+    ChatBotUser,
+    claim_due_conversation,
+    create_new_conversation,
+    create_question,
+    get_due_conversations,
+    rearm_conversation_deadline,
+    update_conversation,
+)
+from app.timeouts import fire_due_timeouts, run_timeouts_tick
+from tests.conftest import add_users
+
+POLICY = DEFAULT_TIMEOUT_POLICY
+
+
+def add_active_conversation(session, asker_user_id=1, responder_user_id=2):
+    question = create_question(session, "question", asker_user_id)
+    return create_new_conversation(
+        session, question.question_id, asker_user_id, responder_user_id, "active"
+    )
+
+
+def sent_texts(viber):
+    return [
+        (viber_id, messages[0].text)
+        for (viber_id, messages), _ in viber.send_messages.call_args_list
+    ]
+
+
+def test_active_conversation_is_armed_and_only_fires_when_due(session):
+    add_users(session, 2)
+    conversation = add_active_conversation(session)
+    viber = Mock()
+
+    assert conversation.deadline is not None
+    assert fire_due_timeouts(session, viber) == 0
+    viber.send_messages.assert_not_called()
+
+    later = conversation.deadline + timedelta(seconds=1)
+    assert fire_due_timeouts(session, viber, now=later) == 1
+
+    viber.send_messages.assert_called_once_with("viber_user_2", ANY)
+    assert conversation.reminders_sent == 1
+    assert conversation.deadline == later + POLICY.responder_reminder_after
+
+
+def test_activity_rearms_the_deadline(session):
+    add_users(session, 2)
+    conversation = add_active_conversation(session)
+    conversation.deadline = datetime(2000, 1, 1)
+    conversation.reminders_sent = 1
+    session.commit()
+
+    rearm_conversation_deadline(session, conversation.conversation_id)
+
+    assert conversation.deadline > datetime.now()
+    assert conversation.reminders_sent == 0
+    assert get_due_conversations(session, datetime.now(), 10) == []
+
+
+def test_conversation_is_reassigned_after_the_last_reminder(session):
+    add_users(session, 3)[1].open_conversations = 1
+    conversation = add_active_conversation(session)
+    viber = Mock()
+    now = conversation.deadline
+    for _ in range(POLICY.responder_reminders + 1):
+        now = now + POLICY.responder_reminder_after
+        fire_due_timeouts(session, viber, now=now)
+
+    assert conversation.status == "active"
+    assert conversation.responder_user_id == 3
+    assert conversation.previous_responder_user_id == 2
+    assert session.get(ChatBotUser, 2).open_conversations == 0
+    assert session.get(ChatBotUser, 3).open_conversations == 1
+    assert [viber_id for viber_id, _ in sent_texts(viber)] == (
+        ["viber_user_2"] * POLICY.responder_reminders + ["viber_user_3"]
+    )
+
+
+def test_asker_is_reminded_to_approve_once(session):
+    add_users(session, 2)
+    conversation = add_active_conversation(session)
+    update_conversation(
+        session, conversation.conversation_id, status="waiting_for_approval"
+    )
+    viber = Mock()
+    now = conversation.deadline
+
+    fire_due_timeouts(session, viber, now=now)
+    fire_due_timeouts(session, viber, now=now + POLICY.approval_reminder_after)
+
+    viber.send_messages.assert_called_once_with("viber_user_1", ANY)
+    assert conversation.deadline is None
+    assert conversation.status == "closed"
+
+
+def test_unapproved_conversation_frees_the_responder_for_new_questions(session):
+    add_users(session, 2)[1].open_conversations = 1
+    conversation = add_active_conversation(session)
+    update_conversation(
+        session, conversation.conversation_id, status="waiting_for_approval"
+    )
+    question = create_question(session, "next question", 1)
+    pending = create_new_conversation(
+        session, question.question_id, 1, None, "pending"
+    )
+    viber = Mock()
+    now = conversation.deadline
+    for _ in range(POLICY.approval_reminders + 1):
+        fire_due_timeouts(session, viber, now=now)
+        now = now + POLICY.approval_reminder_after
+
+    assert conversation.status == "closed"
+    assert pending.status == "active"
+    assert pending.responder_user_id == 2
+    assert session.get(ChatBotUser, 2).open_conversations == 1
+
+
+def test_timer_is_claimed_once(session):
+    add_users(session, 2)
+    conversation = add_active_conversation(session)
+    stale = Mock(
+        conversation_id=conversation.conversation_id,
+        deadline=conversation.deadline,
+        reminders_sent=conversation.reminders_sent,
+    )
+    next_deadline = conversation.deadline + timedelta(hours=1)
+
+    assert claim_due_conversation(session, conversation, next_deadline, 1)
+    assert not claim_due_conversation(session, stale, next_deadline, 1)
+
+
+def test_tick_fires_every_due_timeout_in_batches(engine, session):
+    add_users(session, 2)
+    conversations = [add_active_conversation(session) for _ in range(5)]
+    for conversation in conversations:
+        conversation.deadline = datetime(2000, 1, 1)
+    session.commit()
+    viber = Mock()
+
+    assert run_timeouts_tick(sessionmaker(bind=engine), viber, batch_size=2) == 5
+    assert viber.send_messages.call_count == 5
+
+
+def test_tick_stops_claiming_once_the_lease_is_lost(engine, session):
+    add_users(session, 2)
+    conversations = [add_active_conversation(session) for _ in range(5)]
+    for conversation in conversations:
+        conversation.deadline = datetime(2000, 1, 1)
+    session.commit()
+    viber = Mock()
+    holds_lease = Mock(side_effect=[True, True, False])
+
+    fired = run_timeouts_tick(
+        sessionmaker(bind=engine), viber, batch_size=2, holds_lease=holds_lease
+    )
+
+    assert fired == 2
+    assert viber.send_messages.call_count == 2
+    assert len(get_due_conversations(session, datetime.now(), 10)) == 3
+
+
+def test_due_conversations_are_read_from_the_deadline_index(engine, session):
+    captured = []
+
+    def capture(conn, cursor, sql, parameters, context, executemany):
+        captured.append((sql, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    get_due_conversations(session, datetime.now(), 10)
+    event.remove(engine, "before_cursor_execute", capture)
+
+    sql, parameters = captured[-1]
+    with engine.connect() as connection:
+        plan = " ".join(
+            str(row[-1])
+            for row in connection.exec_driver_sql(
+                "EXPLAIN QUERY PLAN " + sql, parameters
+            )
+        )
+    assert "ix_conversations_deadline" in plan
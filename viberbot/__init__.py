@@ -1,7 +1,7 @@
 from .api.api import Api
+from .api.async_api import AsyncApi
 from .api.bot_configuration import BotConfiguration
 from .version import __version__
 
-__all__ = ['Api', 'BotConfiguration']
+__all__ = ['Api', 'AsyncApi', 'BotConfiguration']
 __version__ = __version__
-
@@ -1,20 +1,42 @@
-import hashlib
-import hmac
-import json
+import functools
 import logging
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
-from viberbot.api.consts import VIBER_BOT_API_URL, VIBER_BOT_USER_AGENT
+from viberbot.api.consts import VIBER_BOT_API_URL, VIBER_BOT_USER_AGENT, MAX_BROADCAST_LIST_SIZE
+from viberbot.api.event_type import EventType, MANDATORY_EVENT_TYPES
+from viberbot.api.json_backend import default_backend
 from viberbot.api.viber_requests import create_request
 from viberbot.api.api_request_sender import ApiRequestSender
 from viberbot.api.message_sender import MessageSender
+from viberbot.api.ordered_dispatcher import OrderedDispatcher
+from viberbot.api.outbound_worker import OutboundWorkerPool
+from viberbot.api.send_result import BroadcastResult, SendResult
+from viberbot.api.signature_verifier import SignatureVerifier
 
+DEFAULT_MAX_WORKERS = 8
 
-class Api(object):
-	def __init__(self, bot_configuration):
+# escaped quotes inside string values never match, so only a real "event" key is found
+_EVENT_FIELD = re.compile(br'"event"\s*:\s*"([a-z_]+)"')
+
+
+class BaseApi(object):
+	"""
+	Request parsing and signature verification shared by Api and AsyncApi.
+	"""
+	def __init__(self, bot_configuration, json_backend=None, subscribed_events=None):
 		self._logger = logging.getLogger('viber.bot.api')
 		self._bot_configuration = bot_configuration
-		self._request_sender = ApiRequestSender(self._logger, VIBER_BOT_API_URL, bot_configuration, VIBER_BOT_USER_AGENT)
-		self._message_sender = MessageSender(self._logger, self._request_sender, bot_configuration)
+		self._json_backend = json_backend if json_backend is not None else default_backend()
+		self._signature_verifier = SignatureVerifier(bot_configuration.auth_token)
+		self._subscribed_events = frozenset(subscribed_events) if subscribed_events is not None else None
+		self._skipped_events = Counter()
+		self._skipped_events_lock = threading.Lock()
+		# last call handed to the lane of each receiver, while it has not finished
+		self._lane_tails = {}
+		self._lane_tails_lock = threading.Lock()
 
 	@property
 	def name(self):
@@ -24,19 +46,241 @@ class Api(object):
 	def avatar(self):
 		return self._bot_configuration.avatar
 
+	@property
+	def transport(self):
+		return self._request_sender.transport
+
+	@property
+	def rate_limiter(self):
+		return self._request_sender.rate_limiter
+
+	@property
+	def retry_counters(self):
+		return self._request_sender.retry_counters
+
+	@property
+	def circuit_breaker(self):
+		return self._request_sender.circuit_breaker
+
+	def verify_signature(self, request_data, signature):
+		"""
+		:param request_data: raw webhook body, as str, bytes, bytearray or memoryview
+		:param signature: value of the X-Viber-Content-Signature header
+		"""
+		return self._signature_verifier.verify(request_data, signature)
+
+	@property
+	def json_backend(self):
+		return self._json_backend
+
+	@property
+	def subscribed_events(self):
+		return self._subscribed_events
+
+	@property
+	def skipped_events(self):
+		"""
+		:return: dict of event type to the number of requests skipped by parse_request
+		"""
+		with self._skipped_events_lock:
+			return dict(self._skipped_events)
+
+	@staticmethod
+	def peek_event_type(request_data):
+		"""
+		Finds the event type of a raw webhook body without parsing it.
+		:return: the event type, or None if it could not be found
+		"""
+		if isinstance(request_data, str):
+			request_data = request_data.encode('utf-8')
+		match = _EVENT_FIELD.search(request_data)
+		return match.group(1).decode('ascii') if match is not None else None
+
+	def is_subscribed(self, request_data):
+		"""
+		:return: False if the body is an event the bot did not subscribe to, True otherwise
+		"""
+		return self._subscribed_events is None or self._is_subscribed_event(self.peek_event_type(request_data))
+
+	def parse_request(self, request_data, lazy=False):
+		"""
+		:param request_data: raw webhook body, as str, bytes, bytearray or memoryview
+		:param lazy: Optional. If True, the request fields, such as sender and message, are built on first access
+		:return: the ViberRequest of the event, or None if subscribed_events is set and does not include the event
+		"""
+		if self._subscribed_events is not None:
+			event_type = self.peek_event_type(request_data)
+			if not self._is_subscribed_event(event_type):
+				with self._skipped_events_lock:
+					self._skipped_events[event_type] += 1
+				self._logger.debug(u"skipping unsubscribed event: {0}".format(event_type))
+				return None
+
+		self._logger.debug("parsing request")
+		request = create_request(self._json_backend.loads(request_data), lazy)
+		if self._logger.isEnabledFor(logging.DEBUG):
+			self._logger.debug(u"parsed request={0}".format(request))
+		return request
+
+	def _is_subscribed_event(self, event_type):
+		# bodies without a recognizable event are parsed so that create_request reports them
+		return event_type is None or event_type == EventType.WEBHOOK or event_type in self._subscribed_events
+
+	def _webhook_events(self, webhook_events):
+		if webhook_events is None and self._subscribed_events is not None:
+			return sorted(self._subscribed_events - MANDATORY_EVENT_TYPES - {EventType.WEBHOOK})
+		return webhook_events
+
+	def _check_webhook_events(self, event_types):
+		if self._subscribed_events is None or event_types is None:
+			return
+		unhandled = set(event_types) - self._subscribed_events
+		if unhandled:
+			self._logger.warning(
+				u"viber will send events that are not subscribed and will be skipped: {0}".format(sorted(unhandled)))
+		missing = self._subscribed_events - set(event_types) - MANDATORY_EVENT_TYPES - {EventType.WEBHOOK}
+		if missing:
+			self._logger.warning(u"viber will not send subscribed events: {0}".format(sorted(missing)))
+
+	@staticmethod
+	def _broadcast_chunks(receivers):
+		receivers = list(receivers)
+		return [
+			receivers[start:start + MAX_BROADCAST_LIST_SIZE]
+			for start in range(0, len(receivers), MAX_BROADCAST_LIST_SIZE)]
+
+	def _log_dispatch_error(self, to, future):
+		if not future.cancelled() and future.exception() is not None:
+			self._logger.error(u"failed sending dispatched messages to {0}: {1}".format(to, future.exception()))
+
+	def _log_send_error(self, index, future):
+		if not future.cancelled() and future.exception() is not None:
+			self._logger.error(u"failed sending message #{0}: {1}".format(index, future.exception()))
+
+	def _track_lane_tail(self, receiver, future):
+		with self._lane_tails_lock:
+			self._lane_tails[receiver] = future
+		future.add_done_callback(lambda done: self._forget_lane_tail(receiver, done))
+		return future
+
+	def _forget_lane_tail(self, receiver, future):
+		with self._lane_tails_lock:
+			if self._lane_tails.get(receiver) is future:
+				del self._lane_tails[receiver]
+
+	def _lane_is_busy(self, receiver):
+		"""
+		:return: True while calls handed to the lane of receiver are unfinished, a message sent right away would
+		overtake them
+		"""
+		with self._lane_tails_lock:
+			return receiver in self._lane_tails
+
+
+class Api(BaseApi):
+	def __init__(self, bot_configuration, transport=None, rate_limiter=None, retry_policy=None,
+				circuit_breaker=None, deferred_queue=None, outbound_queue=None, lookup_cache=None,
+				max_workers=DEFAULT_MAX_WORKERS, json_backend=None, subscribed_events=None):
+		"""
+		:param bot_configuration: BotConfiguration of the bot
+		:param transport: Optional. HttpTransport to use for Viber API calls. A pooled keep-alive transport is created by default.
+		:param rate_limiter: Optional. RateLimiter throttling outbound Viber API calls.
+		:param retry_policy: Optional. RetryPolicy for transient Viber API failures. Defaults to RetryPolicy().
+		:param circuit_breaker: Optional. CircuitBreaker making calls fail fast while the Viber API is degraded.
+		:param deferred_queue: Optional. DeferredQueue keeping the sends refused by an open circuit, which return None
+		tokens. They are replayed in order before the next send or by replay_deferred. Without a queue, or when it is
+		full, such sends raise CircuitOpenError.
+		:param outbound_queue: Optional. OutboundQueue spooling every outgoing message. Sends return None at once and
+		the messages are delivered by the workers started with start_outbound_workers.
+		:param lookup_cache: Optional. LookupCache caching and coalescing get_user_details and get_online lookups.
+		:param max_workers: Optional. Number of threads used by broadcasts, and of lanes used by concurrent sends and
+		dispatch_messages.
+		:param json_backend: Optional. JSON backend parsing webhook bodies, orjson when installed and json otherwise.
+		:param subscribed_events: Optional. Event types the bot handles. Other events are skipped by parse_request
+		without being parsed, and set_webhook subscribes to these by default.
+		"""
+		super(Api, self).__init__(bot_configuration, json_backend, subscribed_events)
+		self._request_sender = ApiRequestSender(
+			self._logger, VIBER_BOT_API_URL, bot_configuration, VIBER_BOT_USER_AGENT, transport, rate_limiter,
+			retry_policy, circuit_breaker)
+		self._message_sender = MessageSender(
+			self._logger, self._request_sender, bot_configuration, deferred_queue, outbound_queue)
+		self._outbound_queue = outbound_queue
+		self._outbound_workers = None
+		self._lookup_cache = lookup_cache
+		self._max_workers = max_workers
+		self._executor = None
+		self._executor_lock = threading.Lock()
+		self._dispatcher = None
+
+	def replay_deferred(self):
+		"""
+		Sends the requests deferred while the circuit was open, for when no other send would replay them.
+		:return: number of deferred requests left, because the circuit refused them again
+		"""
+		return self._message_sender.replay_deferred()
+
+	def start_outbound_workers(self, workers=4, max_attempts=10):
+		"""
+		Starts threads delivering the messages spooled in the outbound queue.
+		:param workers: number of sender threads
+		:param max_attempts: deliveries of a single message after which it is dropped
+		:return: the started OutboundWorkerPool
+		"""
+		if self._outbound_queue is None:
+			raise Exception(u"missing outbound_queue, pass one to Api to start outbound workers")
+		if self._outbound_workers is not None:
+			raise Exception(u"outbound workers already started")
+
+		self._outbound_workers = OutboundWorkerPool(
+			self._logger, self._request_sender, self._outbound_queue, workers, max_attempts)
+		self._outbound_workers.start()
+		return self._outbound_workers
+
+	def close(self):
+		if self._outbound_workers is not None:
+			self._outbound_workers.stop()
+			self._outbound_workers = None
+		with self._executor_lock:
+			if self._dispatcher is not None:
+				self._dispatcher.close(wait=True)
+				self._dispatcher = None
+			if self._executor is not None:
+				self._executor.shutdown(wait=True)
+				self._executor = None
+		self._request_sender.transport.close()
+
 	def set_webhook(self, url, webhook_events=None, is_inline=False):
+		"""
+		:param webhook_events: Optional. Event types to receive, defaults to subscribed_events when it is set
+		:return: the event types Viber will send
+		"""
 		self._logger.debug(u"setting webhook to url: {0}".format(url))
-		return self._request_sender.set_webhook(url, webhook_events, is_inline)
+		event_types = self._request_sender.set_webhook(url, self._webhook_events(webhook_events), is_inline)
+		self._check_webhook_events(event_types)
+		return event_types
 
 	def unset_webhook(self):
 		self._logger.debug("unsetting webhook")
 		return self._request_sender.set_webhook('')
 
+	@property
+	def lookup_cache(self):
+		return self._lookup_cache
+
 	def get_online(self, ids):
-		return self._request_sender.get_online_status(ids)
+		if self._lookup_cache is None:
+			return self._request_sender.get_online_status(ids)
+		if ids is None or not isinstance(ids, list) or len(ids) == 0:
+			raise Exception(u"missing parameter ids, should be a list of viber memberIds")
+		return self._lookup_cache.get_online(ids, self._request_sender.get_online_status)
 
 	def get_user_details(self, user_id):
-		return self._request_sender.get_user_details(user_id)
+		if self._lookup_cache is None:
+			return self._request_sender.get_user_details(user_id)
+		if user_id is None:
+			raise Exception(u"missing parameter id")
+		return self._lookup_cache.get_user_details(user_id, self._request_sender.get_user_details)
 
 	def get_account_info(self):
 		self._logger.debug("requesting account info")
@@ -44,28 +288,31 @@ class Api(object):
 		self._logger.debug(u"received account info: {0}".format(account_info))
 		return account_info
 
-	def verify_signature(self, request_data, signature):
-		return signature == self._calculate_message_signature(request_data)
-
-	def parse_request(self, request_data):
-		self._logger.debug("parsing request")
-		request_dict = json.loads(request_data.decode() if isinstance(
-			request_data, bytes) else request_data)
-		request = create_request(request_dict)
-		self._logger.debug(u"parsed request={0}".format(request))
-		return request
-
-	def send_messages(self, to, messages, chat_id=None):
+	def send_messages(self, to, messages, chat_id=None, concurrent=False):
 		"""
 		:param to: Viber user id
 		:param messages: list of Message objects to be sent
 		:param chat_id: Optional. String. Indicates that this is a message sent in inline conversation.
-		:return: list of tokens of the sent messages
+		:param concurrent: Optional. If True, the first message is sent right away and the others are handed to the
+		ordered lane of the receiver, so the call returns after a single round trip. The returned SendResult fills in
+		as they are sent, its wait method blocks until all were. Errors are collected instead of raised. While earlier
+		messages to the receiver are still on its lane, the first message joins them instead of overtaking them. Called
+		from a lane, such as inside dispatch_messages, or with an outbound queue, all the messages are sent before
+		returning.
+		:return: list of tokens of the sent messages, or a SendResult when concurrent is True.
+		Tokens are None for messages spooled to the outbound queue.
 		"""
 		self._logger.debug("going to send messages: {0}, to: {1}".format(messages, to))
 		if not isinstance(messages, list):
 			messages = [messages]
 
+		if concurrent:
+			return self._send_concurrently(
+				to,
+				lambda message: self._message_sender.send_message(
+					to, self._bot_configuration.name, self._bot_configuration.avatar, message, chat_id),
+				messages)
+
 		sent_messages_tokens = []
 
 		for message in messages:
@@ -75,10 +322,36 @@ class Api(object):
 
 		return sent_messages_tokens
 
-	def post_messages_to_public_account(self, sender, messages):
+	def dispatch_messages(self, to, messages, chat_id=None):
+		"""
+		Sends the messages in the background without blocking the caller. Messages dispatched to the same
+		receiver are sent one after the other in dispatch order, while different receivers are served in parallel.
+		:param to: Viber user id
+		:param messages: list of Message objects to be sent, in order
+		:param chat_id: Optional. String. Indicates that this is a message sent in inline conversation.
+		:return: concurrent.futures.Future of the list of tokens of the sent messages
+		"""
+		future = self._track_lane_tail(to, self._get_dispatcher().submit(to, self.send_messages, to, messages, chat_id))
+		future.add_done_callback(lambda done: self._log_dispatch_error(to, done))
+		return future
+
+	def post_messages_to_public_account(self, sender, messages, concurrent=False):
+		"""
+		:param sender: Viber user id of the public account member posting
+		:param messages: list of Message objects to be posted
+		:param concurrent: Optional. Same semantics as in send_messages.
+		:return: list of tokens of the posted messages, or a SendResult when concurrent is True
+		"""
 		if not isinstance(messages, list):
 			messages = [messages]
 
+		if concurrent:
+			return self._send_concurrently(
+				sender,
+				lambda message: self._message_sender.post_to_public_account(
+					sender, self._bot_configuration.name, self._bot_configuration.avatar, message),
+				messages)
+
 		sent_messages_tokens = []
 
 		for message in messages:
@@ -88,9 +361,72 @@ class Api(object):
 
 		return sent_messages_tokens
 
-	def _calculate_message_signature(self, message):
-		return hmac.new(
-			bytes(self._bot_configuration.auth_token.encode('ascii')),
-			msg=message,
-			digestmod=hashlib.sha256)\
-			.hexdigest()
+	def broadcast_messages(self, receivers, message):
+		"""
+		:param receivers: iterable of Viber user ids, split into chunks of MAX_BROADCAST_LIST_SIZE
+		:param message: Message object to be broadcast
+		:return: BroadcastResult merging the responses of all chunks
+		"""
+		chunks = self._broadcast_chunks(receivers)
+		self._logger.debug(u"going to broadcast message: {0}, in {1} chunks".format(message, len(chunks)))
+
+		result = BroadcastResult(chunks)
+		futures = [
+			self._get_executor().submit(
+				self._message_sender.broadcast_message,
+				chunk, self._bot_configuration.name, self._bot_configuration.avatar, message)
+			for chunk in chunks]
+		for index, future in enumerate(futures):
+			try:
+				result.add_response(index, future.result())
+			except Exception as e:
+				self._logger.error(u"failed broadcasting chunk #{0}: {1}".format(index, e))
+				result.set_error(index, e)
+
+		return result
+
+	def _get_executor(self):
+		if self._executor is None:
+			with self._executor_lock:
+				if self._executor is None:
+					self._executor = ThreadPoolExecutor(
+						max_workers=self._max_workers, thread_name_prefix='viber-bot-api')
+		return self._executor
+
+	def _get_dispatcher(self):
+		if self._dispatcher is None:
+			with self._executor_lock:
+				if self._dispatcher is None:
+					self._dispatcher = OrderedDispatcher(lanes=self._max_workers)
+		return self._dispatcher
+
+	def _send_concurrently(self, receiver, send, messages):
+		result = SendResult(len(messages))
+		if not messages:
+			return result
+
+		dispatcher = self._get_dispatcher()
+		if self._outbound_queue is not None or dispatcher.in_lane():
+			# spooling is cheap and must keep the order, and a lane waiting on the lanes could deadlock
+			for index, message in enumerate(messages):
+				self._collect(result, index, send, message)
+			return result
+
+		# the lane of the receiver sends the rest strictly in order, other receivers overlap on the other lanes
+		first = 0
+		if not self._lane_is_busy(receiver):
+			self._collect(result, 0, send, messages[0])
+			first = 1
+		for index in range(first, len(messages)):
+			future = self._track_lane_tail(receiver, dispatcher.submit(receiver, send, messages[index]))
+			future.add_done_callback(functools.partial(self._log_send_error, index))
+			result.add_pending(index, future)
+
+		return result
+
+	def _collect(self, result, index, send, *args):
+		try:
+			result.set_token(index, send(*args))
+		except Exception as e:
+			self._logger.error(u"failed sending message #{0}: {1}".format(index, e))
+			result.set_error(index, e)
@@ -1,18 +1,69 @@
+import threading
+import time
+from collections import Counter
+
 import requests
 from requests import RequestException
 import traceback
-from viberbot.api.consts import BOT_API_ENDPOINT
+from viberbot.api.circuit_breaker import CircuitOpenError
+from viberbot.api.consts import BOT_API_ENDPOINT, BOT_API_RESPONSE_STATUS, HTTP_TOO_MANY_REQUESTS
+from viberbot.api.retry_policy import RetryPolicy
+from viberbot.api.transport import HttpTransport
 import json
 
 
-class ApiRequestSender(object):
-	def __init__(self, logger, viber_bot_api_url, bot_configuration, viber_bot_user_agent):
+class BaseApiRequestSender(object):
+	"""
+	Payload building and result checking shared by the blocking and asyncio request senders.
+	"""
+	def __init__(self, logger, viber_bot_api_url, bot_configuration, viber_bot_user_agent, transport,
+				rate_limiter=None, retry_policy=None, circuit_breaker=None):
 		self._logger = logger
 		self._viber_bot_api_url = viber_bot_api_url
 		self._bot_configuration = bot_configuration
 		self._user_agent = viber_bot_user_agent
-
-	def set_webhook(self, url, webhook_events=None, is_inline=False):
+		self._transport = transport
+		self._rate_limiter = rate_limiter
+		self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+		self._circuit_breaker = circuit_breaker
+		self._retry_counters = Counter()
+		self._retry_counters_lock = threading.Lock()
+		self._headers = requests.utils.default_headers()
+		self._headers.update({
+			'User-Agent': self._user_agent
+		})
+
+	@property
+	def transport(self):
+		return self._transport
+
+	@property
+	def rate_limiter(self):
+		return self._rate_limiter
+
+	@property
+	def retry_policy(self):
+		return self._retry_policy
+
+	@property
+	def circuit_breaker(self):
+		return self._circuit_breaker
+
+	@property
+	def retry_counters(self):
+		"""
+		:return: dict of endpoint to the number of retries made for it
+		"""
+		with self._retry_counters_lock:
+			return dict(self._retry_counters)
+
+	def _record_retry(self, endpoint, attempt, reason):
+		with self._retry_counters_lock:
+			self._retry_counters[endpoint] += 1
+		self._logger.warning(
+			u"retrying request to endpoint={0} after attempt {1} failed: {2}".format(endpoint, attempt, reason))
+
+	def _set_webhook_payload(self, url, webhook_events, is_inline):
 		payload = {
 			'auth_token': self._bot_configuration.auth_token,
 			'url': url,
@@ -24,44 +75,15 @@ class ApiRequestSender(object):
 				webhook_events = [webhook_events]
 			payload['event_types'] = webhook_events
 
-		result = self.post_request(
-			endpoint=BOT_API_ENDPOINT.SET_WEBHOOK,
-			payload=json.dumps(payload))
+		return json.dumps(payload)
 
-		if not result['status'] == 0:
-			raise Exception(u"failed with status: {0}, message: {1}".format(result['status'], result['status_message']))
-
-		return result['event_types']
-
-	def get_account_info(self):
+	def _account_info_payload(self):
 		payload = {
 			'auth_token': self._bot_configuration.auth_token
 		}
-		return self.post_request(
-			endpoint=BOT_API_ENDPOINT.GET_ACCOUNT_INFO,
-			payload=json.dumps(payload))
+		return json.dumps(payload)
 
-	def post_request(self, endpoint, payload):
-		try:
-			headers = requests.utils.default_headers()
-			headers.update({
-				'User-Agent': self._user_agent
-			})
-			response = requests.post(self._viber_bot_api_url + '/' + endpoint, data=payload, headers=headers)
-			response.raise_for_status()
-			return json.loads(response.text)
-		except RequestException as e:
-			self._logger.error(
-				u"failed to post request to endpoint={0}, with payload={1}. error is: {2}"
-				.format(endpoint, payload, traceback.format_exc()))
-			raise e
-		except Exception as ex:
-			self._logger.error(
-				u"unexpected Exception while trying to post request. error is: {0}"
-				.format(traceback.format_exc()))
-			raise ex
-
-	def get_online_status(self, ids=[]):
+	def _online_status_payload(self, ids):
 		if ids is None or not isinstance(ids, list) or len(ids) == 0:
 			raise Exception(u"missing parameter ids, should be a list of viber memberIds")
 
@@ -69,16 +91,9 @@ class ApiRequestSender(object):
 			'auth_token': self._bot_configuration.auth_token,
 			'ids': ids
 		}
-		result = self.post_request(
-			endpoint=BOT_API_ENDPOINT.GET_ONLINE,
-			payload=json.dumps(payload))
+		return json.dumps(payload)
 
-		if not result['status'] == 0:
-			raise Exception(u"failed with status: {0}, message: {1}".format(result['status'], result['status_message']))
-
-		return result['users']
-
-	def get_user_details(self, user_id):
+	def _user_details_payload(self, user_id):
 		if user_id is None:
 			raise Exception(u"missing parameter id")
 
@@ -86,13 +101,151 @@ class ApiRequestSender(object):
 			'auth_token': self._bot_configuration.auth_token,
 			'id': user_id
 		}
-		result = self.post_request(
-			endpoint=BOT_API_ENDPOINT.GET_USER_DETAILS,
-			payload=json.dumps(payload))
-
+		return json.dumps(payload)
+
+	def _observe_result(self, result):
+		if self._rate_limiter is None or not isinstance(result, dict):
+			return
+		if result.get('status') == BOT_API_RESPONSE_STATUS.TOO_MANY_REQUESTS:
+			self._logger.warning(u"viber api rate limit reached, throttling outbound requests")
+			self._rate_limiter.on_rate_limited()
+		else:
+			self._rate_limiter.on_success()
+
+	def _before_call(self):
+		if self._circuit_breaker is not None:
+			self._circuit_breaker.before_call()
+		return time.monotonic()
+
+	def _release_call(self):
+		if self._circuit_breaker is not None:
+			self._circuit_breaker.release_call()
+
+	def _after_call(self, started, error=None):
+		if self._circuit_breaker is None:
+			return
+		duration = time.monotonic() - started
+		if error is not None and self._is_service_failure(error):
+			self._circuit_breaker.record_failure(duration)
+		else:
+			self._circuit_breaker.record_success(duration)
+
+	@staticmethod
+	def _is_service_failure(error):
+		if isinstance(error, requests.HTTPError):
+			response = error.response
+			return response is None or response.status_code >= 500 or response.status_code == HTTP_TOO_MANY_REQUESTS
+		return True
+
+	def _log_circuit_open(self, endpoint):
+		self._logger.warning(u"circuit open, not posting request to endpoint={0}".format(endpoint))
+
+	def _observe_error(self, error):
+		response = getattr(error, 'response', None)
+		if self._rate_limiter is not None and response is not None \
+				and response.status_code == HTTP_TOO_MANY_REQUESTS:
+			self._logger.warning(u"viber api rate limit reached, throttling outbound requests")
+			self._rate_limiter.on_rate_limited()
+
+	def _url(self, endpoint):
+		return self._viber_bot_api_url + '/' + endpoint
+
+	def _log_request_error(self, endpoint, payload):
+		self._logger.error(
+			u"failed to post request to endpoint={0}, with payload={1}. error is: {2}"
+			.format(endpoint, payload, traceback.format_exc()))
+
+	def _log_unexpected_error(self):
+		self._logger.error(
+			u"unexpected Exception while trying to post request. error is: {0}"
+			.format(traceback.format_exc()))
+
+	@staticmethod
+	def _check_result(result):
 		if not result['status'] == 0:
 			raise Exception(u"failed with status: {0}, message: {1}".format(result['status'], result['status_message']))
+		return result
+
+
+class ApiRequestSender(BaseApiRequestSender):
+	def __init__(self, logger, viber_bot_api_url, bot_configuration, viber_bot_user_agent, transport=None,
+				rate_limiter=None, retry_policy=None, circuit_breaker=None):
+		super(ApiRequestSender, self).__init__(
+			logger, viber_bot_api_url, bot_configuration, viber_bot_user_agent,
+			transport if transport is not None else HttpTransport(), rate_limiter, retry_policy, circuit_breaker)
+
+	def set_webhook(self, url, webhook_events=None, is_inline=False):
+		result = self.post_request(
+			endpoint=BOT_API_ENDPOINT.SET_WEBHOOK,
+			payload=self._set_webhook_payload(url, webhook_events, is_inline))
+
+		return self._check_result(result)['event_types']
+
+	def get_account_info(self):
+		return self.post_request(
+			endpoint=BOT_API_ENDPOINT.GET_ACCOUNT_INFO,
+			payload=self._account_info_payload())
+
+	def post_request(self, endpoint, payload, receiver=None):
+		"""
+		:param receiver: Optional. Viber user id the request is addressed to, used for per-receiver rate limiting
+		"""
+		attempt = 1
+		while True:
+			try:
+				result = self._post_once(endpoint, payload, receiver)
+			except RequestException as e:
+				if not self._retry_policy.should_retry_error(endpoint, e, attempt):
+					self._log_request_error(endpoint, payload)
+					raise e
+				self._record_retry(endpoint, attempt, e)
+			except CircuitOpenError as e:
+				self._log_circuit_open(endpoint)
+				raise e
+			except Exception as ex:
+				self._log_unexpected_error()
+				raise ex
+			else:
+				if not self._retry_policy.should_retry_result(endpoint, result, attempt):
+					return result
+				self._record_retry(endpoint, attempt, result.get('status_message'))
+
+			self._retry_policy.sleep(attempt)
+			attempt += 1
+
+	def _post_once(self, endpoint, payload, receiver):
+		if self._rate_limiter is not None:
+			self._rate_limiter.acquire(receiver)
+
+		started = self._before_call()
+		try:
+			response = self._transport.post(self._url(endpoint), data=payload, headers=self._headers)
+			response.raise_for_status()
+		except Exception as e:
+			self._after_call(started, e)
+			if isinstance(e, RequestException):
+				self._observe_error(e)
+			raise e
+		except BaseException:
+			# cancelled or interrupted, the call has no outcome but must not keep its trial slot
+			self._release_call()
+			raise
+		self._after_call(started)
+
+		result = json.loads(response.text)
+		self._observe_result(result)
+		return result
+
+	def get_online_status(self, ids=[]):
+		result = self.post_request(
+			endpoint=BOT_API_ENDPOINT.GET_ONLINE,
+			payload=self._online_status_payload(ids))
 
-		return result['user']
+		return self._check_result(result)['users']
 
+	def get_user_details(self, user_id):
+		result = self.post_request(
+			endpoint=BOT_API_ENDPOINT.GET_USER_DETAILS,
+			payload=self._user_details_payload(user_id))
 
+		return self._check_result(result)['user']
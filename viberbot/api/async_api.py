@@ -0,0 +1,183 @@
+import asyncio
+import functools
+
+from viberbot.api.api import BaseApi
+from viberbot.api.async_api_request_sender import AsyncApiRequestSender
+from viberbot.api.async_message_sender import AsyncMessageSender
+from viberbot.api.consts import VIBER_BOT_API_URL, VIBER_BOT_USER_AGENT
+from viberbot.api.ordered_dispatcher import AsyncOrderedDispatcher, DEFAULT_LANES
+from viberbot.api.send_result import BroadcastResult, SendResult
+
+
+class AsyncApi(BaseApi):
+	"""
+	asyncio twin of Api. Network calls are coroutines, while request parsing,
+	signature verification and the message classes are shared with Api.
+	"""
+	def __init__(self, bot_configuration, transport=None, rate_limiter=None, retry_policy=None,
+				circuit_breaker=None, deferred_queue=None, lanes=DEFAULT_LANES, json_backend=None,
+				subscribed_events=None):
+		"""
+		:param bot_configuration: BotConfiguration of the bot
+		:param transport: Optional. AsyncHttpTransport to use for Viber API calls. An aiohttp based transport is created by default.
+		:param rate_limiter: Optional. RateLimiter throttling outbound Viber API calls.
+		:param retry_policy: Optional. RetryPolicy for transient Viber API failures. Defaults to RetryPolicy().
+		:param circuit_breaker: Optional. CircuitBreaker making calls fail fast while the Viber API is degraded.
+		:param deferred_queue: Optional. DeferredQueue keeping the sends refused by an open circuit, which return None
+		tokens. They are replayed in order before the next send or by replay_deferred. Without a queue, or when it is
+		full, such sends raise CircuitOpenError.
+		:param lanes: Optional. Number of lanes used by dispatch_messages.
+		:param json_backend: Optional. JSON backend parsing webhook bodies, orjson when installed and json otherwise.
+		:param subscribed_events: Optional. Same semantics as in Api.
+		"""
+		super(AsyncApi, self).__init__(bot_configuration, json_backend, subscribed_events)
+		self._request_sender = AsyncApiRequestSender(
+			self._logger, VIBER_BOT_API_URL, bot_configuration, VIBER_BOT_USER_AGENT, transport, rate_limiter,
+			retry_policy, circuit_breaker)
+		self._message_sender = AsyncMessageSender(
+			self._logger, self._request_sender, bot_configuration, deferred_queue)
+		self._dispatcher = AsyncOrderedDispatcher(lanes)
+
+	async def replay_deferred(self):
+		"""
+		Same semantics as Api.replay_deferred.
+		"""
+		return await self._message_sender.replay_deferred()
+
+	async def close(self):
+		await self._dispatcher.close()
+		await self._request_sender.transport.close()
+
+	async def set_webhook(self, url, webhook_events=None, is_inline=False):
+		self._logger.debug(u"setting webhook to url: {0}".format(url))
+		event_types = await self._request_sender.set_webhook(url, self._webhook_events(webhook_events), is_inline)
+		self._check_webhook_events(event_types)
+		return event_types
+
+	async def unset_webhook(self):
+		self._logger.debug("unsetting webhook")
+		return await self._request_sender.set_webhook('')
+
+	async def get_online(self, ids):
+		return await self._request_sender.get_online_status(ids)
+
+	async def get_user_details(self, user_id):
+		return await self._request_sender.get_user_details(user_id)
+
+	async def get_account_info(self):
+		self._logger.debug("requesting account info")
+		account_info = await self._request_sender.get_account_info()
+		self._logger.debug(u"received account info: {0}".format(account_info))
+		return account_info
+
+	async def send_messages(self, to, messages, chat_id=None, concurrent=False):
+		"""
+		:param to: Viber user id
+		:param messages: list of Message objects to be sent, in order
+		:param chat_id: Optional. String. Indicates that this is a message sent in inline conversation.
+		:param concurrent: Optional. Same semantics as in Api.send_messages, await wait_async of the SendResult
+		for the messages handed to the lane.
+		:return: list of tokens of the sent messages, or a SendResult when concurrent is True
+		"""
+		self._logger.debug("going to send messages: {0}, to: {1}".format(messages, to))
+		if not isinstance(messages, list):
+			messages = [messages]
+
+		if concurrent:
+			return await self._send_concurrently(
+				to,
+				lambda message: self._message_sender.send_message(
+					to, self._bot_configuration.name, self._bot_configuration.avatar, message, chat_id),
+				messages)
+
+		sent_messages_tokens = []
+
+		for message in messages:
+			token = await self._message_sender.send_message(
+				to, self._bot_configuration.name, self._bot_configuration.avatar, message, chat_id)
+			sent_messages_tokens.append(token)
+
+		return sent_messages_tokens
+
+	def dispatch_messages(self, to, messages, chat_id=None):
+		"""
+		Same semantics as Api.dispatch_messages, must be called from the running event loop.
+		:return: asyncio.Future of the list of tokens of the sent messages
+		"""
+		future = self._track_lane_tail(to, self._dispatcher.submit(to, self.send_messages, to, messages, chat_id))
+		future.add_done_callback(lambda done: self._log_dispatch_error(to, done))
+		return future
+
+	async def post_messages_to_public_account(self, sender, messages, concurrent=False):
+		if not isinstance(messages, list):
+			messages = [messages]
+
+		if concurrent:
+			return await self._send_concurrently(
+				sender,
+				lambda message: self._message_sender.post_to_public_account(
+					sender, self._bot_configuration.name, self._bot_configuration.avatar, message),
+				messages)
+
+		sent_messages_tokens = []
+
+		for message in messages:
+			token = await self._message_sender.post_to_public_account(
+				sender, self._bot_configuration.name, self._bot_configuration.avatar, message)
+			sent_messages_tokens.append(token)
+
+		return sent_messages_tokens
+
+	async def broadcast_messages(self, receivers, message):
+		"""
+		:param receivers: iterable of Viber user ids, split into chunks of MAX_BROADCAST_LIST_SIZE
+		:param message: Message object to be broadcast
+		:return: BroadcastResult merging the responses of all chunks
+		"""
+		chunks = self._broadcast_chunks(receivers)
+		self._logger.debug(u"going to broadcast message: {0}, in {1} chunks".format(message, len(chunks)))
+
+		outcomes = await asyncio.gather(*[
+			self._message_sender.broadcast_message(
+				chunk, self._bot_configuration.name, self._bot_configuration.avatar, message)
+			for chunk in chunks], return_exceptions=True)
+
+		result = BroadcastResult(chunks)
+		for index, outcome in enumerate(outcomes):
+			if isinstance(outcome, Exception):
+				self._logger.error(u"failed broadcasting chunk #{0}: {1}".format(index, outcome))
+				result.set_error(index, outcome)
+			else:
+				result.add_response(index, outcome)
+
+		return result
+
+	async def _send_concurrently(self, receiver, send, messages):
+		result = SendResult(len(messages))
+		if not messages:
+			return result
+
+		if self._dispatcher.in_lane():
+			# a lane awaiting the lanes could deadlock, the messages are sent in order right here
+			for index, message in enumerate(messages):
+				await self._collect(result, index, send, message)
+			return result
+
+		# the lane of the receiver sends the rest strictly in order, other receivers overlap on the other lanes
+		first = 0
+		if not self._lane_is_busy(receiver):
+			await self._collect(result, 0, send, messages[0])
+			first = 1
+		for index in range(first, len(messages)):
+			future = self._track_lane_tail(receiver, self._dispatcher.submit(receiver, send, messages[index]))
+			future.add_done_callback(functools.partial(self._log_send_error, index))
+			result.add_pending(index, future)
+
+		return result
+
+	async def _collect(self, result, index, send, message):
+		try:
+			result.set_token(index, await send(message))
+		except Exception as e:
+			self._logger.error(u"failed sending message #{0}: {1}".format(index, e))
+			result.set_error(index, e)
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from requests import RequestException
+
+from viberbot.api.api_request_sender import BaseApiRequestSender
+from viberbot.api.circuit_breaker import CircuitOpenError
+from viberbot.api.consts import BOT_API_ENDPOINT
+from viberbot.api.transport import AsyncHttpTransport
+
+
+class AsyncApiRequestSender(BaseApiRequestSender):
+	def __init__(self, logger, viber_bot_api_url, bot_configuration, viber_bot_user_agent, transport=None,
+				rate_limiter=None, retry_policy=None, circuit_breaker=None):
+		super(AsyncApiRequestSender, self).__init__(
+			logger, viber_bot_api_url, bot_configuration, viber_bot_user_agent,
+			transport if transport is not None else AsyncHttpTransport(), rate_limiter, retry_policy, circuit_breaker)
+
+	async def set_webhook(self, url, webhook_events=None, is_inline=False):
+		result = await self.post_request(
+			endpoint=BOT_API_ENDPOINT.SET_WEBHOOK,
+			payload=self._set_webhook_payload(url, webhook_events, is_inline))
+
+		return self._check_result(result)['event_types']
+
+	async def get_account_info(self):
+		return await self.post_request(
+			endpoint=BOT_API_ENDPOINT.GET_ACCOUNT_INFO,
+			payload=self._account_info_payload())
+
+	async def post_request(self, endpoint, payload, receiver=None):
+		attempt = 1
+		while True:
+			try:
+				result = await self._post_once(endpoint, payload, receiver)
+			except RequestException as e:
+				if not self._retry_policy.should_retry_error(endpoint, e, attempt):
+					self._log_request_error(endpoint, payload)
+					raise e
+				self._record_retry(endpoint, attempt, e)
+			except CircuitOpenError as e:
+				self._log_circuit_open(endpoint)
+				raise e
+			except Exception as ex:
+				self._log_unexpected_error()
+				raise ex
+			else:
+				if not self._retry_policy.should_retry_result(endpoint, result, attempt):
+					return result
+				self._record_retry(endpoint, attempt, result.get('status_message'))
+
+			await asyncio.sleep(self._retry_policy.backoff(attempt))
+			attempt += 1
+
+	async def _post_once(self, endpoint, payload, receiver):
+		if self._rate_limiter is not None:
+			await self._rate_limiter.acquire_async(receiver)
+
+		started = self._before_call()
+		try:
+			response = await self._transport.post(self._url(endpoint), data=payload, headers=self._headers)
+			response.raise_for_status()
+		except Exception as e:
+			self._after_call(started, e)
+			if isinstance(e, RequestException):
+				self._observe_error(e)
+			raise e
+		except BaseException:
+			# cancelled or interrupted, the call has no outcome but must not keep its trial slot
+			self._release_call()
+			raise
+		self._after_call(started)
+
+		result = json.loads(response.text)
+		self._observe_result(result)
+		return result
+
+	async def get_online_status(self, ids=[]):
+		result = await self.post_request(
+			endpoint=BOT_API_ENDPOINT.GET_ONLINE,
+			payload=self._online_status_payload(ids))
+
+		return self._check_result(result)['users']
+
+	async def get_user_details(self, user_id):
+		result = await self.post_request(
+			endpoint=BOT_API_ENDPOINT.GET_USER_DETAILS,
+			payload=self._user_details_payload(user_id))
+
+		return self._check_result(result)['user']
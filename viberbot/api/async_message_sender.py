@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+from viberbot.api.circuit_breaker import CircuitOpenError
+from viberbot.api.consts import BOT_API_ENDPOINT
+from viberbot.api.message_sender import BaseMessageSender
+
+
+class AsyncMessageSender(BaseMessageSender):
+	@staticmethod
+	def _create_replay_lock():
+		return asyncio.Lock()
+
+	async def send_message(self, to, sender_name, sender_avatar, message, chat_id=None):
+		payload = self._send_message_payload(to, sender_name, sender_avatar, message, chat_id)
+		return await self._post_request(BOT_API_ENDPOINT.SEND_MESSAGE, payload)
+
+	async def post_to_public_account(self, sender, sender_name, sender_avatar, message):
+		payload = self._post_to_public_account_payload(sender, sender_name, sender_avatar, message)
+		return await self._post_request(BOT_API_ENDPOINT.POST, payload)
+
+	async def broadcast_message(self, broadcast_list, sender_name, sender_avatar, message):
+		payload = json.dumps(self._broadcast_message_payload(broadcast_list, sender_name, sender_avatar, message))
+		if self._outbound_queue is not None:
+			self._enqueue(BOT_API_ENDPOINT.BROADCAST_MESSAGE, payload)
+			return None
+
+		try:
+			await self._replay_before_send()
+			result = await self._request_sender.post_request(BOT_API_ENDPOINT.BROADCAST_MESSAGE, payload)
+		except CircuitOpenError as e:
+			self._defer(BOT_API_ENDPOINT.BROADCAST_MESSAGE, payload, None, e)
+			return None
+
+		return self._check_status(result)
+
+	async def replay_deferred(self):
+		"""
+		Same semantics as MessageSender.replay_deferred.
+		:return: number of deferred requests left
+		"""
+		if not self._has_deferred():
+			return 0
+
+		async with self._replay_lock:
+			while self._has_deferred():
+				endpoint, payload, receiver = self._deferred_queue.peek()
+				try:
+					result = await self._request_sender.post_request(endpoint, payload, receiver=receiver)
+				except CircuitOpenError:
+					break
+				except Exception as e:
+					result = dict(status=None, status_message=e)
+				self._deferred_queue.pop()
+				self._replayed(endpoint, result)
+			return len(self._deferred_queue)
+
+	async def _replay_before_send(self):
+		if await self.replay_deferred():
+			raise CircuitOpenError(u"circuit open, earlier requests are still deferred")
+
+	async def _post_request(self, endpoint, payload):
+		receiver = payload.get('receiver')
+		payload = json.dumps(payload)
+		if self._outbound_queue is not None:
+			self._enqueue(endpoint, payload, receiver)
+			return None
+
+		try:
+			await self._replay_before_send()
+			result = await self._request_sender.post_request(endpoint, payload, receiver=receiver)
+		except CircuitOpenError as e:
+			self._defer(endpoint, payload, receiver, e)
+			return None
+
+		return self._message_token(result)
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpenError(Exception):
+	pass
+
+
+class CircuitBreaker(object):
+	"""
+	Circuit breaker around the Viber API.
+
+	Outcomes of the last window_size calls are kept. Once at least minimum_calls
+	were made and the share of failed (or slower than slow_call_duration) calls
+	reaches failure_rate_threshold, the circuit opens and calls fail fast with
+	CircuitOpenError. After open_timeout seconds the circuit becomes half open and
+	lets half_open_max_calls trial calls through: if they all succeed the circuit
+	closes, a single failure opens it again.
+	"""
+	CLOSED = 'closed'
+	OPEN = 'open'
+	HALF_OPEN = 'half_open'
+
+	def __init__(self, failure_rate_threshold=0.5, window_size=20, minimum_calls=10, slow_call_duration=None,
+				open_timeout=30, half_open_max_calls=1, clock=time.monotonic):
+		"""
+		:param failure_rate_threshold: share of failed calls in the window, between 0 and 1, that opens the circuit
+		:param window_size: number of most recent calls considered
+		:param minimum_calls: number of calls needed in the window before the circuit may open
+		:param slow_call_duration: Optional. Seconds after which a successful call is counted as failed
+		:param open_timeout: seconds the circuit stays open before trial calls are allowed
+		:param half_open_max_calls: number of trial calls allowed while half open
+		"""
+		self._failure_rate_threshold = failure_rate_threshold
+		self._minimum_calls = minimum_calls
+		self._slow_call_duration = slow_call_duration
+		self._open_timeout = open_timeout
+		self._half_open_max_calls = half_open_max_calls
+		self._clock = clock
+		self._lock = threading.Lock()
+		self._outcomes = deque(maxlen=window_size)
+		self._state = self.CLOSED
+		self._opened_at = None
+		self._trial_calls = 0
+		self._trial_successes = 0
+
+	@property
+	def state(self):
+		with self._lock:
+			self._update_state()
+			return self._state
+
+	@property
+	def remaining_open_time(self):
+		"""
+		:return: seconds until the open circuit lets trial calls through, 0 when it is not open
+		"""
+		with self._lock:
+			self._update_state()
+			if self._state != self.OPEN:
+				return 0.0
+			return max(0.0, self._open_timeout - (self._clock() - self._opened_at))
+
+	@property
+	def failure_rate(self):
+		with self._lock:
+			if not self._outcomes:
+				return 0.0
+			return self._outcomes.count(False) / float(len(self._outcomes))
+
+	def before_call(self):
+		"""
+		:raise CircuitOpenError: if the call is not allowed through
+		"""
+		with self._lock:
+			self._update_state()
+			if self._state == self.OPEN:
+				raise CircuitOpenError(u"circuit open, viber api calls are suspended")
+			if self._state == self.HALF_OPEN:
+				if self._trial_calls >= self._half_open_max_calls:
+					raise CircuitOpenError(u"circuit half open, waiting for trial calls to finish")
+				self._trial_calls += 1
+
+	def record_success(self, duration=0.0):
+		if self._slow_call_duration is not None and duration > self._slow_call_duration:
+			self.record_failure(duration)
+			return
+
+		with self._lock:
+			if self._state == self.HALF_OPEN:
+				self._trial_successes += 1
+				if self._trial_successes >= self._half_open_max_calls:
+					self._close()
+				return
+			self._outcomes.append(True)
+
+	def record_failure(self, duration=0.0):
+		with self._lock:
+			if self._state == self.HALF_OPEN:
+				self._open()
+				return
+			self._outcomes.append(False)
+			if len(self._outcomes) >= self._minimum_calls and \
+					self._outcomes.count(False) >= self._failure_rate_threshold * len(self._outcomes):
+				self._open()
+
+	def release_call(self):
+		"""
+		Frees the trial slot of a call that ended without an outcome, such as a cancelled call,
+		so the next call may be the trial instead.
+		"""
+		with self._lock:
+			if self._state == self.HALF_OPEN and self._trial_calls > 0:
+				self._trial_calls -= 1
+
+	def _update_state(self):
+		if self._state == self.OPEN and self._clock() - self._opened_at >= self._open_timeout:
+			self._state = self.HALF_OPEN
+			self._trial_calls = 0
+			self._trial_successes = 0
+
+	def _open(self):
+		self._state = self.OPEN
+		self._opened_at = self._clock()
+
+	def _close(self):
+		self._state = self.CLOSED
+		self._opened_at = None
+		self._outcomes.clear()
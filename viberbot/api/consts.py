@@ -2,12 +2,43 @@ from ..version import __version__
 
 VIBER_BOT_API_URL = "https://chatapi.viber.com/pa"
 VIBER_BOT_USER_AGENT = "ViberBot-Python/" + __version__
+MAX_BROADCAST_LIST_SIZE = 300
+MAX_GET_ONLINE_IDS = 100
 
 
 class BOT_API_ENDPOINT(object):
 	SET_WEBHOOK = 'set_webhook'
 	GET_ACCOUNT_INFO = 'get_account_info'
 	SEND_MESSAGE = 'send_message'
+	BROADCAST_MESSAGE = 'broadcast_message'
 	GET_ONLINE = 'get_online'
 	GET_USER_DETAILS = 'get_user_details'
 	POST = 'post'
+
+
+class BOT_API_RESPONSE_STATUS(object):
+	OK = 0
+	INVALID_URL = 1
+	INVALID_AUTH_TOKEN = 2
+	BAD_DATA = 3
+	MISSING_DATA = 4
+	RECEIVER_NOT_REGISTERED = 5
+	RECEIVER_NOT_SUBSCRIBED = 6
+	PUBLIC_ACCOUNT_BLOCKED = 7
+	PUBLIC_ACCOUNT_NOT_FOUND = 8
+	PUBLIC_ACCOUNT_SUSPENDED = 9
+	WEBHOOK_NOT_SET = 10
+	RECEIVER_NO_SUITABLE_DEVICE = 11
+	TOO_MANY_REQUESTS = 12
+	API_VERSION_NOT_SUPPORTED = 13
+	INCOMPATIBLE_WITH_VERSION = 14
+	PUBLIC_ACCOUNT_NOT_AUTHORIZED = 15
+	INCHAT_REPLY_MESSAGE_NOT_ALLOWED = 16
+	PUBLIC_ACCOUNT_IS_NOT_INLINE = 17
+	NO_PUBLIC_CHAT = 18
+	CANNOT_SEND_BROADCAST = 19
+	BROADCAST_NOT_ALLOWED = 20
+	GENERAL_ERROR = 99
+
+
+HTTP_TOO_MANY_REQUESTS = 429
@@ -0,0 +1,56 @@
+import threading
+from collections import deque
+
+DEFAULT_MAX_DEFERRED = 1000
+
+
+class DeferredQueueFull(Exception):
+	pass
+
+
+class DeferredQueue(object):
+	"""
+	Bounded in-memory queue of the (endpoint, payload, receiver) requests refused by an
+	open circuit breaker, replayed in order by the message senders.
+
+	An entry stays at the head of the queue until it was sent, so a send racing a
+	replay sees the queue is not empty and waits for the replay instead of overtaking it.
+	"""
+	def __init__(self, maxsize=DEFAULT_MAX_DEFERRED):
+		"""
+		:param maxsize: number of requests kept, beyond which put raises DeferredQueueFull
+		"""
+		self._maxsize = maxsize
+		self._entries = deque()
+		self._lock = threading.Lock()
+
+	@property
+	def maxsize(self):
+		return self._maxsize
+
+	def put(self, item):
+		"""
+		:raise DeferredQueueFull: if maxsize requests are already deferred
+		"""
+		with self._lock:
+			if len(self._entries) >= self._maxsize:
+				raise DeferredQueueFull(u"deferred queue is full, {0} requests deferred".format(self._maxsize))
+			self._entries.append(item)
+
+	def peek(self):
+		"""
+		:return: the oldest deferred request, or None if there is none
+		"""
+		with self._lock:
+			return self._entries[0] if self._entries else None
+
+	def pop(self):
+		"""
+		Removes the oldest deferred request, once it was sent.
+		"""
+		with self._lock:
+			return self._entries.popleft()
+
+	def __len__(self):
+		with self._lock:
+			return len(self._entries)
@@ -7,3 +7,7 @@ class EventType(object):
 	UNSUBSCRIBED = 'unsubscribed'
 	FAILED = 'failed'
 	WEBHOOK = 'webhook'
+
+
+# always sent by viber, they are neither requested nor listed in the set_webhook response
+MANDATORY_EVENT_TYPES = frozenset([EventType.MESSAGE, EventType.SUBSCRIBED, EventType.UNSUBSCRIBED])
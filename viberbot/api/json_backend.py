@@ -0,0 +1,42 @@
+import json
+
+try:
+	import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+	orjson = None
+
+
+class StdlibJsonBackend(object):
+	name = 'json'
+
+	@staticmethod
+	def loads(data):
+		if isinstance(data, memoryview):
+			data = data.tobytes()
+		return json.loads(data)
+
+	@staticmethod
+	def dumps(obj):
+		return json.dumps(obj)
+
+
+class OrjsonBackend(object):
+	"""
+	Backend on top of orjson, which parses bytes and memoryviews without decoding them to str first.
+	"""
+	name = 'orjson'
+
+	@staticmethod
+	def loads(data):
+		return orjson.loads(data)
+
+	@staticmethod
+	def dumps(obj):
+		return orjson.dumps(obj).decode('utf-8')
+
+
+def default_backend():
+	"""
+	:return: OrjsonBackend if orjson is installed, StdlibJsonBackend otherwise
+	"""
+	return OrjsonBackend if orjson is not None else StdlibJsonBackend
@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from viberbot.api.consts import MAX_GET_ONLINE_IDS
+
+
+class TtlCache(object):
+	"""
+	Thread safe LRU cache whose entries expire ttl seconds after being set.
+	"""
+	def __init__(self, max_size=10000, ttl=300, clock=time.monotonic):
+		self._max_size = max_size
+		self._ttl = ttl
+		self._clock = clock
+		self._lock = threading.Lock()
+		self._entries = OrderedDict()
+
+	def get(self, key):
+		"""
+		:return: (True, value) if a fresh value is cached, (False, None) otherwise
+		"""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				return False, None
+			expires_at, value = entry
+			if expires_at <= self._clock():
+				del self._entries[key]
+				return False, None
+			self._entries.move_to_end(key)
+			return True, value
+
+	def set(self, key, value):
+		with self._lock:
+			self._entries[key] = (self._clock() + self._ttl, value)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self._max_size:
+				self._entries.popitem(last=False)
+
+	def invalidate(self, key):
+		with self._lock:
+			self._entries.pop(key, None)
+
+	def __len__(self):
+		with self._lock:
+			return len(self._entries)
+
+
+class _Call(object):
+	def __init__(self):
+		self.done = threading.Event()
+		self.result = None
+		self.error = None
+
+	def wait(self):
+		self.done.wait()
+		if self.error is not None:
+			raise self.error
+		return self.result
+
+	def finish(self, result=None, error=None):
+		self.result = result
+		self.error = error
+		self.done.set()
+
+
+class LookupCache(object):
+	"""
+	Caches get_user_details and get_online results.
+
+	Concurrent get_user_details lookups of the same user share a single request.
+	get_online lookups made within batch_window seconds of each other are merged
+	into one call per MAX_GET_ONLINE_IDS ids. Failed lookups are not cached.
+	"""
+	def __init__(self, user_details_ttl=3600, online_ttl=30, max_size=10000, batch_window=0.05,
+				clock=time.monotonic, sleep=time.sleep):
+		"""
+		:param user_details_ttl: seconds a user details lookup stays cached
+		:param online_ttl: seconds an online status stays cached
+		:param max_size: number of entries kept in each of the two caches
+		:param batch_window: seconds get_online waits to collect the ids requested by other callers
+		"""
+		self._user_details = TtlCache(max_size, user_details_ttl, clock)
+		self._online = TtlCache(max_size, online_ttl, clock)
+		self._batch_window = batch_window
+		self._sleep = sleep
+		self._lock = threading.Lock()
+		self._user_details_calls = {}
+		self._online_batch = None
+		self._stats = Counter()
+
+	@property
+	def stats(self):
+		"""
+		:return: dict of hits, misses, coalesced lookups and requests made, per lookup type
+		"""
+		with self._lock:
+			return dict(self._stats)
+
+	def get_user_details(self, user_id, fetch):
+		"""
+		:param fetch: function returning the user details of a user id from the Viber API
+		"""
+		hit, user = self._user_details.get(user_id)
+		if hit:
+			self._count('user_details_hits')
+			return user
+
+		with self._lock:
+			call = self._user_details_calls.get(user_id)
+			leader = call is None
+			if leader:
+				call = _Call()
+				self._user_details_calls[user_id] = call
+				self._stats['user_details_misses'] += 1
+				self._stats['user_details_requests'] += 1
+			else:
+				self._stats['user_details_coalesced'] += 1
+
+		if not leader:
+			return call.wait()
+
+		try:
+			user = fetch(user_id)
+		except Exception as e:
+			call.finish(error=e)
+			raise
+		else:
+			self._user_details.set(user_id, user)
+			call.finish(result=user)
+			return user
+		finally:
+			with self._lock:
+				del self._user_details_calls[user_id]
+
+	def get_online(self, ids, fetch):
+		"""
+		:param fetch: function returning the online statuses of at most MAX_GET_ONLINE_IDS ids from the Viber API
+		:return: list of the online statuses of the given ids that Viber knows of, in the order of ids
+		"""
+		statuses = {}
+		missing = []
+		for user_id in ids:
+			hit, status = self._online.get(user_id)
+			if hit:
+				statuses[user_id] = status
+			elif user_id not in missing:
+				missing.append(user_id)
+		self._count('online_hits', len(ids) - len(missing))
+
+		if missing:
+			self._count('online_misses', len(missing))
+			statuses.update(self._fetch_online(missing, fetch))
+
+		return [statuses[user_id] for user_id in ids if user_id in statuses]
+
+	def invalidate(self, user_id):
+		self._user_details.invalidate(user_id)
+		self._online.invalidate(user_id)
+
+	def _fetch_online(self, ids, fetch):
+		with self._lock:
+			batch = self._online_batch
+			leader = batch is None
+			if leader:
+				batch = self._online_batch = _OnlineBatch()
+			else:
+				self._stats['online_coalesced'] += 1
+			batch.add(ids)
+
+		if not leader:
+			return batch.call.wait()
+
+		self._sleep(self._batch_window)
+		with self._lock:
+			self._online_batch = None
+			chunks = batch.chunks()
+			self._stats['online_requests'] += len(chunks)
+
+		statuses = {}
+		try:
+			for chunk in chunks:
+				for status in fetch(chunk):
+					statuses[status['id']] = status
+					self._online.set(status['id'], status)
+		except Exception as e:
+			batch.call.finish(error=e)
+			raise
+		batch.call.finish(result=statuses)
+		return statuses
+
+	def _count(self, name, value=1):
+		if value:
+			with self._lock:
+				self._stats[name] += value
+
+
+class _OnlineBatch(object):
+	def __init__(self):
+		self.call = _Call()
+		self._ids = OrderedDict()
+
+	def add(self, ids):
+		for user_id in ids:
+			self._ids[user_id] = None
+
+	def chunks(self):
+		ids = list(self._ids)
+		return [ids[start:start + MAX_GET_ONLINE_IDS] for start in range(0, len(ids), MAX_GET_ONLINE_IDS)]
@@ -1,18 +1,37 @@
 import json
-
-from viberbot.api.consts import BOT_API_ENDPOINT
-
-
-class MessageSender(object):
-	def __init__(self, logger, request_sender, bot_configuration):
+import threading
+
+from viberbot.api.circuit_breaker import CircuitOpenError
+from viberbot.api.consts import BOT_API_ENDPOINT, MAX_BROADCAST_LIST_SIZE
+from viberbot.api.deferred_queue import DeferredQueueFull
+
+
+class BaseMessageSender(object):
+	"""
+	Validation and payload building shared by the blocking and asyncio message senders.
+	"""
+	def __init__(self, logger, request_sender, bot_configuration, deferred_queue=None, outbound_queue=None):
+		"""
+		:param deferred_queue: Optional. DeferredQueue keeping the requests refused by an open circuit breaker, which
+		return None instead of a token. They are replayed in order before the next send, so the first call let through
+		once the circuit half opens is the oldest deferred request, or by replay_deferred. Without a queue, or when
+		it is full, such sends raise CircuitOpenError.
+		:param outbound_queue: Optional. OutboundQueue receiving every message instead of sending it right away,
+		to be drained by an OutboundWorkerPool.
+		"""
 		self._logger = logger
 		self._request_sender = request_sender
 		self._bot_configuration = bot_configuration
+		self._deferred_queue = deferred_queue
+		self._outbound_queue = outbound_queue
+		self._replay_lock = self._create_replay_lock()
 
-	def send_message(self, to, sender_name, sender_avatar, message, chat_id=None):
-		if not message.validate():
-			self._logger.error(u"failed validating message: {0}".format(message))
-			raise Exception("failed validating message: {0}".format(message))
+	@staticmethod
+	def _create_replay_lock():
+		return threading.Lock()
+
+	def _send_message_payload(self, to, sender_name, sender_avatar, message, chat_id=None):
+		self._validate(message)
 
 		payload = self._prepare_payload(
 			message=message,
@@ -23,13 +42,10 @@ class MessageSender(object):
 		)
 
 		self._logger.debug(u"going to send message: {0}".format(payload))
+		return payload
 
-		return self._post_request(BOT_API_ENDPOINT.SEND_MESSAGE, payload)
-
-	def post_to_public_account(self, sender, sender_name, sender_avatar, message):
-		if not message.validate():
-			self._logger.error(u"failed validating message: {0}".format(message))
-			raise Exception("failed validating message: {0}".format(message))
+	def _post_to_public_account_payload(self, sender, sender_name, sender_avatar, message):
+		self._validate(message)
 
 		if sender is None:
 			raise Exception(u"missing parameter sender")
@@ -42,17 +58,67 @@ class MessageSender(object):
 		)
 
 		self._logger.debug(u"going to send message: {0}".format(payload))
+		return payload
 
-		return self._post_request(BOT_API_ENDPOINT.POST, payload)
+	def _broadcast_message_payload(self, broadcast_list, sender_name, sender_avatar, message):
+		self._validate(message)
 
-	def _post_request(self, endpoint, payload):
-		result = self._request_sender.post_request(
-			endpoint, json.dumps(payload))
+		if not broadcast_list or not isinstance(broadcast_list, list):
+			raise Exception(u"missing parameter broadcast_list, should be a list of viber memberIds")
+
+		if len(broadcast_list) > MAX_BROADCAST_LIST_SIZE:
+			raise Exception(u"broadcast_list is limited to {0} receivers, got {1}".format(
+				MAX_BROADCAST_LIST_SIZE, len(broadcast_list)))
+
+		payload = self._prepare_payload(
+			message=message,
+			sender_name=sender_name,
+			sender_avatar=sender_avatar
+		)
+		payload['broadcast_list'] = broadcast_list
+
+		self._logger.debug(u"going to broadcast message to {0} receivers".format(len(broadcast_list)))
+		return payload
 
+	@staticmethod
+	def _check_status(result):
 		if not result['status'] == 0:
 			raise Exception(u"failed with status: {0}, message: {1}".format(result['status'], result['status_message']))
 
-		return result['message_token']
+		return result
+
+	def _defer(self, endpoint, payload, receiver, error):
+		if self._deferred_queue is None:
+			raise error
+
+		try:
+			self._deferred_queue.put((endpoint, payload, receiver))
+		except DeferredQueueFull as e:
+			self._logger.error(u"circuit open and {0}, refusing request to endpoint={1}".format(e, endpoint))
+			raise error
+		self._logger.warning(u"circuit open, deferring request to endpoint={0}".format(endpoint))
+
+	def _has_deferred(self):
+		return self._deferred_queue is not None and len(self._deferred_queue) > 0
+
+	def _replayed(self, endpoint, result):
+		try:
+			self._check_status(result)
+		except Exception as e:
+			self._logger.error(u"failed replaying deferred request to endpoint={0}: {1}".format(endpoint, e))
+
+	def _enqueue(self, endpoint, payload, receiver=None):
+		self._logger.debug(u"queueing request to endpoint={0}".format(endpoint))
+		self._outbound_queue.put((endpoint, payload, receiver))
+
+	def _validate(self, message):
+		if not message.validate():
+			self._logger.error(u"failed validating message: {0}".format(message))
+			raise Exception("failed validating message: {0}".format(message))
+
+	@classmethod
+	def _message_token(cls, result):
+		return cls._check_status(result)['message_token']
 
 	def _prepare_payload(self, message, sender_name, sender_avatar, sender=None, receiver=None, chat_id=None):
 		payload = message.to_dict()
@@ -71,3 +137,78 @@ class MessageSender(object):
 
 	def _remove_empty_fields(self, message):
 		return {k: v for k, v in message.items() if v is not None}
+
+
+class MessageSender(BaseMessageSender):
+	def send_message(self, to, sender_name, sender_avatar, message, chat_id=None):
+		payload = self._send_message_payload(to, sender_name, sender_avatar, message, chat_id)
+		return self._post_request(BOT_API_ENDPOINT.SEND_MESSAGE, payload)
+
+	def post_to_public_account(self, sender, sender_name, sender_avatar, message):
+		payload = self._post_to_public_account_payload(sender, sender_name, sender_avatar, message)
+		return self._post_request(BOT_API_ENDPOINT.POST, payload)
+
+	def broadcast_message(self, broadcast_list, sender_name, sender_avatar, message):
+		"""
+		:param broadcast_list: list of up to MAX_BROADCAST_LIST_SIZE Viber user ids
+		:return: the broadcast_message response, including its failed_list, or None if the broadcast was queued or deferred
+		"""
+		payload = json.dumps(self._broadcast_message_payload(broadcast_list, sender_name, sender_avatar, message))
+		if self._outbound_queue is not None:
+			self._enqueue(BOT_API_ENDPOINT.BROADCAST_MESSAGE, payload)
+			return None
+
+		try:
+			self._replay_before_send()
+			result = self._request_sender.post_request(BOT_API_ENDPOINT.BROADCAST_MESSAGE, payload)
+		except CircuitOpenError as e:
+			self._defer(BOT_API_ENDPOINT.BROADCAST_MESSAGE, payload, None, e)
+			return None
+
+		return self._check_status(result)
+
+	def replay_deferred(self):
+		"""
+		Sends the deferred requests in the order they were deferred, until the circuit refuses one.
+		Requests failing for another reason are logged and dropped.
+		:return: number of deferred requests left
+		"""
+		if not self._has_deferred():
+			return 0
+
+		with self._replay_lock:
+			while self._has_deferred():
+				endpoint, payload, receiver = self._deferred_queue.peek()
+				try:
+					result = self._request_sender.post_request(endpoint, payload, receiver=receiver)
+				except CircuitOpenError:
+					break
+				except Exception as e:
+					result = dict(status=None, status_message=e)
+				self._deferred_queue.pop()
+				self._replayed(endpoint, result)
+			return len(self._deferred_queue)
+
+	def _replay_before_send(self):
+		# a request sent while older ones are still deferred would overtake them
+		if self.replay_deferred():
+			raise CircuitOpenError(u"circuit open, earlier requests are still deferred")
+
+	def _post_request(self, endpoint, payload):
+		"""
+		:return: the message token, or None if the message was queued or deferred
+		"""
+		receiver = payload.get('receiver')
+		payload = json.dumps(payload)
+		if self._outbound_queue is not None:
+			self._enqueue(endpoint, payload, receiver)
+			return None
+
+		try:
+			self._replay_before_send()
+			result = self._request_sender.post_request(endpoint, payload, receiver=receiver)
+		except CircuitOpenError as e:
+			self._defer(endpoint, payload, receiver, e)
+			return None
+
+		return self._message_token(result)
@@ -3,6 +3,8 @@ from viberbot.api.messages.message import Message
 
 
 class KeyboardMessage(Message):
+	__slots__ = ()
+
 	def __init__(self, tracking_data=None, keyboard=None, min_api_version=None):
 		super(KeyboardMessage, self).__init__(tracking_data, keyboard, min_api_version)
 
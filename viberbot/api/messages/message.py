@@ -3,6 +3,8 @@ from abc import abstractmethod
 
 
 class Message(object):
+	__slots__ = ('_tracking_data', '_keyboard', '_min_api_version', '_alt_text')
+
 	def __init__(self, tracking_data=None, keyboard=None, min_api_version=None, alt_text=None):
 		self._tracking_data = tracking_data
 		self._keyboard = keyboard
@@ -4,6 +4,8 @@ from viberbot.api.messages.message_type import MessageType
 
 
 class StickerMessage(TypedMessage):
+	__slots__ = ('_sticker_id',)
+
 	def __init__(self, tracking_data=None, keyboard=None, sticker_id=None, min_api_version=None):
 		super(StickerMessage, self).__init__(MessageType.STICKER, tracking_data, keyboard, min_api_version)
 		self._sticker_id = sticker_id
@@ -4,6 +4,8 @@ from viberbot.api.messages.message_type import MessageType
 
 
 class TextMessage(TypedMessage):
+	__slots__ = ('_text',)
+
 	def __init__(self, tracking_data=None, keyboard=None, text=None, min_api_version=None):
 		super(TextMessage, self).__init__(MessageType.TEXT, tracking_data, keyboard, min_api_version)
 		self._text = text
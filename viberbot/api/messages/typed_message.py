@@ -4,6 +4,8 @@ from viberbot.api.messages.message import Message
 
 
 class TypedMessage(Message):
+	__slots__ = ('_message_type',)
+
 	def __init__(self, message_type, tracking_data=None, keyboard=None, min_api_version=None, alt_text=None):
 		super(TypedMessage, self).__init__(tracking_data, keyboard, min_api_version, alt_text)
 		self._message_type = message_type
@@ -4,6 +4,8 @@ from viberbot.api.messages.message_type import MessageType
 
 
 class URLMessage(TypedMessage):
+	__slots__ = ('_media',)
+
 	def __init__(self, tracking_data=None, keyboard=None, media=None, min_api_version=None):
 		super(URLMessage, self).__init__(MessageType.URL, tracking_data, keyboard, min_api_version)
 		self._media = media
@@ -0,0 +1,173 @@
+import asyncio
+import contextvars
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_LANES = 8
+
+# the dispatcher owning the lane the current thread or task runs on
+_lane_owner = threading.local()
+_async_lane_owner = contextvars.ContextVar('viber_bot_lane_owner', default=None)
+
+
+class DispatcherFullError(Exception):
+	pass
+
+
+def _lane_index(key, lanes):
+	if not isinstance(key, bytes):
+		key = u"{0}".format(key).encode('utf-8')
+	return zlib.crc32(key) % lanes
+
+
+class OrderedDispatcher(object):
+	"""
+	Runs calls on a fixed number of single threaded lanes, picked by hashing a key.
+
+	Calls submitted with the same key, such as a receiver id, always land on the
+	same lane and run one after the other in submission order, while calls for
+	different keys run in parallel on the other lanes.
+	"""
+	def __init__(self, lanes=DEFAULT_LANES, thread_name_prefix='viber-bot-lane', max_pending=None):
+		"""
+		:param lanes: number of lanes, the maximum number of calls running at once
+		:param max_pending: Optional. Maximum number of submitted calls not finished yet, beyond which
+		submit raises DispatcherFullError. Unbounded by default.
+		"""
+		if lanes < 1:
+			raise Exception(u"lanes must be a positive number, got {0}".format(lanes))
+
+		self._thread_name_prefix = thread_name_prefix
+		self._lanes = [None] * lanes
+		self._lock = threading.Lock()
+		self._closed = False
+		self._max_pending = max_pending
+		self._slots = threading.BoundedSemaphore(max_pending) if max_pending is not None else None
+
+	@property
+	def lanes(self):
+		return len(self._lanes)
+
+	def in_lane(self):
+		"""
+		:return: True if called from one of the lanes, where waiting for another call of the dispatcher may deadlock
+		"""
+		return getattr(_lane_owner, 'dispatcher', None) is self
+
+	def submit(self, key, fn, *args, **kwargs):
+		"""
+		:return: concurrent.futures.Future of the call
+		:raise DispatcherFullError: if max_pending calls are already waiting or running
+		"""
+		lane = self._lane(_lane_index(key, len(self._lanes)))
+		if self._slots is None:
+			return lane.submit(fn, *args, **kwargs)
+
+		if not self._slots.acquire(blocking=False):
+			raise DispatcherFullError(u"dispatcher is full, {0} calls pending".format(self._max_pending))
+		try:
+			return lane.submit(self._call_and_release, fn, args, kwargs)
+		except Exception:
+			self._slots.release()
+			raise
+
+	def _call_and_release(self, fn, args, kwargs):
+		try:
+			return fn(*args, **kwargs)
+		finally:
+			self._slots.release()
+
+	def close(self, wait=True):
+		with self._lock:
+			self._closed = True
+			lanes = [lane for lane in self._lanes if lane is not None]
+		for lane in lanes:
+			lane.shutdown(wait=wait)
+
+	def _lane(self, index):
+		lane = self._lanes[index]
+		if lane is None:
+			with self._lock:
+				if self._closed:
+					raise Exception(u"dispatcher is closed")
+				lane = self._lanes[index]
+				if lane is None:
+					lane = ThreadPoolExecutor(
+						max_workers=1, thread_name_prefix='{0}-{1}'.format(self._thread_name_prefix, index),
+						initializer=self._enter_lane)
+					self._lanes[index] = lane
+		return lane
+
+	def _enter_lane(self):
+		_lane_owner.dispatcher = self
+
+
+class AsyncOrderedDispatcher(object):
+	"""
+	asyncio variant of OrderedDispatcher: every lane is a task awaiting the
+	coroutines submitted to it one at a time.
+	"""
+	def __init__(self, lanes=DEFAULT_LANES):
+		if lanes < 1:
+			raise Exception(u"lanes must be a positive number, got {0}".format(lanes))
+
+		self._queues = [None] * lanes
+		self._tasks = []
+
+	@property
+	def lanes(self):
+		return len(self._queues)
+
+	def in_lane(self):
+		"""
+		:return: True if called from a coroutine running on one of the lanes
+		"""
+		return _async_lane_owner.get() is self
+
+	def submit(self, key, coroutine_function, *args, **kwargs):
+		"""
+		Must be called from the event loop running the dispatcher.
+		:return: asyncio.Future resolved with the result of coroutine_function(*args, **kwargs)
+		"""
+		future = asyncio.get_running_loop().create_future()
+		self._queue(_lane_index(key, len(self._queues))).put_nowait((future, coroutine_function, args, kwargs))
+		return future
+
+	async def close(self):
+		"""
+		Waits for the submitted coroutines to finish, then stops the lanes.
+		"""
+		for queue in self._queues:
+			if queue is not None:
+				queue.put_nowait(None)
+		await asyncio.gather(*self._tasks)
+		self._queues = [None] * len(self._queues)
+		self._tasks = []
+
+	def _queue(self, index):
+		queue = self._queues[index]
+		if queue is None:
+			queue = asyncio.Queue()
+			self._queues[index] = queue
+			self._tasks.append(asyncio.ensure_future(self._run(queue)))
+		return queue
+
+	async def _run(self, queue):
+		# the lane task has its own context, the coroutines it awaits see the owner
+		_async_lane_owner.set(self)
+		while True:
+			item = await queue.get()
+			if item is None:
+				return
+			future, coroutine_function, args, kwargs = item
+			if future.cancelled():
+				continue
+			try:
+				result = await coroutine_function(*args, **kwargs)
+			except Exception as e:
+				if not future.cancelled():
+					future.set_exception(e)
+			else:
+				if not future.cancelled():
+					future.set_result(result)
@@ -0,0 +1,213 @@
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+
+OutboundEntry = namedtuple('OutboundEntry', ['id', 'endpoint', 'payload', 'receiver', 'attempts'])
+
+
+class OutboundQueue(object):
+	"""
+	Queue of serialized Viber API requests waiting to be sent.
+
+	Items are (endpoint, payload, receiver) tuples, where payload is the JSON body
+	and receiver the Viber user id or None. Entries handed out by get are
+	invisible to other consumers until acked (removed) or nacked (put back).
+	An entry is only handed out once every earlier entry for the same receiver
+	was acked, so each receiver gets its messages in order even with many consumers.
+	"""
+	def put(self, item):
+		raise NotImplementedError()
+
+	def get(self, timeout=None):
+		"""
+		:return: the next OutboundEntry, or None if nothing became available within timeout seconds
+		"""
+		raise NotImplementedError()
+
+	def ack(self, entry):
+		raise NotImplementedError()
+
+	def nack(self, entry, delay=0, count_attempt=True):
+		"""
+		Makes the entry available again after delay seconds.
+		:param count_attempt: if False, the delivery that was handed out is not counted in the attempts of the entry
+		"""
+		raise NotImplementedError()
+
+	def __len__(self):
+		raise NotImplementedError()
+
+	def close(self):
+		pass
+
+
+class MemoryOutboundQueue(OutboundQueue):
+	"""
+	OutboundQueue kept in process memory, lost on restart.
+	"""
+	def __init__(self, clock=time.time):
+		self._clock = clock
+		self._condition = threading.Condition()
+		self._ids = itertools.count(1)
+		self._entries = {}
+		self._receiver_entries = {}
+		# only entries that may be handed out right now or after a nack delay are kept in the heap:
+		# entries without a receiver and the oldest entry of every receiver
+		self._ready = []
+
+	def put(self, item):
+		endpoint, payload, receiver = item
+		with self._condition:
+			entry = OutboundEntry(next(self._ids), endpoint, payload, receiver, 0)
+			self._entries[entry.id] = entry
+			if receiver is None:
+				heapq.heappush(self._ready, (0, entry.id))
+			else:
+				pending = self._receiver_entries.setdefault(receiver, deque())
+				pending.append(entry.id)
+				if len(pending) == 1:
+					heapq.heappush(self._ready, (0, entry.id))
+			self._condition.notify()
+
+	def get(self, timeout=None):
+		deadline = None if timeout is None else self._clock() + timeout
+		with self._condition:
+			while True:
+				wait = None
+				if self._ready:
+					available_at, entry_id = self._ready[0]
+					wait = available_at - self._clock()
+					if wait <= 0:
+						heapq.heappop(self._ready)
+						entry = self._entries[entry_id]._replace(attempts=self._entries[entry_id].attempts + 1)
+						self._entries[entry_id] = entry
+						return entry
+				if deadline is not None:
+					remaining = deadline - self._clock()
+					if remaining <= 0:
+						return None
+					wait = remaining if wait is None else min(wait, remaining)
+				self._condition.wait(wait)
+
+	def ack(self, entry):
+		with self._condition:
+			self._entries.pop(entry.id, None)
+			if entry.receiver is not None:
+				pending = self._receiver_entries[entry.receiver]
+				pending.popleft()
+				if pending:
+					heapq.heappush(self._ready, (0, pending[0]))
+				else:
+					del self._receiver_entries[entry.receiver]
+			self._condition.notify()
+
+	def nack(self, entry, delay=0, count_attempt=True):
+		with self._condition:
+			if not count_attempt:
+				self._entries[entry.id] = entry._replace(attempts=entry.attempts - 1)
+			heapq.heappush(self._ready, (self._clock() + delay, entry.id))
+			self._condition.notify()
+
+	def __len__(self):
+		with self._condition:
+			return len(self._entries)
+
+
+class SqliteOutboundQueue(OutboundQueue):
+	"""
+	Durable OutboundQueue stored in a local SQLite database.
+
+	Claimed entries that were neither acked nor nacked within visibility_timeout
+	seconds, for example because the process died while sending them, are handed
+	out again, which gives at-least-once delivery across restarts.
+	"""
+	def __init__(self, path, visibility_timeout=60, poll_interval=0.5, clock=time.time):
+		self._visibility_timeout = visibility_timeout
+		self._poll_interval = poll_interval
+		self._clock = clock
+		self._condition = threading.Condition()
+		self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+		self._connection.execute("PRAGMA journal_mode=WAL")
+		self._connection.execute("PRAGMA synchronous=NORMAL")
+		self._connection.execute(
+			"CREATE TABLE IF NOT EXISTS outbound_messages ("
+			"id INTEGER PRIMARY KEY AUTOINCREMENT, "
+			"endpoint TEXT NOT NULL, "
+			"payload TEXT NOT NULL, "
+			"receiver TEXT, "
+			"attempts INTEGER NOT NULL DEFAULT 0, "
+			"available_at REAL NOT NULL, "
+			"claimed_at REAL)")
+		self._connection.execute(
+			"CREATE INDEX IF NOT EXISTS ix_outbound_messages_receiver ON outbound_messages (receiver, id)")
+		self._connection.execute(
+			"CREATE INDEX IF NOT EXISTS ix_outbound_messages_available_at ON outbound_messages (available_at)")
+
+	def put(self, item):
+		endpoint, payload, receiver = item
+		with self._condition:
+			self._connection.execute(
+				"INSERT INTO outbound_messages (endpoint, payload, receiver, available_at) VALUES (?, ?, ?, ?)",
+				(endpoint, payload, receiver, self._clock()))
+			self._condition.notify()
+
+	def get(self, timeout=None):
+		deadline = None if timeout is None else self._clock() + timeout
+		with self._condition:
+			while True:
+				entry = self._claim()
+				if entry is not None:
+					return entry
+				wait = self._poll_interval
+				if deadline is not None:
+					remaining = deadline - self._clock()
+					if remaining <= 0:
+						return None
+					wait = min(wait, remaining)
+				self._condition.wait(wait)
+
+	def ack(self, entry):
+		with self._condition:
+			self._connection.execute("DELETE FROM outbound_messages WHERE id = ?", (entry.id,))
+			self._condition.notify_all()
+
+	def nack(self, entry, delay=0, count_attempt=True):
+		with self._condition:
+			self._connection.execute(
+				"UPDATE outbound_messages SET claimed_at = NULL, available_at = ?, attempts = attempts - ? WHERE id = ?",
+				(self._clock() + delay, 0 if count_attempt else 1, entry.id))
+			self._condition.notify_all()
+
+	def __len__(self):
+		with self._condition:
+			return self._connection.execute("SELECT COUNT(*) FROM outbound_messages").fetchone()[0]
+
+	def close(self):
+		with self._condition:
+			self._connection.close()
+
+	def _claim(self):
+		now = self._clock()
+		expired = now - self._visibility_timeout
+		self._connection.execute("BEGIN IMMEDIATE")
+		try:
+			row = self._connection.execute(
+				"SELECT id, endpoint, payload, receiver, attempts FROM outbound_messages AS m "
+				"WHERE m.available_at <= ? AND (m.claimed_at IS NULL OR m.claimed_at < ?) "
+				"AND (m.receiver IS NULL OR NOT EXISTS ("
+				"SELECT 1 FROM outbound_messages AS earlier WHERE earlier.receiver = m.receiver AND earlier.id < m.id)) "
+				"ORDER BY m.id LIMIT 1",
+				(now, expired)).fetchone()
+			if row is None:
+				self._connection.execute("COMMIT")
+				return None
+			self._connection.execute(
+				"UPDATE outbound_messages SET claimed_at = ?, attempts = attempts + 1 WHERE id = ?", (now, row[0]))
+			self._connection.execute("COMMIT")
+		except Exception:
+			self._connection.execute("ROLLBACK")
+			raise
+		return OutboundEntry(row[0], row[1], row[2], row[3], row[4] + 1)
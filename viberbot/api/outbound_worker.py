@@ -0,0 +1,91 @@
+import threading
+
+from viberbot.api.circuit_breaker import CircuitOpenError
+from viberbot.api.consts import BOT_API_RESPONSE_STATUS
+
+
+class OutboundWorkerPool(object):
+	"""
+	Threads draining an OutboundQueue through an ApiRequestSender.
+
+	An entry is acked once Viber answered it, even with an error status, since
+	such a request would fail the same way again. Entries that could not be
+	delivered because of network errors are nacked with a backoff and retried
+	until max_attempts, which gives at-least-once delivery. Entries refused by an
+	open circuit were never sent: they wait until the circuit lets calls through
+	again without using up an attempt, so an outage of any length loses nothing.
+	"""
+	def __init__(self, logger, request_sender, outbound_queue, workers=4, max_attempts=10, poll_timeout=1.0):
+		"""
+		:param workers: number of sender threads
+		:param max_attempts: deliveries of a single entry after which it is dropped
+		:param poll_timeout: seconds a worker waits on an empty queue before checking whether it should stop
+		"""
+		self._logger = logger
+		self._request_sender = request_sender
+		self._outbound_queue = outbound_queue
+		self._workers = workers
+		self._max_attempts = max_attempts
+		self._poll_timeout = poll_timeout
+		self._stopping = threading.Event()
+		self._threads = []
+
+	@property
+	def running(self):
+		return bool(self._threads)
+
+	def start(self):
+		if self._threads:
+			raise Exception(u"outbound workers already started")
+
+		self._stopping.clear()
+		for index in range(self._workers):
+			thread = threading.Thread(
+				target=self._run, name='viber-bot-outbound-{0}'.format(index), daemon=True)
+			thread.start()
+			self._threads.append(thread)
+
+	def stop(self, timeout=None):
+		self._stopping.set()
+		for thread in self._threads:
+			thread.join(timeout)
+		self._threads = []
+
+	def _run(self):
+		while not self._stopping.is_set():
+			entry = self._outbound_queue.get(timeout=self._poll_timeout)
+			if entry is not None:
+				self.process(entry)
+
+	def process(self, entry):
+		try:
+			result = self._request_sender.post_request(entry.endpoint, entry.payload, receiver=entry.receiver)
+		except CircuitOpenError:
+			self._wait_for_circuit(entry)
+			return
+		except Exception as e:
+			self._retry_later(entry, e)
+			return
+
+		if isinstance(result, dict) and result.get('status') != BOT_API_RESPONSE_STATUS.OK:
+			self._logger.error(u"viber api rejected queued request to endpoint={0}, status: {1}, message: {2}".format(
+				entry.endpoint, result.get('status'), result.get('status_message')))
+		self._outbound_queue.ack(entry)
+
+	def _wait_for_circuit(self, entry):
+		# a half open circuit refuses calls while its trial calls run, check again after a poll
+		delay = self._request_sender.circuit_breaker.remaining_open_time or self._poll_timeout
+		self._logger.debug(u"circuit open, queued request to endpoint={0} waits {1:.2f}s".format(entry.endpoint, delay))
+		self._outbound_queue.nack(entry, delay, count_attempt=False)
+
+	def _retry_later(self, entry, reason):
+		if entry.attempts >= self._max_attempts:
+			self._logger.error(u"dropping queued request to endpoint={0} after {1} attempts: {2}".format(
+				entry.endpoint, entry.attempts, reason))
+			self._outbound_queue.ack(entry)
+			return
+
+		delay = self._request_sender.retry_policy.backoff(entry.attempts)
+		self._logger.warning(u"queued request to endpoint={0} failed, retrying in {1:.2f}s: {2}".format(
+			entry.endpoint, delay, reason))
+		self._outbound_queue.nack(entry, delay)
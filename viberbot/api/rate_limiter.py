@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class TokenBucket(object):
+	"""
+	Token bucket that hands out reservations instead of rejecting callers.
+
+	When the bucket is empty the balance goes negative, and the returned delay is
+	how long the caller has to wait before its token becomes available, so
+	concurrent callers are spaced out evenly at the bucket rate.
+	"""
+	def __init__(self, rate, capacity, now):
+		self._rate = float(rate)
+		self._capacity = float(capacity)
+		self._tokens = float(capacity)
+		self._updated_at = now
+
+	@property
+	def rate(self):
+		return self._rate
+
+	def set_rate(self, rate, now):
+		self._refill(now)
+		self._rate = float(rate)
+
+	def reserve(self, now):
+		self._refill(now)
+		self._tokens -= 1
+		if self._tokens >= 0:
+			return 0.0
+		return -self._tokens / self._rate
+
+	def _refill(self, now):
+		elapsed = max(0.0, now - self._updated_at)
+		self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+		self._updated_at = now
+
+
+class RateLimiter(object):
+	"""
+	Client side limiter for outbound Viber API calls, with a global bucket and
+	optional per-receiver buckets.
+
+	The global bucket is adaptive: every rate limit response halves its effective
+	rate (down to min_rate_factor of the configured one) and every successful call
+	recovers it by recovery_step, until the configured rate is reached again.
+	"""
+	def __init__(self, rate=50, burst=None, per_receiver_rate=None, per_receiver_burst=None,
+				min_rate_factor=0.1, recovery_step=0.05, max_receivers=10000,
+				clock=time.monotonic, sleep=time.sleep):
+		"""
+		:param rate: requests per second allowed for the whole bot
+		:param burst: requests allowed in a burst, defaults to rate
+		:param per_receiver_rate: Optional. Requests per second allowed for a single receiver
+		:param per_receiver_burst: Optional. Burst for a single receiver, defaults to per_receiver_rate
+		:param min_rate_factor: lowest fraction of the configured rate adaptive throttling goes down to
+		:param recovery_step: fraction of the configured rate recovered on every successful call
+		:param max_receivers: number of per-receiver buckets kept, least recently used ones are dropped
+		"""
+		self._rate = float(rate)
+		self._per_receiver_rate = float(per_receiver_rate) if per_receiver_rate else None
+		self._per_receiver_burst = per_receiver_burst or per_receiver_rate
+		self._min_rate_factor = min_rate_factor
+		self._recovery_step = recovery_step
+		self._max_receivers = max_receivers
+		self._clock = clock
+		self._sleep = sleep
+		self._lock = threading.Lock()
+		self._factor = 1.0
+		self._waiting = 0
+		self._rate_limited_count = 0
+		self._global_bucket = TokenBucket(rate, burst or rate, clock())
+		self._receiver_buckets = OrderedDict()
+
+	@property
+	def rate(self):
+		"""
+		:return: the current effective global rate, in requests per second
+		"""
+		return self._global_bucket.rate
+
+	@property
+	def queue_depth(self):
+		"""
+		:return: number of callers currently waiting for a token
+		"""
+		return self._waiting
+
+	@property
+	def rate_limited_count(self):
+		return self._rate_limited_count
+
+	def reserve(self, receiver=None):
+		"""
+		Takes a token from the global bucket and, if per-receiver limiting is on,
+		from the receiver bucket.
+
+		:return: seconds the caller has to wait before sending
+		"""
+		with self._lock:
+			now = self._clock()
+			delay = self._global_bucket.reserve(now)
+			if receiver is not None and self._per_receiver_rate is not None:
+				delay = max(delay, self._receiver_bucket(receiver, now).reserve(now))
+			return delay
+
+	def acquire(self, receiver=None):
+		"""
+		Blocks until the caller may send.
+
+		:return: seconds waited
+		"""
+		delay = self.reserve(receiver)
+		if delay > 0:
+			with self._waiter():
+				self._sleep(delay)
+		return delay
+
+	async def acquire_async(self, receiver=None):
+		delay = self.reserve(receiver)
+		if delay > 0:
+			with self._waiter():
+				await asyncio.sleep(delay)
+		return delay
+
+	def on_rate_limited(self):
+		with self._lock:
+			self._rate_limited_count += 1
+			self._set_factor(max(self._min_rate_factor, self._factor / 2))
+
+	def on_success(self):
+		if self._factor >= 1.0:
+			return
+		with self._lock:
+			self._set_factor(min(1.0, self._factor + self._recovery_step))
+
+	def _set_factor(self, factor):
+		self._factor = factor
+		self._global_bucket.set_rate(self._rate * factor, self._clock())
+
+	def _receiver_bucket(self, receiver, now):
+		bucket = self._receiver_buckets.get(receiver)
+		if bucket is None:
+			bucket = TokenBucket(self._per_receiver_rate, self._per_receiver_burst, now)
+			self._receiver_buckets[receiver] = bucket
+			if len(self._receiver_buckets) > self._max_receivers:
+				self._receiver_buckets.popitem(last=False)
+		else:
+			self._receiver_buckets.move_to_end(receiver)
+		return bucket
+
+	@contextmanager
+	def _waiter(self):
+		with self._lock:
+			self._waiting += 1
+		try:
+			yield
+		finally:
+			with self._lock:
+				self._waiting -= 1
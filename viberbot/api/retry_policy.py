@@ -0,0 +1,92 @@
+import random
+import time
+
+import requests
+
+from viberbot.api.consts import BOT_API_ENDPOINT, BOT_API_RESPONSE_STATUS, HTTP_TOO_MANY_REQUESTS
+from viberbot.api.transport import ConnectError
+
+IDEMPOTENT_ENDPOINTS = frozenset([
+	BOT_API_ENDPOINT.SET_WEBHOOK,
+	BOT_API_ENDPOINT.GET_ACCOUNT_INFO,
+	BOT_API_ENDPOINT.GET_ONLINE,
+	BOT_API_ENDPOINT.GET_USER_DETAILS,
+])
+
+
+class RetryPolicy(object):
+	"""
+	Decides which failed Viber API calls are retried and how long to back off.
+
+	Requests that Viber rejected without processing (rate limit, 503) or that never
+	left (connection refused, connect timeout) are retried on every endpoint.
+	Failures where the request may already have been processed (read timeout,
+	connection reset after sending, other 5xx) are retried only on idempotent
+	endpoints, so a message is never sent twice.
+	Permanent errors, such as an invalid receiver, are never retried.
+	"""
+	def __init__(self, max_attempts=3, base_delay=0.2, max_delay=5.0, multiplier=2.0, jitter=True,
+				retryable_http_statuses=(HTTP_TOO_MANY_REQUESTS, 500, 502, 503, 504),
+				unprocessed_http_statuses=(HTTP_TOO_MANY_REQUESTS, 503),
+				retryable_api_statuses=(BOT_API_RESPONSE_STATUS.TOO_MANY_REQUESTS,),
+				idempotent_endpoints=IDEMPOTENT_ENDPOINTS, sleep=time.sleep):
+		"""
+		:param max_attempts: total number of attempts, including the first one
+		:param base_delay: backoff before the first retry, in seconds
+		:param max_delay: upper bound of a single backoff, in seconds
+		:param multiplier: backoff growth factor between attempts
+		:param jitter: if True, use full jitter, a random delay between 0 and the computed backoff
+		:param retryable_http_statuses: HTTP statuses retried on idempotent endpoints
+		:param unprocessed_http_statuses: HTTP statuses known to mean the request was not processed, retried on every endpoint
+		:param retryable_api_statuses: Viber response statuses retried on every endpoint
+		:param idempotent_endpoints: endpoints that are safe to repeat
+		"""
+		self._max_attempts = max_attempts
+		self._base_delay = base_delay
+		self._max_delay = max_delay
+		self._multiplier = multiplier
+		self._jitter = jitter
+		self._retryable_http_statuses = frozenset(retryable_http_statuses)
+		self._unprocessed_http_statuses = frozenset(unprocessed_http_statuses)
+		self._retryable_api_statuses = frozenset(retryable_api_statuses)
+		self._idempotent_endpoints = frozenset(idempotent_endpoints)
+		self._sleep = sleep
+
+	@property
+	def max_attempts(self):
+		return self._max_attempts
+
+	def should_retry_error(self, endpoint, error, attempt):
+		if attempt >= self._max_attempts:
+			return False
+
+		idempotent = endpoint in self._idempotent_endpoints
+		if isinstance(error, requests.HTTPError):
+			status_code = error.response.status_code if error.response is not None else None
+			if status_code in self._unprocessed_http_statuses:
+				return True
+			return idempotent and status_code in self._retryable_http_statuses
+		if isinstance(error, (requests.ConnectTimeout, ConnectError)):
+			return True
+		return idempotent and isinstance(error, (requests.Timeout, requests.ConnectionError))
+
+	def should_retry_result(self, endpoint, result, attempt):
+		if attempt >= self._max_attempts or not isinstance(result, dict):
+			return False
+		return result.get('status') in self._retryable_api_statuses
+
+	def backoff(self, attempt):
+		"""
+		:param attempt: number of the attempt that just failed, starting from 1
+		:return: seconds to wait before the next attempt
+		"""
+		delay = min(self._max_delay, self._base_delay * (self._multiplier ** (attempt - 1)))
+		if self._jitter:
+			delay = random.uniform(0, delay)
+		return delay
+
+	def sleep(self, attempt):
+		self._sleep(self.backoff(attempt))
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
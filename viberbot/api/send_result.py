@@ -0,0 +1,180 @@
+import asyncio
+import concurrent.futures
+import threading
+
+from future.utils import python_2_unicode_compatible
+
+
+class SendResult(object):
+	"""
+	Outcome of a concurrent multi-message send. Tokens are kept in input order,
+	with None in place of every message that failed or is still pending.
+
+	Messages handed to a lane are added as pending futures and fill in their token
+	or error once sent. wait, or wait_async for asyncio futures, returns when none
+	is pending any more.
+	"""
+	def __init__(self, count):
+		self._tokens = [None] * count
+		self._errors = {}
+		self._pending = {}
+		self._lock = threading.Lock()
+
+	def set_token(self, index, token):
+		self._tokens[index] = token
+
+	def set_error(self, index, error):
+		self._errors[index] = error
+
+	def add_pending(self, index, future):
+		"""
+		:param future: concurrent.futures.Future or asyncio.Future of the token of message #index
+		"""
+		with self._lock:
+			self._pending[index] = future
+		future.add_done_callback(lambda done: self._resolve(index, done))
+
+	def wait(self, timeout=None):
+		"""
+		Blocks until every pending message was sent or failed, or until timeout seconds passed.
+		:return: self
+		"""
+		with self._lock:
+			pending = dict(self._pending)
+		concurrent.futures.wait(list(pending.values()), timeout)
+		for index, future in pending.items():
+			if future.done():
+				self._resolve(index, future)
+		return self
+
+	async def wait_async(self):
+		"""
+		asyncio variant of wait, for the results of AsyncApi.
+		:return: self
+		"""
+		with self._lock:
+			pending = dict(self._pending)
+		if pending:
+			await asyncio.wait(list(pending.values()))
+		for index, future in pending.items():
+			self._resolve(index, future)
+		return self
+
+	def _resolve(self, index, future):
+		with self._lock:
+			if self._pending.pop(index, None) is None:
+				return
+		if future.cancelled():
+			self._errors[index] = concurrent.futures.CancelledError()
+		elif future.exception() is not None:
+			self._errors[index] = future.exception()
+		else:
+			self._tokens[index] = future.result()
+
+	@property
+	def pending(self):
+		"""
+		:return: indexes of the messages not sent yet
+		"""
+		with self._lock:
+			return sorted(self._pending)
+
+	@property
+	def tokens(self):
+		return self._tokens
+
+	@property
+	def errors(self):
+		"""
+		:return: dict of message index to the exception raised while sending it
+		"""
+		return self._errors
+
+	@property
+	def ok(self):
+		"""
+		:return: True once every message was sent without an error
+		"""
+		return len(self._errors) == 0 and not self.pending
+
+	def __len__(self):
+		return len(self._tokens)
+
+	def __iter__(self):
+		return iter(self._tokens)
+
+	def __getitem__(self, index):
+		return self._tokens[index]
+
+	@python_2_unicode_compatible
+	def __str__(self):
+		return u"SendResult[tokens={0}, errors={1}, pending={2}]".format(self._tokens, self._errors, self.pending)
+
+
+class BroadcastResult(object):
+	"""
+	Merged outcome of a broadcast that was split into several broadcast_message requests.
+	"""
+	def __init__(self, chunks):
+		self._chunks = chunks
+		self._message_tokens = [None] * len(chunks)
+		self._failed_list = []
+		self._errors = {}
+		self._deferred = []
+
+	def add_response(self, index, response):
+		if response is None:
+			self._deferred.append(index)
+			return
+		self._message_tokens[index] = response.get('message_token')
+		self._failed_list.extend(response.get('failed_list', []))
+
+	def set_error(self, index, error):
+		self._errors[index] = error
+
+	@property
+	def message_tokens(self):
+		"""
+		:return: one message token per chunk, None for chunks that failed as a whole
+		"""
+		return self._message_tokens
+
+	@property
+	def failed_list(self):
+		"""
+		:return: merged failed_list entries reported by Viber for individual receivers
+		"""
+		return self._failed_list
+
+	@property
+	def errors(self):
+		"""
+		:return: dict of chunk index to the exception raised while sending that chunk
+		"""
+		return self._errors
+
+	@property
+	def deferred_chunks(self):
+		"""
+		:return: indexes of the chunks put on the deferred queue because the circuit breaker was open
+		"""
+		return self._deferred
+
+	@property
+	def failed_receivers(self):
+		"""
+		:return: every receiver that did not get the message, either listed in failed_list or part of a failed chunk
+		"""
+		receivers = [failed['receiver'] for failed in self._failed_list]
+		for index in sorted(self._errors):
+			receivers.extend(self._chunks[index])
+		return receivers
+
+	@property
+	def ok(self):
+		return not self._errors and not self._failed_list
+
+	@python_2_unicode_compatible
+	def __str__(self):
+		return u"BroadcastResult[chunks={0}, failed_list={1}, errors={2}]"\
+			.format(len(self._chunks), self._failed_list, self._errors)
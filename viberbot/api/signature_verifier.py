@@ -0,0 +1,31 @@
+import hashlib
+import hmac
+
+
+class SignatureVerifier(object):
+	"""
+	Verifies the X-Viber-Content-Signature of webhook bodies.
+
+	The keyed HMAC state is built once from the auth token and copied for each
+	body, and signatures are compared in constant time.
+	"""
+	def __init__(self, auth_token):
+		self._hmac = hmac.new(auth_token.encode('ascii'), digestmod=hashlib.sha256)
+
+	def signature(self, request_data):
+		"""
+		:param request_data: raw webhook body, as str, bytes, bytearray or memoryview
+		:return: hex HMAC-SHA256 signature of the body
+		"""
+		if isinstance(request_data, str):
+			request_data = request_data.encode('utf-8')
+		digest = self._hmac.copy()
+		digest.update(request_data)
+		return digest.hexdigest()
+
+	def verify(self, request_data, signature):
+		if not signature:
+			return False
+		if isinstance(signature, str):
+			signature = signature.encode('utf-8')
+		return hmac.compare_digest(self.signature(request_data).encode('ascii'), signature)
@@ -0,0 +1,176 @@
+import asyncio
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+
+
+class ConnectError(requests.ConnectionError):
+	"""
+	The connection to the Viber API could not be established, so the request was never sent.
+	"""
+	pass
+
+
+def _connection_not_established(error):
+	reason = error.args[0] if error.args else None
+	return isinstance(reason, MaxRetryError) and isinstance(reason.reason, NewConnectionError)
+
+
+class HttpTransport(object):
+	"""
+	Pooled keep-alive HTTP transport used by ApiRequestSender.
+
+	A single transport owns a requests.Session, so connections to the Viber API
+	are kept alive and reused between calls instead of paying a TCP+TLS handshake
+	on every request.
+	"""
+	def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+				pool_block=False, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+				keep_alive=True):
+		"""
+		:param pool_connections: number of per-host connection pools to cache
+		:param pool_maxsize: maximum number of connections kept alive per host
+		:param pool_block: if True, block when a host pool is exhausted instead of opening extra connections
+		:param connect_timeout: seconds to wait for a connection to be established
+		:param read_timeout: seconds to wait for the server to send a response
+		:param keep_alive: if False, connections are closed after every request
+		"""
+		self._pool_connections = pool_connections
+		self._pool_maxsize = pool_maxsize
+		self._pool_block = pool_block
+		self._timeout = (connect_timeout, read_timeout)
+		self._keep_alive = keep_alive
+		self._session = None
+		self._session_lock = threading.Lock()
+
+	@property
+	def timeout(self):
+		return self._timeout
+
+	@property
+	def pool_maxsize(self):
+		return self._pool_maxsize
+
+	@property
+	def session(self):
+		if self._session is None:
+			with self._session_lock:
+				if self._session is None:
+					self._session = self._create_session()
+		return self._session
+
+	def post(self, url, data, headers):
+		if not self._keep_alive:
+			headers = dict(headers)
+			headers['Connection'] = 'close'
+		try:
+			return self.session.post(url, data=data, headers=headers, timeout=self._timeout)
+		except requests.ConnectTimeout:
+			raise
+		except requests.ConnectionError as e:
+			if _connection_not_established(e):
+				raise ConnectError(*e.args, request=e.request, response=e.response)
+			raise
+
+	def close(self):
+		with self._session_lock:
+			if self._session is not None:
+				self._session.close()
+				self._session = None
+
+	def _create_session(self):
+		session = requests.Session()
+		adapter = HTTPAdapter(
+			pool_connections=self._pool_connections,
+			pool_maxsize=self._pool_maxsize,
+			pool_block=self._pool_block,
+			max_retries=0)
+		session.mount('https://', adapter)
+		session.mount('http://', adapter)
+		return session
+
+
+class AsyncTransportResponse(object):
+	"""
+	Minimal response returned by AsyncHttpTransport, mirroring the parts of
+	requests.Response the request senders rely on.
+	"""
+	def __init__(self, url, status_code, text):
+		self.url = url
+		self.status_code = status_code
+		self.text = text
+
+	def raise_for_status(self):
+		if 400 <= self.status_code < 600:
+			raise requests.HTTPError(
+				u"{0} error for url: {1}".format(self.status_code, self.url), response=self)
+
+
+class AsyncHttpTransport(object):
+	"""
+	asyncio counterpart of HttpTransport built on aiohttp.
+
+	Connection errors and timeouts are re-raised as their requests equivalents, and
+	failures to connect as ConnectError, so callers handle failures the same way for
+	both transports.
+	"""
+	def __init__(self, limit=DEFAULT_POOL_MAXSIZE * DEFAULT_POOL_CONNECTIONS, limit_per_host=DEFAULT_POOL_MAXSIZE,
+				connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT, keepalive_timeout=15):
+		"""
+		:param limit: maximum number of simultaneous connections
+		:param limit_per_host: maximum number of simultaneous connections to a single host
+		:param connect_timeout: seconds to wait for a connection to be established
+		:param read_timeout: seconds to wait for the server to send a response
+		:param keepalive_timeout: seconds an idle connection is kept alive
+		"""
+		self._limit = limit
+		self._limit_per_host = limit_per_host
+		self._connect_timeout = connect_timeout
+		self._read_timeout = read_timeout
+		self._keepalive_timeout = keepalive_timeout
+		self._session = None
+
+	@property
+	def timeout(self):
+		return self._connect_timeout, self._read_timeout
+
+	async def post(self, url, data, headers):
+		session = self._get_session()
+		import aiohttp
+
+		try:
+			async with session.post(url, data=data, headers=headers) as response:
+				return AsyncTransportResponse(url, response.status, await response.text())
+		except asyncio.TimeoutError as e:
+			raise requests.Timeout(e)
+		except aiohttp.ClientConnectorError as e:
+			raise ConnectError(e)
+		except aiohttp.ClientConnectionError as e:
+			raise requests.ConnectionError(e)
+
+	async def close(self):
+		if self._session is not None:
+			await self._session.close()
+			self._session = None
+
+	def _get_session(self):
+		if self._session is None:
+			try:
+				import aiohttp
+			except ImportError:
+				raise ImportError("AsyncHttpTransport requires aiohttp, install it with `pip install aiohttp`")
+
+			connector = aiohttp.TCPConnector(
+				limit=self._limit,
+				limit_per_host=self._limit_per_host,
+				keepalive_timeout=self._keepalive_timeout)
+			timeout = aiohttp.ClientTimeout(sock_connect=self._connect_timeout, sock_read=self._read_timeout)
+			self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+		return self._session
@@ -2,6 +2,8 @@ from future.utils import python_2_unicode_compatible
 
 
 class UserProfile(object):
+	__slots__ = ('_name', '_avatar', '_id', '_country', '_language', '_api_version')
+
 	def __init__(self, name=None, avatar=None, user_id=None, country=None, language=None, api_version=None):
 		self._name = name
 		self._avatar = avatar
@@ -20,14 +20,20 @@ EVENT_TYPE_TO_CLASS = {
 }
 
 
-def create_request(request_dict):
+def create_request(request_dict, lazy=False):
+	"""
+	:param lazy: Optional. If True, fields other than event_type and timestamp are built on first access
+	"""
 	if 'event' not in request_dict:
 		raise Exception("request is missing field 'event'")
 
 	if request_dict['event'] not in EVENT_TYPE_TO_CLASS:
 		raise Exception("event type '{0}' is not supported".format(request_dict['event']))
 
-	return EVENT_TYPE_TO_CLASS[request_dict['event']]().from_dict(request_dict)
+	request = EVENT_TYPE_TO_CLASS[request_dict['event']]()
+	if lazy:
+		return request.from_dict_lazy(request_dict)
+	return request.from_dict(request_dict)
 
 
 __all__ = [
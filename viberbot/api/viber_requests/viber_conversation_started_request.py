@@ -5,6 +5,8 @@ from viberbot.api.viber_requests.viber_request import ViberRequest
 
 
 class ViberConversationStartedRequest(ViberRequest):
+	__slots__ = ('_message_token', '_type', '_context', '_user', '_api_version', '_subscribed')
+
 	def __init__(self):
 		super(ViberConversationStartedRequest, self).__init__(EventType.CONVERSATION_STARTED)
 		self._message_token = None
@@ -29,30 +31,37 @@ class ViberConversationStartedRequest(ViberRequest):
 
 	@property
 	def user(self):
+		self._materialize()
 		return self._user
 
 	@property
 	def type(self):
+		self._materialize()
 		return self._type
 
 	@property
 	def context(self):
+		self._materialize()
 		return self._context
 
 	@property
 	def message_token(self):
+		self._materialize()
 		return self._message_token
 
 	@property
 	def api_version(self):
+		self._materialize()
 		return self._api_version
 
 	@property
 	def subscribed(self):
+		self._materialize()
 		return self._subscribed
 
 	@python_2_unicode_compatible
 	def __str__(self):
+		self._materialize()
 		return u"ViberConversationStartedRequest [{0}, message_token={1}, type={2}, context{3}, user={4} subscribed={5}]"\
 			.format(
 				super(ViberConversationStartedRequest, self).__str__(),
@@ -4,6 +4,8 @@ from viberbot.api.viber_requests.viber_request import ViberRequest
 
 
 class ViberDeliveredRequest(ViberRequest):
+	__slots__ = ('_message_token', '_user_id', '_chat_id')
+
 	def __init__(self):
 		super(ViberDeliveredRequest, self).__init__(EventType.DELIVERED)
 		self._message_token = None
@@ -19,18 +21,22 @@ class ViberDeliveredRequest(ViberRequest):
 
 	@property
 	def message_token(self):
+		self._materialize()
 		return self._message_token
 
 	@property
 	def user_id(self):
+		self._materialize()
 		return self._user_id
 
 	@property
 	def chat_id(self):
+		self._materialize()
 		return self._chat_id
 
 	@python_2_unicode_compatible
 	def __str__(self):
+		self._materialize()
 		return u"ViberDeliveredRequest [{0}, message_token={1}, user_id={2}]" \
 			.format(
 				super(ViberDeliveredRequest, self).__str__(),
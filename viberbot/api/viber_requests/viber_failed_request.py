@@ -5,6 +5,8 @@ from viberbot.api.viber_requests.viber_request import ViberRequest
 
 
 class ViberFailedRequest(ViberRequest):
+	__slots__ = ('_message_token', '_user_id', '_desc')
+
 	def __init__(self):
 		super(ViberFailedRequest, self).__init__(EventType.FAILED)
 		self._message_token = None
@@ -20,23 +22,28 @@ class ViberFailedRequest(ViberRequest):
 
 	@property
 	def meesage_token(self):
+		self._materialize()
 		warnings.warn('Property `meesage_token` had typo and now is deprecated, please use `message_token` instead')
 		return self._message_token
 
 	@property
 	def message_token(self):
+		self._materialize()
 		return self._message_token
 
 	@property
 	def user_id(self):
+		self._materialize()
 		return self._user_id
 
 	@property
 	def desc(self):
+		self._materialize()
 		return self._desc
 
 	@python_2_unicode_compatible
 	def __str__(self):
+		self._materialize()
 		return u"ViberFailedRequest [{0}, message_token={1}, user_id={2}, desc={3}]" \
 			.format(
 				super(ViberFailedRequest, self).__str__(),
@@ -6,6 +6,8 @@ from viberbot.api.viber_requests.viber_request import ViberRequest
 
 
 class ViberMessageRequest(ViberRequest):
+	__slots__ = ('_message', '_sender', '_message_token', '_chat_id', '_reply_type', '_silent')
+
 	def __init__(self):
 		super(ViberMessageRequest, self).__init__(EventType.MESSAGE)
 		self._message = None
@@ -27,30 +29,37 @@ class ViberMessageRequest(ViberRequest):
 
 	@property
 	def message(self):
+		self._materialize()
 		return self._message
 
 	@property
 	def sender(self):
+		self._materialize()
 		return self._sender
 
 	@property
 	def message_token(self):
+		self._materialize()
 		return self._message_token
 
 	@property
 	def chat_id(self):
+		self._materialize()
 		return self._chat_id
 
 	@property
 	def reply_type(self):
+		self._materialize()
 		return self._reply_type
 
 	@property
 	def silent(self):
+		self._materialize()
 		return self._silent
 
 	@python_2_unicode_compatible
 	def __str__(self):
+		self._materialize()
 		return u"ViberMessageRequest [{0}, message_token={1}, sender={2}, " \
 			u"message={3}, chat_id={4}, reply_type={5}, silent={6}]" \
 			.format(
@@ -2,9 +2,12 @@ from future.utils import python_2_unicode_compatible
 
 
 class ViberRequest(object):
+	__slots__ = ('_event_type', '_timestamp', '_request_dict')
+
 	def __init__(self, event_type=None):
 		self._event_type = event_type
 		self._timestamp = None
+		self._request_dict = None
 
 	def from_dict(self, request_dict):
 		self._timestamp = request_dict['timestamp']
@@ -12,6 +15,27 @@ class ViberRequest(object):
 			self._event_type = request_dict['event']
 		return self
 
+	def from_dict_lazy(self, request_dict):
+		"""
+		Like from_dict, but only reads event and timestamp now. The other fields, including
+		the sender and the message objects, are built from request_dict on first access.
+		"""
+		ViberRequest.from_dict(self, request_dict)
+		self._request_dict = request_dict
+		return self
+
+	def _materialize(self):
+		if self._request_dict is not None:
+			request_dict = self._request_dict
+			# cleared first, since from_dict may read the fields through their properties
+			self._request_dict = None
+			try:
+				self.from_dict(request_dict)
+			except Exception:
+				# every later access fails the same way instead of returning defaults
+				self._request_dict = request_dict
+				raise
+
 	@property
 	def event_type(self):
 		return self._event_type
@@ -5,6 +5,8 @@ from viberbot.api.viber_requests.viber_request import ViberRequest
 
 
 class ViberSeenRequest(ViberRequest):
+    __slots__ = ("_message_token", "_user_id")
+
     def __init__(self):
         super(ViberSeenRequest, self).__init__(EventType.SEEN)
         self._message_token = None
@@ -18,6 +20,7 @@ class ViberSeenRequest(ViberRequest):
 
     @property
     def message_token(self):
+        self._materialize()
         warnings.warn(
             "Property `message_token` had typo and now is deprecated, please use `message_token` instead"
         )
@@ -25,14 +28,17 @@ class ViberSeenRequest(ViberRequest):
 
     @property
     def message_token(self):
+        self._materialize()
         return self._message_token
 
     @property
     def user_id(self):
+        self._materialize()
         return self._user_id
 
     @python_2_unicode_compatible
     def __str__(self):
+        self._materialize()
         return "ViberSeenRequest [{0}, message_token={1}, user_id={2}]".format(
             super(ViberSeenRequest, self).__str__(), self._message_token, self._user_id
         )
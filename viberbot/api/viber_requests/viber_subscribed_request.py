@@ -5,6 +5,8 @@ from viberbot.api.viber_requests.viber_request import ViberRequest
 
 
 class ViberSubscribedRequest(ViberRequest):
+	__slots__ = ('_user', '_api_version')
+
 	def __init__(self):
 		super(ViberSubscribedRequest, self).__init__(EventType.SUBSCRIBED)
 		self._user = None
@@ -19,13 +21,16 @@ class ViberSubscribedRequest(ViberRequest):
 
 	@property
 	def user(self):
+		self._materialize()
 		return self._user
 
 	@property
 	def api_version(self):
+		self._materialize()
 		return self._api_version
 
 	@python_2_unicode_compatible
 	def __str__(self):
+		self._materialize()
 		return u"ViberSubscribedRequest [{0}, user={1}]" \
 			.format(super(ViberSubscribedRequest, self).__str__(), self._user)
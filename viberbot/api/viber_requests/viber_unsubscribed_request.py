@@ -4,6 +4,8 @@ from viberbot.api.viber_requests.viber_request import ViberRequest
 
 
 class ViberUnsubscribedRequest(ViberRequest):
+	__slots__ = ('_user_id',)
+
 	def __init__(self):
 		super(ViberUnsubscribedRequest, self).__init__(EventType.UNSUBSCRIBED)
 		self._user_id = None
@@ -15,9 +17,11 @@ class ViberUnsubscribedRequest(ViberRequest):
 
 	@property
 	def user_id(self):
+		self._materialize()
 		return self._user_id
 
 	@python_2_unicode_compatible
 	def __str__(self):
+		self._materialize()
 		return u"ViberUnsubscribedRequest [{0}, user_id={1}]" \
 			.format(super(ViberUnsubscribedRequest, self).__str__(), self._user_id)